@@ -54,6 +54,12 @@ setup(
     keywords='rfid llrpyc reader',
     packages=['sllurp'],
     install_requires=['twisted'],
+    extras_require={
+        # sllurp.llrp_asyncio on Python 2
+        'asyncio': ['trollius; python_version < "3"'],
+        # vectorized sllurp.epc.sgtin_96.parse_sgtin_96_batch
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'inventory=sllurp.inventory:main',
@@ -1,3 +1,4 @@
-__all__ = ('llrp', 'llrp_decoder', 'llrp_errors', 'llrp_proto', 'util',
-           'inventory')
+__all__ = ('aggregator', 'capture', 'dispatch', 'llrp', 'llrp_decoder',
+           'llrp_errors', 'llrp_framer', 'llrp_proto', 'metrics', 'supervisor',
+           'util', 'inventory')
 __version__ = '0.0.1'
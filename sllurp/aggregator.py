@@ -0,0 +1,263 @@
+"""Deduplicate tag sightings from many tag reports.
+
+A reader that reports every tag as soon as it sees it (report_every_n_tags=1)
+sends the same EPC over and over.  TagAggregator merges those sightings per
+(EPC, antenna) and hands out compact snapshots instead: periodically, when a
+ROSpec ends, or whenever flush() is called.
+
+    agg = TagAggregator(onSnapshot=handle_tags, interval=5)
+    agg.attach(factory)
+    agg.start()
+
+Each snapshot is a list of dicts, one per (EPC, antenna) seen since the last
+snapshot:
+
+    EPC                 hex EPC
+    AntennaID           antenna that saw the tag (None if not reported)
+    Reader              host of the reader that last saw the tag
+    TagSeenCount        total TagSeenCount (1 per sighting if not reported)
+    Sightings           number of TagReportData entries merged
+    FirstSeen/LastSeen  reader timestamps (microseconds) if reported,
+                        otherwise local time in microseconds
+    PeakRSSIMin/Max/Mean
+                        over the sightings that carried PeakRSSI (None if
+                        none did)
+
+Statistics accumulate from the first sighting until the tag is evicted:
+either because it has not been seen for ttl seconds or because max_tags
+other tags have been seen more recently.  An evicted tag that was seen since
+the last snapshot is still reported, in the next snapshot or, once max_tags
+such tags have piled up, in a snapshot of their own.  So memory stays
+bounded by max_tags whether or not snapshots are taken.
+"""
+
+from collections import OrderedDict
+from binascii import hexlify
+import logging
+
+from twisted.internet import reactor, task
+
+from llrp import LLRPClient
+from llrp_proto import TagReportBatch
+
+logger = logging.getLogger(__name__)
+
+
+class TagStats(object):
+    __slots__ = ('epc', 'antenna', 'reader', 'count', 'sightings',
+                 'first_seen', 'last_seen', 'rssi_min', 'rssi_max',
+                 'rssi_sum', 'rssi_n', 'touched')
+
+    def __init__(self, epc, antenna):
+        self.epc = epc
+        self.antenna = antenna
+        self.reader = None
+        self.count = 0
+        self.sightings = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.rssi_min = None
+        self.rssi_max = None
+        self.rssi_sum = 0
+        self.rssi_n = 0
+        self.touched = None  # local time of the last sighting, for the TTL
+
+    def asdict(self):
+        return {
+            'EPC': self.epc,
+            'AntennaID': self.antenna,
+            'Reader': self.reader,
+            'TagSeenCount': self.count,
+            'Sightings': self.sightings,
+            'FirstSeen': self.first_seen,
+            'LastSeen': self.last_seen,
+            'PeakRSSIMin': self.rssi_min,
+            'PeakRSSIMax': self.rssi_max,
+            'PeakRSSIMean': (float(self.rssi_sum) / self.rssi_n
+                             if self.rssi_n else None),
+        }
+
+
+class TagAggregator(object):
+    def __init__(self, onSnapshot=None, interval=None, max_tags=100000,
+                 ttl=None, clock=reactor):
+        """onSnapshot is called with every non-empty snapshot.  With
+        interval (seconds), start() flushes a snapshot that often.  At most
+        max_tags (EPC, antenna) pairs are remembered; with ttl (seconds),
+        pairs not seen for that long are forgotten."""
+        self.onSnapshot = onSnapshot
+        self.interval = interval
+        self.max_tags = max_tags
+        self.ttl = ttl
+        self.clock = clock
+
+        # (EPC, antenna) -> TagStats, least recently seen first
+        self._tags = OrderedDict()
+        # (EPC, antenna) -> TagStats seen since the last flush
+        self._dirty = {}
+        # TagStats seen since the last flush but evicted since
+        self._evicted = []
+        self._loop = None
+        self._next_expiry = None  # when _add() next looks for expired tags
+
+        self.reports = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._tags)
+
+    def attach(self, factory):
+        """Feed the tag reports of factory (an LLRPClientFactory or
+        LLRPSupervisor) into the aggregator, flushing when a ROSpec ends."""
+        factory.addTagReportCallback(self.tagReportCallback)
+        factory.addMessageCallback('READER_EVENT_NOTIFICATION',
+                                   self.readerEventCallback)
+        addStateCallback = getattr(factory, 'addStateCallback', None)
+        if addStateCallback:
+            # the client stops reading reports once it pauses or stops
+            addStateCallback(LLRPClient.STATE_PAUSED, self.flush)
+            addStateCallback(LLRPClient.STATE_SENT_DELETE_ROSPEC, self.flush)
+
+    def start(self):
+        if self.interval and self._loop is None:
+            self._loop = task.LoopingCall(self.flush)
+            self._loop.clock = self.clock
+            self._loop.start(self.interval, now=False)
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.stop()
+            self._loop = None
+
+    def tagReportCallback(self, lmsg):
+        tags = lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData']
+        reader = lmsg.peername[0] if lmsg.peername else None
+        self.reports += 1
+        if isinstance(tags, TagReportBatch):
+            self.addBatch(tags, reader)
+        else:
+            for tag in tags:
+                self.addTag(tag, reader)
+
+    def readerEventCallback(self, lmsg):
+        data = lmsg.msgdict['READER_EVENT_NOTIFICATION']\
+            ['ReaderEventNotificationData']
+        event = data.get('ROSpecEvent')
+        if event and event['EventType'] in ('End_of_ROSpec',
+                                            'Preemption_of_ROSpec'):
+            self.flush()
+
+    def addTag(self, tag, reader=None):
+        """Merge one TagReportData dict."""
+        if 'EPC-96' in tag:
+            epc = tag['EPC-96']
+        else:
+            epc = tag['EPCData']['EPC']
+        antenna = tag.get('AntennaID', (None,))[0]
+        count = tag.get('TagSeenCount', (1,))[0]
+        rssi = tag.get('PeakRSSI', (None,))[0]
+        first = (tag.get('FirstSeenTimestampUTC') or
+                 tag.get('FirstSeenTimestampUptime') or (None,))[0]
+        last = (tag.get('LastSeenTimestampUTC') or
+                tag.get('LastSeenTimestampUptime') or (None,))[0]
+        self._add(epc, antenna, count, rssi, first, last, reader,
+                  self.clock.seconds())
+
+    def addBatch(self, batch, reader=None):
+        """Merge every tag of a TagReportBatch, straight from its columns."""
+        now = self.clock.seconds()
+        bits = TagReportBatch.column_bits
+
+        def getter(default, *names):
+            # value of the first of names that tag i reported, or default
+            cols = [(bits[name], batch.column(name)) for name in names
+                    if batch.column(name) is not None]
+            return lambda i, have: next(
+                (col[i] for bit, col in cols if have & bit), default)
+
+        antenna = getter(None, 'AntennaID')
+        count = getter(1, 'TagSeenCount')
+        rssi = getter(None, 'PeakRSSI')
+        first = getter(None, 'FirstSeenTimestampUTC',
+                       'FirstSeenTimestampUptime')
+        last = getter(None, 'LastSeenTimestampUTC', 'LastSeenTimestampUptime')
+        for i, have in enumerate(batch.present):
+            self._add(hexlify(batch.epc(i)), antenna(i, have),
+                      count(i, have), rssi(i, have), first(i, have),
+                      last(i, have), reader, now)
+
+    def _add(self, epc, antenna, count, rssi, first, last, reader, now):
+        key = (epc, antenna)
+        if self.ttl and (self._next_expiry is None or
+                         now >= self._next_expiry):
+            self._next_expiry = now + 1
+            self.expire()
+        st = self._tags.pop(key, None)
+        if st is None:
+            st = TagStats(epc, antenna)
+            if len(self._tags) >= self.max_tags:
+                self._evict(*self._tags.popitem(last=False))
+        self._tags[key] = st
+
+        stamp = int(now * 1e6)
+        st.reader = reader
+        st.count += count
+        st.sightings += 1
+        if st.first_seen is None:
+            st.first_seen = first or last or stamp
+        st.last_seen = last or first or stamp
+        if rssi is not None:
+            if st.rssi_n:
+                st.rssi_min = min(st.rssi_min, rssi)
+                st.rssi_max = max(st.rssi_max, rssi)
+            else:
+                st.rssi_min = st.rssi_max = rssi
+            st.rssi_sum += rssi
+            st.rssi_n += 1
+        st.touched = now
+        self._dirty[key] = st
+
+    def _evict(self, key, st):
+        # a tag seen since the last flush is reported all the same
+        self.evictions += 1
+        logger.debug('evicting %s', key)
+        if self._dirty.pop(key, None) is None:
+            return
+        self._evicted.append(st)
+        if len(self._evicted) >= self.max_tags:
+            evicted, self._evicted = self._evicted, []
+            if self.onSnapshot:
+                self.onSnapshot([e.asdict() for e in evicted])
+
+    def expire(self):
+        """Forget tags not seen for ttl seconds."""
+        if not self.ttl:
+            return
+        horizon = self.clock.seconds() - self.ttl
+        while self._tags:
+            key, st = next(self._tags.iteritems())
+            if st.touched > horizon:
+                break
+            del self._tags[key]
+            self._evict(key, st)
+
+    def snapshot(self):
+        """Return the tags seen since the last snapshot and start a new
+        one, without calling onSnapshot."""
+        self.expire()
+        snap = [st.asdict() for st in self._evicted]
+        snap.extend(st.asdict() for st in self._dirty.itervalues())
+        self._dirty = {}
+        self._evicted = []
+        return snap
+
+    def flush(self, *args):
+        """Take a snapshot and pass it to onSnapshot if it is not empty.
+        Returns the snapshot, or, when used as a Deferred or state
+        callback, the result it was called with."""
+        snap = self.snapshot()
+        if snap and self.onSnapshot:
+            self.onSnapshot(snap)
+        if args:
+            return args[0]
+        return snap
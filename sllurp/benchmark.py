@@ -0,0 +1,342 @@
+"""Offline throughput benchmark for the LLRP codec and client.
+
+Replays RO_ACCESS_REPORT byte streams (synthetic, or captured from a reader)
+through LLRPClient.dataReceived() with a mock transport and reports
+messages/s, tags/s, time spent per phase (framing, decoding, dispatch to
+callbacks) and, where tracemalloc is available, memory allocated.
+
+Results can be saved as a JSON baseline and later compared against it:
+
+    python -m sllurp.benchmark --save baseline.json
+    python -m sllurp.benchmark --compare baseline.json
+"""
+
+from __future__ import print_function, division
+import argparse
+import json
+import logging
+import platform
+import random
+import struct
+import sys
+from timeit import default_timer as timer
+
+from sllurp import __version__, capture
+from sllurp.llrp import LLRPClientFactory, LLRPClient, LLRPMessage
+from sllurp.llrp_framer import LLRPFramer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+logger = logging.getLogger('sllurp')
+
+args = None
+
+DEFAULT_SIZES = (1, 10, 100, 1000, 10000)
+
+# what the synthetic reports carry; matches inventory.py's selector
+TAG_CONTENT_SELECTOR = {
+    'EnableROSpecID': False,
+    'EnableSpecIndex': False,
+    'EnableInventoryParameterSpecID': False,
+    'EnableAntennaID': True,
+    'EnableChannelIndex': False,
+    'EnablePeakRRSI': True,
+    'EnableFirstSeenTimestamp': False,
+    'EnableLastSeenTimestamp': True,
+    'EnableTagSeenCount': True,
+    'EnableAccessSpecID': False,
+}
+
+msg_header = struct.Struct('!HII')
+par_header = struct.Struct('!HH')
+
+# TagReportData holding EPC-96, AntennaID, PeakRSSI, LastSeenTimestampUTC and
+# TagSeenCount, in the order a reader sends them
+tag_report_data = struct.Struct('!HH' 'B12s' 'BH' 'Bb' 'BQ' 'BH')
+
+
+def make_tag_report(epc, antenna=1, rssi=-60, timestamp=0, count=1):
+    """Encode one TagReportData parameter."""
+    return tag_report_data.pack(240, tag_report_data.size,
+                                0x80 | 13, epc,
+                                0x80 | 1, antenna,
+                                0x80 | 6, rssi,
+                                0x80 | 4, timestamp,
+                                0x80 | 8, count)
+
+
+def make_ro_access_report(ntags, msgid=0, rng=random):
+    """Encode an RO_ACCESS_REPORT with ntags random tag sightings."""
+    body = ''.join(
+        make_tag_report(struct.pack('!QI', rng.getrandbits(64),
+                                    rng.getrandbits(32)),
+                        antenna=rng.randint(1, 4),
+                        rssi=rng.randint(-80, -30),
+                        timestamp=1500000000000000 + i,
+                        count=rng.randint(1, 5))
+        for i in xrange(ntags))
+    return msg_header.pack((1 << 10) | 61, msg_header.size + len(body),
+                           msgid) + body
+
+
+def make_stream(tags_per_report, total_tags, seed=0):
+    """Concatenate enough reports of tags_per_report tags each to carry (at
+    least) total_tags tags."""
+    rng = random.Random(seed)
+    nreports = max(1, total_tags // tags_per_report)
+    return ''.join(make_ro_access_report(tags_per_report, msgid=i, rng=rng)
+                   for i in xrange(nreports))
+
+
+def make_client(columnar=False, compiled=True):
+    """Return an LLRPClient ready to receive tag reports, writing to a
+    transport that discards everything, and a one-element list counting the
+    tags its report callback sees."""
+    tags = [0]
+
+    def count_tags(lmsg):
+        tags[0] += len(lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData'])
+
+    factory = LLRPClientFactory(start_inventory=False,
+                                columnar_reports=columnar,
+                                tag_content_selector=TAG_CONTENT_SELECTOR)
+    factory.addTagReportCallback(count_tags)
+    client = factory.buildProtocol(None)
+    client.transport = NullTransport()
+    if compiled:
+        client.reader_mode = {'ModeIdentifier': 2, 'MaxTari': 7250}
+        client.getROSpec()
+    client.state = LLRPClient.STATE_INVENTORYING
+    return client, tags
+
+
+class NullTransport(object):
+    def write(self, data):
+        pass
+
+    def loseConnection(self):
+        pass
+
+
+def chunks(stream, chunk_size):
+    for i in xrange(0, len(stream), chunk_size):
+        yield stream[i:i + chunk_size]
+
+
+def run_once(stream, chunk_size, columnar, compiled):
+    """Time each phase of handling stream once.  Returns a dict of seconds
+    per phase, plus message and tag counts."""
+    # framing: split the stream into messages
+    t0 = timer()
+    framer = LLRPFramer()
+    msgs = []
+    for chunk in chunks(stream, chunk_size):
+        msgs.extend(view.tobytes() for view in framer.feed(chunk))
+    framing = timer() - t0
+
+    # decoding: parse every message body
+    client, tags = make_client(columnar, compiled)
+    t0 = timer()
+    lmsgs = [LLRPMessage(msgbytes=m, decoders=client.decoders, lazy=True)
+             for m in msgs]
+    for lmsg in lmsgs:
+        lmsg.msgdict
+    decoding = timer() - t0
+
+    # dispatch: the state machine and the tag report callbacks
+    t0 = timer()
+    for lmsg in lmsgs:
+        client.handleMessage(lmsg)
+    dispatch = timer() - t0
+
+    # all of the above, the way a connected client does it
+    client, tags = make_client(columnar, compiled)
+    t0 = timer()
+    for chunk in chunks(stream, chunk_size):
+        client.dataReceived(chunk)
+    total = timer() - t0
+
+    return {
+        'messages': len(msgs),
+        'tags': tags[0],
+        'framing': framing,
+        'decoding': decoding,
+        'dispatch': dispatch,
+        'total': total,
+    }
+
+
+def measure_allocations(stream, chunk_size, columnar, compiled):
+    """Return (peak bytes, bytes still allocated) while a client handles
+    stream, or None if tracemalloc is not available."""
+    if tracemalloc is None:
+        return None
+    client, _ = make_client(columnar, compiled)
+    tracemalloc.start()
+    try:
+        for chunk in chunks(stream, chunk_size):
+            client.dataReceived(chunk)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, current
+
+
+def run_benchmark(stream, chunk_size=4096, repeat=3, columnar=False,
+                  compiled=True):
+    """Benchmark one byte stream; keeps the fastest of repeat runs."""
+    best = None
+    for _ in xrange(repeat):
+        run = run_once(stream, chunk_size, columnar, compiled)
+        if best is None or run['total'] < best['total']:
+            best = run
+    total = best['total'] or float('nan')
+    result = {
+        'bytes': len(stream),
+        'messages': best['messages'],
+        'tags': best['tags'],
+        'msgs_per_sec': best['messages'] / total,
+        'tags_per_sec': best['tags'] / total,
+        'phases': dict((phase, best[phase]) for phase in
+                       ('framing', 'decoding', 'dispatch', 'total')),
+    }
+    allocs = measure_allocations(stream, chunk_size, columnar, compiled)
+    if allocs is not None:
+        result['peak_bytes'], result['retained_bytes'] = allocs
+    return result
+
+
+def compare(results, baseline, threshold=0.2):
+    """Compare results against a baseline of the same shape.  Returns a list
+    of (name, metric, baseline value, current value) for every throughput
+    figure that dropped by more than threshold (a fraction)."""
+    regressions = []
+    for name, res in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ('msgs_per_sec', 'tags_per_sec'):
+            if res[metric] < base[metric] * (1 - threshold):
+                regressions.append((name, metric, base[metric], res[metric]))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print('{:>12} {:>8} {:>8} {:>12} {:>12} {:>9} {:>9} {:>9} {:>9}'.format(
+        'workload', 'msgs', 'tags', 'msgs/s', 'tags/s', 'frame ms',
+        'decode ms', 'disp ms', 'vs base'))
+    for name, res in sorted(results.items(), key=sort_key):
+        ph = res['phases']
+        vs = ''
+        if baseline and name in baseline:
+            vs = '{:+.1%}'.format(res['tags_per_sec'] /
+                                  baseline[name]['tags_per_sec'] - 1)
+        print('{:>12} {:>8} {:>8} {:>12.0f} {:>12.0f} {:>9.2f} {:>9.2f}'
+              ' {:>9.2f} {:>9}'.format(
+                  name, res['messages'], res['tags'], res['msgs_per_sec'],
+                  res['tags_per_sec'], ph['framing'] * 1e3,
+                  ph['decoding'] * 1e3, ph['dispatch'] * 1e3, vs))
+        if 'peak_bytes' in res:
+            print('{:>12} peak {} bytes, {} bytes retained'.format(
+                '', res['peak_bytes'], res['retained_bytes']))
+
+
+def sort_key(item):
+    name = item[0]
+    return (not name.isdigit(), int(name) if name.isdigit() else name)
+
+
+def read_capture(path):
+    """Raw bytes from path, or, from a sllurp.capture file, the
+    RO_ACCESS_REPORTs the client received."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(capture.MAGIC):
+        return data
+    with capture.CaptureReader(path) as reader:
+        return ''.join(rec.data for rec in
+                       reader.records(msg_types=['RO_ACCESS_REPORT']))
+
+
+def parse_args(argv=None):
+    global args
+    parser = argparse.ArgumentParser(
+        description='Benchmark LLRP decoding and tag report dispatch')
+    parser.add_argument('capture', nargs='*',
+                        help='file(s) of raw LLRP bytes captured from a'
+                        ' reader, or sllurp.capture files, replayed in'
+                        ' addition to synthetic reports')
+    parser.add_argument('-s', '--sizes',
+                        default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma-separated tags per synthetic report'
+                        ' (default %(default)s; empty for none)')
+    parser.add_argument('-t', '--tags', type=int, default=20000,
+                        help='tags per synthetic workload (default'
+                        ' %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs per workload; the fastest counts'
+                        ' (default %(default)s)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=4096,
+                        help='bytes per dataReceived() call (default'
+                        ' %(default)s)')
+    parser.add_argument('--columnar', action='store_true',
+                        help='decode into TagReportBatches')
+    parser.add_argument('--generic', action='store_true',
+                        help="don't compile a TagReportData decoder")
+    parser.add_argument('--save', metavar='FILE',
+                        help='save results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare against a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='throughput drop (fraction) that counts as a'
+                        ' regression (default %(default)s)')
+    args = parser.parse_args(argv)
+
+
+def main(argv=None):
+    parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.WARNING)
+
+    workloads = []
+    for size in (int(s) for s in args.sizes.split(',') if s.strip()):
+        workloads.append((str(size), make_stream(size, args.tags)))
+    for path in args.capture:
+        workloads.append((path, read_capture(path)))
+
+    results = {}
+    for name, stream in workloads:
+        results[name] = run_benchmark(stream, chunk_size=args.chunk_size,
+                                      repeat=args.repeat,
+                                      columnar=args.columnar,
+                                      compiled=not args.generic)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'sllurp': __version__,
+                       'python': platform.python_version(),
+                       'columnar': args.columnar,
+                       'compiled': not args.generic,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, base, cur in regressions:
+            print('REGRESSION: {} {} {:.0f} -> {:.0f}'.format(
+                name, metric, base, cur))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,444 @@
+"""Record the LLRP traffic of reader sessions and play it back.
+
+A CaptureWriter appends every framed message a client sends or receives to
+a capture file, together with the time it was received or sent:
+
+    capture = CaptureWriter('dock4.llrpcap')
+    factory = LLRPClientFactory(capture=capture, ...)
+    ...
+    capture.close()
+
+A capture file is an 8-byte magic string followed by records, each a
+15-byte header (time as a double, direction, reader number, payload length)
+and the payload: the LLRP message exactly as it went over the wire, or, for
+a PEER record, the name of the reader that later records with that reader
+number belong to.  The index file next to it (the same name plus .idx)
+holds one fixed-size entry per record (time, file offset, direction, reader
+number, LLRP message type), so that a CaptureReader can find records by
+time or message type without reading the capture itself.  Both files are
+only ever appended to; if the index lags behind the capture (say, after a
+crash), CaptureReader indexes the rest of the capture when it opens it.
+
+CaptureReader memory-maps the capture, and CaptureReplay feeds the
+messages an LLRPClient received back into it (at their original pace, or
+as fast as possible), so that callbacks, the decoder and the state machine
+see them just as they did live.
+
+    python -m sllurp.capture dock4.llrpcap
+
+lists the messages in a capture.
+"""
+
+from __future__ import print_function
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+
+from twisted.internet import defer, reactor
+
+from sllurp.llrp import LLRPMessage
+from sllurp.llrp_errors import LLRPError
+from sllurp.llrp_framer import msg_header
+from sllurp.llrp_proto import TLV_struct, TLV_Type2Name
+from sllurp.util import BITMASK
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 'LLRPCAP\x01'
+INDEX_MAGIC = 'LLRPIDX\x01'
+
+# record directions
+RECEIVED = 0
+SENT = 1
+PEER = 2
+DIRECTION_NAMES = {RECEIVED: 'received', SENT: 'sent', PEER: 'peer'}
+
+# time, direction, reader number, payload length
+record_header = struct.Struct('!dBHI')
+# time, offset of the record header in the capture, direction, reader
+# number, LLRP message type (0 for PEER records)
+index_entry = struct.Struct('!dQBHH')
+
+Record = namedtuple('Record', 'timestamp direction peername data')
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def message_types(names):
+    """LLRP message type numbers of the message names."""
+    try:
+        return frozenset(TLV_struct[name]['type'] for name in names)
+    except KeyError as err:
+        raise LLRPError('unknown message type {}'.format(err))
+
+
+class CaptureWriter(object):
+    def __init__(self, path):
+        """Append to the capture at path, creating it if need be."""
+        self.path = path
+        # reader name -> reader number
+        self.peers = {}
+        if os.path.exists(path) and os.path.getsize(path):
+            with CaptureReader(path) as existing:
+                for num, name in existing.peers.items():
+                    self.peers[name] = num
+                end, indexed = existing.end, existing.indexed
+                missing = existing.unindexed()
+            # drop what a crash may have left half-written, and index what
+            # the index is missing, so that both files end at the same
+            # record
+            self._data = open(path, 'r+b')
+            self._data.truncate(end)
+            self._data.seek(end)
+            if os.path.exists(index_path(path)):
+                self._index = open(index_path(path), 'r+b')
+                self._index.truncate(len(INDEX_MAGIC) +
+                                     indexed * index_entry.size)
+                self._index.seek(0, os.SEEK_END)
+            else:
+                self._index = open(index_path(path), 'wb')
+                self._index.write(INDEX_MAGIC)
+            self._index.write(''.join(missing))
+        else:
+            self._data = open(path, 'wb')
+            self._data.write(MAGIC)
+            self._index = open(index_path(path), 'wb')
+            self._index.write(INDEX_MAGIC)
+        self._offset = self._data.tell()
+
+        self.records = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, msgbytes, peername=None, timestamp=None, sent=False):
+        """Append one LLRP message (a string or a memoryview of it) that was
+        received from (or, with sent=True, sent to) peername at timestamp
+        (seconds since the epoch; now by default)."""
+        if timestamp is None:
+            timestamp = time.time()
+        if peername is not None:
+            name = '{}:{}'.format(*peername)
+        else:
+            name = ''
+        peer = self.peers.get(name)
+        if peer is None:
+            peer = self.peers[name] = len(self.peers)
+            self._append(timestamp, PEER, peer, 0, name)
+        msgtype = msg_header.unpack_from(msgbytes)[0] & BITMASK(10)
+        self._append(timestamp, SENT if sent else RECEIVED, peer, msgtype,
+                     msgbytes)
+        self.records += 1
+        self.bytes += len(msgbytes)
+
+    def _append(self, timestamp, direction, peer, msgtype, payload):
+        self._data.write(record_header.pack(timestamp, direction, peer,
+                                            len(payload)))
+        self._data.write(payload)
+        self._index.write(index_entry.pack(timestamp, self._offset,
+                                           direction, peer, msgtype))
+        self._offset += record_header.size + len(payload)
+
+    def flush(self):
+        # the capture first: the index must never point past its end
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        if self._data.closed:
+            return
+        self.flush()
+        self._data.close()
+        self._index.close()
+
+
+class CaptureReader(object):
+    def __init__(self, path):
+        """Open the capture at path (and its index) for reading."""
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise LLRPError('{} is not a capture file'.format(path))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # the index, one column per field
+        self.times = array('d')
+        self.offsets = []
+        self.directions = array('B')
+        self.peer_numbers = array('H')
+        self.types = array('H')
+        self.indexed = 0  # entries read from the index file
+        self.end = len(MAGIC)  # end of the last complete record
+        self._unindexed = []
+        self._readIndex()
+
+        # reader number -> reader name
+        self.peers = {}
+        for i in xrange(len(self.times)):
+            if self.directions[i] == PEER:
+                self.peers[self.peer_numbers[i]] = self._payload(
+                    self.offsets[i])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.times)
+
+    def close(self):
+        self._map.close()
+
+    def _readIndex(self):
+        size = len(self._map)
+        end = self.end
+        try:
+            with open(index_path(self.path), 'rb') as f:
+                if f.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                    raise LLRPError('{} is not a capture index'.format(
+                        index_path(self.path)))
+                entries = f.read()
+        except IOError:
+            logger.warn('no index for %s; indexing it', self.path)
+            entries = ''
+        for pos in xrange(0, len(entries) - index_entry.size + 1,
+                          index_entry.size):
+            entry = index_entry.unpack_from(entries, pos)
+            offset = entry[1]
+            if offset + record_header.size > size:
+                break
+            length = record_header.unpack_from(self._map, offset)[3]
+            if offset + record_header.size + length > size:
+                break
+            self._addEntry(*entry)
+            self.indexed += 1
+            end = offset + record_header.size + length
+
+        # records the index does not know about yet
+        while end + record_header.size <= size:
+            timestamp, direction, peer, length = \
+                record_header.unpack_from(self._map, end)
+            if end + record_header.size + length > size:
+                break
+            if direction == PEER:
+                msgtype = 0
+            else:
+                msgtype = msg_header.unpack_from(
+                    self._map, end + record_header.size)[0] & BITMASK(10)
+            entry = (timestamp, end, direction, peer, msgtype)
+            self._addEntry(*entry)
+            self._unindexed.append(index_entry.pack(*entry))
+            end += record_header.size + length
+        self.end = end
+        if end != size:
+            logger.warn('ignoring %d bytes of incomplete record at the end '
+                        'of %s', size - end, self.path)
+
+    def _addEntry(self, timestamp, offset, direction, peer, msgtype):
+        self.times.append(timestamp)
+        self.offsets.append(offset)
+        self.directions.append(direction)
+        self.peer_numbers.append(peer)
+        self.types.append(msgtype)
+
+    def unindexed(self):
+        """Index entries for the records the index file is missing."""
+        return self._unindexed
+
+    def _payload(self, offset):
+        length = record_header.unpack_from(self._map, offset)[3]
+        start = offset + record_header.size
+        return self._map[start:start + length]
+
+    def find(self, timestamp):
+        """Position of the first record at or after timestamp."""
+        return bisect_left(self.times, timestamp)
+
+    def record(self, i):
+        peer = self.peers.get(self.peer_numbers[i])
+        if peer:
+            host, _, port = peer.rpartition(':')
+            peer = (host, int(port))
+        return Record(self.times[i], self.directions[i], peer or None,
+                      self._payload(self.offsets[i]))
+
+    def records(self, start=None, end=None, msg_types=None,
+                directions=(RECEIVED,), host=None):
+        """Iterate over the records from time start up to (not including)
+        time end, of the given message names and directions, and of the
+        reader host if given.  Only the index is read to find them."""
+        first = 0 if start is None else self.find(start)
+        last = len(self) if end is None else self.find(end)
+        types = None if msg_types is None else message_types(msg_types)
+        peers = None
+        if host is not None:
+            peers = frozenset(num for num, name in self.peers.items()
+                              if name.rpartition(':')[0] == host)
+        for i in xrange(first, last):
+            if self.directions[i] not in directions:
+                continue
+            if types is not None and self.types[i] not in types:
+                continue
+            if peers is not None and self.peer_numbers[i] not in peers:
+                continue
+            yield self.record(i)
+
+    def messages(self, **kwargs):
+        """Like records, but yields the records as LLRPMessages, decoded
+        lazily, with peername set."""
+        for rec in self.records(**kwargs):
+            lmsg = LLRPMessage(msgbytes=rec.data, lazy=True)
+            lmsg.peername = rec.peername
+            yield lmsg
+
+    def stats(self):
+        """Number of messages of each type, by direction name."""
+        counts = {}
+        for direction, msgtype in zip(self.directions, self.types):
+            if direction == PEER:
+                continue
+            name = TLV_Type2Name.get(msgtype, msgtype)
+            by_type = counts.setdefault(DIRECTION_NAMES[direction], {})
+            by_type[name] = by_type.get(name, 0) + 1
+        return counts
+
+
+class ReplayTransport(object):
+    """Stands in for a reader connection during a replay; whatever the
+    client sends is dropped."""
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def loseConnection(self):
+        pass
+
+    def pauseProducing(self):
+        pass
+
+    def resumeProducing(self):
+        pass
+
+
+class CaptureReplay(object):
+    # records fed in one go at full speed before yielding to the reactor
+    batch = 1000
+
+    def __init__(self, capture, client, speed=None, clock=reactor,
+                 **filters):
+        """Feed the messages in capture (a CaptureReader) that client (an
+        LLRPClient) received back into it.  With speed, keep the original
+        pace (speed=2 plays twice as fast); without, replay as fast as
+        possible.  filters are passed on to capture.records; pass host if
+        the capture holds more than one reader's traffic."""
+        self.capture = capture
+        self.client = client
+        self.speed = speed
+        self.clock = clock
+        self.filters = filters
+        self.replayed = 0
+        self._records = None
+        self._timer = None
+        self._done = None
+
+    def start(self):
+        """Returns a Deferred that fires with the number of messages
+        replayed once all of them have been."""
+        if self.client.transport is None:
+            self.client.transport = ReplayTransport()
+        self._records = self.capture.records(**self.filters)
+        self._done = defer.Deferred()
+        self._first = self._began = None
+        self._next = next(self._records, None)
+        self._feed()
+        return self._done
+
+    def stop(self):
+        if self._timer is not None and self._timer.active():
+            self._timer.cancel()
+        self._finish()
+
+    def _feed(self):
+        self._timer = None
+        fed = 0
+        now = self.clock.seconds()
+        while self._next is not None:
+            rec = self._next
+            if self.speed:
+                if self._first is None:
+                    self._first, self._began = rec.timestamp, now
+                due = self._began + (rec.timestamp - self._first) / self.speed
+                if due > now:
+                    self._timer = self.clock.callLater(due - now, self._feed)
+                    return
+            elif fed >= self.batch:
+                self._timer = self.clock.callLater(0, self._feed)
+                return
+            if self.client.peername is None:
+                self.client.peername = rec.peername
+            self.client.dataReceived(rec.data)
+            self.replayed += 1
+            fed += 1
+            self._next = next(self._records, None)
+        self._finish()
+
+    def _finish(self):
+        if self._done is not None and not self._done.called:
+            self._done.callback(self.replayed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='List the messages in an LLRP capture')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('-s', '--start', type=float,
+                        help='skip messages before this time (seconds '
+                        'since the epoch)')
+    parser.add_argument('-e', '--end', type=float,
+                        help='stop at this time (seconds since the epoch)')
+    parser.add_argument('-t', '--type', action='append', dest='types',
+                        help='only messages of this type (may be repeated)')
+    parser.add_argument('-H', '--host',
+                        help='only messages to or from this reader')
+    parser.add_argument('-a', '--all', action='store_true',
+                        help='include messages the client sent')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='decode the messages')
+    args = parser.parse_args(argv)
+
+    directions = (RECEIVED, SENT) if args.all else (RECEIVED,)
+    with CaptureReader(args.capture) as capture:
+        for rec in capture.records(start=args.start, end=args.end,
+                                   msg_types=args.types,
+                                   directions=directions, host=args.host):
+            msgtype = msg_header.unpack_from(rec.data)[0] & BITMASK(10)
+            print('{:.6f} {} {} {} ({} bytes)'.format(
+                rec.timestamp, DIRECTION_NAMES[rec.direction],
+                rec.peername and rec.peername[0],
+                TLV_Type2Name.get(msgtype, msgtype), len(rec.data)))
+            if args.verbose:
+                try:
+                    print(LLRPMessage(msgbytes=rec.data))
+                except LLRPError as err:
+                    print('cannot decode: {}'.format(err))
+
+
+if __name__ == '__main__':
+    main()
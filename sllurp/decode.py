@@ -1,19 +1,564 @@
-import binascii
+"""Decode LLRP messages, one given in hexadecimal or many at a time.
+
+    python -m sllurp.decode 0403000000...
+
+prints one message.  With --input, every message in a file (or stdin, as
+-) is decoded: a stream of raw LLRP bytes, lines of hexadecimal, a pcap of
+reader traffic or a sllurp.capture file.  The input is read a chunk or a
+packet at a time and split into messages by an LLRPFramer, so inputs of any
+size can be decoded in constant memory.  Messages go out as XML, as JSON
+lines or as one tab-separated row per tag; with --jobs, decoding and
+rendering are spread over a pool of processes.  When all is done, counts of
+messages by type, tags and errors go to stderr:
+
+    python -m sllurp.decode -i dock4.pcap -j 4 -o columns > tags.tsv
+
+In a pcap, TCP segments to or from the LLRP port are put back together per
+connection.  Where segments are missing (or the capture starts in the
+middle of a connection), that direction of the connection is skipped until
+a segment starts with what looks like an LLRP message header.
+
+Tag reports are decoded by a TagReportDataDecoder compiled for the
+TagReportContentSelector of the last ADD_ROSPEC in the input, or before
+there is one, for the fields named by --selector.  Tags that do not match
+it fall back to the generic decoder, so the output is the same either way.
+"""
+
+from __future__ import print_function, division
+from collections import Counter, deque
+from functools import partial
 import argparse
+import binascii
 import logging
-from sllurp.llrp import LLRPMessage
+import multiprocessing
+import struct
+import sys
+from cStringIO import StringIO
+from timeit import default_timer as timer
+
+from sllurp import capture
+from sllurp.llrp import LLRPMessage, LLRP_PORT
+from sllurp.llrp_errors import LLRPError
+from sllurp.llrp_framer import LLRPFramer, msg_header, msg_header_len, \
+    parameters
+from sllurp.llrp_proto import TagReportBatch, TagReportDataDecoder, \
+    TLV_Type2Name, TLV_struct, decode_ROAccessReport, \
+    decode_ROAccessReport_columnar
+from sllurp.util import BITMASK
 
 logger = logging.getLogger('sllurp')
 
 args = None
 
+OUTPUTS = ('xml', 'json', 'columns', 'none')
+FORMATS = ('auto', 'raw', 'hex', 'pcap', 'capture')
+
+# pcap file header magic (microsecond and nanosecond timestamps)
+PCAP_MAGICS = ('\xa1\xb2\xc3\xd4', '\xa1\xb2\x3c\x4d')
+PCAPNG_MAGIC = '\x0a\x0d\x0d\x0a'
+
+# pcap link types understood by _link_header()
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (12, 101, 228, 229)
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = (0x8100, 0x88a8)
+IPPROTO_TCP = 6
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_FIN = 0x01
+
+ushort = struct.Struct('!H')
+ipv4_header = struct.Struct('!BBHHHBBH4s4s')
+ipv6_header = struct.Struct('!IHBB16s16s')
+tcp_header = struct.Struct('!HHIIBB')
+
+# no sane LLRP message is larger; used to spot message headers after a gap
+MAX_MESSAGE_LEN = 16 * 1024 * 1024
+
+# tab-separated output: message ID, EPC, then TagReportBatch's columns
+COLUMNS = ['ID', 'EPC'] + [name for name, _ in TagReportBatch.column_types]
+
+# TagReportContentSelector flags --selector accepts
+SELECTOR_FLAGS = [flag for flag, _, _ in TagReportDataDecoder.selector_layout]
+
+
+class DecodeStats(object):
+    """Counts of what was decoded.  Worker processes keep their own and the
+    parent merges them."""
+
+    def __init__(self):
+        self.messages = Counter()  # message name -> count
+        self.errors = Counter()  # reason -> count
+        self.tags = 0
+        self.bytes = 0
+
+    def merge(self, other):
+        self.messages.update(other.messages)
+        self.errors.update(other.errors)
+        self.tags += other.tags
+        self.bytes += other.bytes
+
+    def error(self, reason):
+        self.errors[reason] += 1
+
+    def report(self, seconds, fp):
+        total = sum(self.messages.values())
+        print('{} messages ({} bytes) in {:.2f} s: {:.0f} messages/s, {} tags'
+              .format(total, self.bytes, seconds,
+                      total / seconds if seconds else 0, self.tags), file=fp)
+        for name, count in sorted(self.messages.items()):
+            print('  {:<40} {:>10}'.format(name, count), file=fp)
+        if self.errors:
+            print('{} errors'.format(sum(self.errors.values())), file=fp)
+            for reason, count in sorted(self.errors.items()):
+                print('  {:<40} {:>10}'.format(reason, count), file=fp)
+
+
+def message_name(msgbytes):
+    """The name of the message type in the header of msgbytes, or None."""
+    msgtype = msg_header.unpack_from(msgbytes)[0] & BITMASK(10)
+    return TLV_Type2Name.get(msgtype)
+
+
+def looks_like_header(data, offset=0):
+    """Whether data[offset:] could start an LLRP message."""
+    if len(data) - offset < msg_header_len:
+        return False
+    msgtype, length, _ = msg_header.unpack_from(data, offset)
+    return ((msgtype >> 10) & BITMASK(3) in (1, 2) and
+            msgtype & BITMASK(10) in TLV_Type2Name and
+            msg_header_len <= length <= MAX_MESSAGE_LEN)
+
+
+def rospec_selector(msgbytes):
+    """The TagReportContentSelector (a dict) of the ROSpec in an ADD_ROSPEC
+    message, or None if it has none."""
+    rospec = TLV_struct['ROSpec']
+    report_spec = TLV_struct['ROReportSpec']
+    for partype, offset, length in parameters(msgbytes, msg_header_len,
+                                              len(msgbytes)):
+        if partype != rospec['type']:
+            continue
+        for subtype, suboffset, sublength in parameters(
+                msgbytes, offset + rospec['struct'].size, offset + length):
+            if subtype == report_spec['type']:
+                par, _ = report_spec['decode'](
+                    msgbytes[suboffset:suboffset + sublength])
+                return par['TagReportContentSelector']
+    return None
+
+
+class PrefixedReader(object):
+    """A file-like object reading head, then the rest of f.  Lets the input
+    format be sniffed on streams that cannot seek, like stdin."""
+
+    def __init__(self, head, f):
+        self.head = head
+        self.f = f
+
+    def read(self, n):
+        if not self.head:
+            return self.f.read(n)
+        data, self.head = self.head[:n], self.head[n:]
+        if len(data) < n:
+            data += self.f.read(n - len(data))
+        return data
+
+
+def frame_messages(chunks, stats):
+    """Split a stream of byte chunks into messages (as bytes)."""
+    framer = LLRPFramer()
+    for chunk in chunks:
+        stats.bytes += len(chunk)
+        try:
+            for view in framer.feed(chunk):
+                yield view.tobytes()
+        except LLRPError as err:
+            # without packet boundaries there is nothing to resync on
+            logger.error('giving up on the stream: %s', err)
+            stats.error('bad message length')
+            return
+    if len(framer):
+        stats.error('truncated message')
+
+
+def read_chunks(f, chunk_size):
+    while True:
+        data = f.read(chunk_size)
+        if not data:
+            return
+        yield data
+
 
-def parse_args():
+def read_hex_lines(f):
+    for line in f:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield binascii.unhexlify(line.replace(' ', ''))
+
+
+def read_capture(path, stats):
+    """Messages sent and received in a sllurp.capture file."""
+    with capture.CaptureReader(path) as reader:
+        for rec in reader.records(directions=(capture.RECEIVED,
+                                              capture.SENT)):
+            stats.bytes += len(rec.data)
+            yield rec.data
+
+
+class TCPFlow(object):
+    """One direction of a TCP connection carrying LLRP."""
+
+    def __init__(self):
+        self.framer = LLRPFramer()
+        self.next_seq = None
+        self.synced = False  # whether framer starts at a message boundary
+
+    def lost(self):
+        self.framer.clear()
+        self.synced = False
+
+
+def _ip_payload(packet, offset, ethertype):
+    """(source, destination, TCP segment) of an IP packet, or None if it is
+    not TCP."""
+    if ethertype is None and len(packet) > offset:
+        ethertype = (ETHERTYPE_IPV4 if ord(packet[offset]) >> 4 == 4
+                     else ETHERTYPE_IPV6)
+    if ethertype == ETHERTYPE_IPV4:
+        if len(packet) < offset + ipv4_header.size:
+            return None
+        (vihl, _, total_len, _, frag, _, proto, _, src,
+         dst) = ipv4_header.unpack_from(packet, offset)
+        if proto != IPPROTO_TCP or frag & BITMASK(13):
+            return None
+        end = offset + total_len if total_len else len(packet)
+        return src, dst, packet[offset + (vihl & 0xf) * 4:end]
+    if ethertype == ETHERTYPE_IPV6:
+        if len(packet) < offset + ipv6_header.size:
+            return None
+        _, payload_len, nxt, _, src, dst = ipv6_header.unpack_from(packet,
+                                                                   offset)
+        if nxt != IPPROTO_TCP:  # extension headers are not followed
+            return None
+        start = offset + ipv6_header.size
+        return src, dst, packet[start:start + payload_len]
+    return None
+
+
+def _link_header(linktype, packet):
+    """(ethertype or None, offset of the IP header) for packet."""
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        ethertype = ushort.unpack_from(packet, offset)[0]
+        while ethertype in ETHERTYPE_VLAN:
+            offset += 4
+            ethertype = ushort.unpack_from(packet, offset)[0]
+        return ethertype, offset + 2
+    if linktype == LINKTYPE_LINUX_SLL:
+        return ushort.unpack_from(packet, 14)[0], 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return ushort.unpack_from(packet, 0)[0], 20
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        return None, 4
+    if linktype in LINKTYPE_RAW:
+        return None, 0
+    raise LLRPError('unsupported pcap link type {}'.format(linktype))
+
+
+def read_pcap(f, port, stats):
+    """Messages carried over TCP to or from port in the pcap file f."""
+    head = f.read(24)
+    if head[:4] in PCAP_MAGICS:
+        endian = '>'
+    elif head[:4][::-1] in PCAP_MAGICS:
+        endian = '<'
+    else:
+        raise LLRPError('not a pcap file')
+    linktype = struct.unpack(endian + 'I', head[20:24])[0] & BITMASK(16)
+    record_header = struct.Struct(endian + 'IIII')
+
+    flows = {}  # (src, sport, dst, dport) -> TCPFlow
+    while True:
+        hdr = f.read(record_header.size)
+        if len(hdr) < record_header.size:
+            break
+        _, _, incl_len, orig_len = record_header.unpack(hdr)
+        packet = f.read(incl_len)
+        if len(packet) < incl_len:
+            stats.error('truncated pcap')
+            break
+        try:
+            ethertype, offset = _link_header(linktype, packet)
+            ip = _ip_payload(packet, offset, ethertype)
+        except struct.error:
+            stats.error('bad packet')
+            continue
+        if ip is None:
+            continue
+        src, dst, segment = ip
+        if len(segment) < tcp_header.size:
+            continue
+        sport, dport, seq, _, data_off, flags = tcp_header.unpack_from(
+            segment)
+        if port not in (sport, dport):
+            continue
+        key = (src, sport, dst, dport)
+        flow = flows.get(key)
+        if flow is None:
+            flow = flows[key] = TCPFlow()
+        if flags & TCP_SYN:
+            flow.lost()
+            flow.next_seq = (seq + 1) & BITMASK(32)
+            flow.synced = True
+            continue
+        payload = segment[(data_off >> 4) * 4:]
+        if incl_len < orig_len:
+            # cut short by the snap length; the rest of the segment is lost
+            stats.error('truncated packet')
+            flow.lost()
+            flow.next_seq = None
+        elif payload:
+            if flow.next_seq is not None:
+                delta = (seq - flow.next_seq) & BITMASK(32)
+                if delta >= 1 << 31:  # (partly) seen before
+                    delta -= 1 << 32
+                    if -delta >= len(payload):
+                        continue
+                    payload = payload[-delta:]
+                    seq = flow.next_seq
+                elif delta:
+                    stats.error('missing TCP segment')
+                    flow.lost()
+            flow.next_seq = (seq + len(payload)) & BITMASK(32)
+            if not flow.synced:
+                if not looks_like_header(payload):
+                    continue
+                flow.synced = True
+            stats.bytes += len(payload)
+            try:
+                for view in flow.framer.feed(payload):
+                    yield view.tobytes()
+            except LLRPError as err:
+                logger.debug('resyncing %s: %s', key, err)
+                stats.error('bad message length')
+                flow.lost()
+        if flags & (TCP_FIN | TCP_RST):
+            del flows[key]
+    for flow in flows.values():
+        if len(flow.framer):
+            stats.error('truncated message')
+
+
+def read_messages(path, fmt, port, stats, chunk_size=1024 * 1024):
+    """Messages (as bytes) in the file path (- for stdin) of format fmt."""
+    if path == '-':
+        f = getattr(sys.stdin, 'buffer', sys.stdin)
+    else:
+        f = open(path, 'rb')
+    if fmt == 'auto':
+        head = f.read(8)
+        f = PrefixedReader(head, f)
+        if head[:4] in PCAP_MAGICS or head[:4][::-1] in PCAP_MAGICS:
+            fmt = 'pcap'
+        elif head.startswith(capture.MAGIC):
+            fmt = 'capture'
+        elif head.startswith(PCAPNG_MAGIC):
+            raise LLRPError('pcapng is not supported; convert with'
+                            ' editcap -F pcap')
+        else:
+            fmt = 'raw'
+    if fmt == 'capture':
+        if path == '-':
+            raise LLRPError('captures cannot be read from stdin')
+        return read_capture(path, stats)
+    if fmt == 'pcap':
+        return read_pcap(f, port, stats)
+    if fmt == 'hex':
+        return frame_messages(read_hex_lines(f), stats)
+    return frame_messages(read_chunks(f, chunk_size), stats)
+
+
+def write_columns(lmsg, fp):
+    batch = lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData']
+    msgid = str(lmsg.msgid)
+    columns = [(batch.column_bits[name], batch.column(name))
+               for name, _ in TagReportBatch.column_types]
+    for i, bits in enumerate(batch.present):
+        row = [msgid, binascii.hexlify(batch.epc(i))]
+        for bit, col in columns:
+            row.append(str(col[i]) if bits & bit else '')
+        fp.write('\t'.join(row))
+        fp.write('\n')
+
+
+def make_decoders(output, selector):
+    """LLRPMessage decoders for output, with TagReportData decoded by a
+    TagReportDataDecoder compiled for selector (if not None)."""
+    if output == 'columns':
+        decoder = decode_ROAccessReport_columnar
+    elif selector is None:
+        return None
+    else:
+        decoder = decode_ROAccessReport
+    if selector is not None:
+        decoder = partial(decoder, tag_decoder=TagReportDataDecoder(selector))
+    return {'RO_ACCESS_REPORT': decoder}
+
+
+def update_selector(msgbytes, selector):
+    """The selector in effect after msgbytes: that of its ROSpec if it is
+    an ADD_ROSPEC, otherwise selector."""
+    if message_name(msgbytes) != 'ADD_ROSPEC':
+        return selector
+    try:
+        return rospec_selector(msgbytes) or selector
+    except Exception:  # decode_TagReportContentSelector raises Exception
+        logger.debug('cannot read the selector of %s',
+                     binascii.hexlify(msgbytes), exc_info=True)
+        return selector
+
+
+def decode_messages(msgs, output, selector=None):
+    """Decode msgs (a list of message bytes) and render them as output.
+    Tag reports are decoded for selector until an ADD_ROSPEC changes it.
+    Returns (rendered text, DecodeStats); run in worker processes."""
+    stats = DecodeStats()
+    out = StringIO()
+    decoders = make_decoders(output, selector)
+    for msgbytes in msgs:
+        name = message_name(msgbytes)
+        stats.messages[name or 'unknown'] += 1
+        if name is None:
+            stats.error('unknown message type')
+            continue
+        if name == 'ADD_ROSPEC':
+            new_selector = update_selector(msgbytes, selector)
+            if new_selector != selector:
+                selector = new_selector
+                decoders = make_decoders(output, selector)
+        if 'decode' not in TLV_struct[name]:
+            # requests to the reader; only counted
+            continue
+        try:
+            lmsg = LLRPMessage(msgbytes=msgbytes, decoders=decoders)
+            if lmsg.msgdict is None:
+                raise LLRPError('cannot decode')
+            if name == 'RO_ACCESS_REPORT':
+                stats.tags += len(lmsg.getParameter('TagReportData', ()))
+            if output == 'xml':
+                lmsg.writeXML(out)
+            elif output == 'json':
+                lmsg.writeJSON(out)
+            elif output == 'columns' and name == 'RO_ACCESS_REPORT':
+                write_columns(lmsg, out)
+        except Exception:  # decoders raise all sorts on malformed messages
+            logger.debug('cannot decode %s', binascii.hexlify(msgbytes),
+                         exc_info=True)
+            stats.error('cannot decode ' + name)
+    return out.getvalue(), stats
+
+
+def batches(msgs, size, selector=None, types=None):
+    """Split msgs into lists of size messages, leaving out those not of
+    types (if given).  Yields (list, the selector in effect before it)."""
+    batch = []
+    for msg in msgs:
+        # ADD_ROSPECs count even if they are left out
+        next_selector = update_selector(msg, selector)
+        if types is None or message_name(msg) in types:
+            if not batch:
+                start_selector = selector
+            batch.append(msg)
+            if len(batch) >= size:
+                yield batch, start_selector
+                batch = []
+        selector = next_selector
+    if batch:
+        yield batch, start_selector
+
+
+def decode_all(msgs, output, jobs=1, batch_size=500, selector=None,
+               types=None):
+    """Generate decode_messages() results for successive batches of msgs
+    (only those of types, if given), in order, using jobs processes.  Only
+    a few batches per process are read ahead of the output."""
+    if jobs <= 1:
+        for batch, batch_selector in batches(msgs, batch_size, selector,
+                                             types):
+            yield decode_messages(batch, output, batch_selector)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = deque()
+        for batch, batch_selector in batches(msgs, batch_size, selector,
+                                             types):
+            pending.append(pool.apply_async(decode_messages,
+                                            (batch, output, batch_selector)))
+            if len(pending) >= jobs * 4:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_selector(text):
+    selector = dict.fromkeys(SELECTOR_FLAGS, False)
+    for flag in text.split(','):
+        flag = flag.strip()
+        if flag not in selector:
+            raise argparse.ArgumentTypeError(
+                'unknown flag {}; use {}'.format(flag,
+                                                 ', '.join(SELECTOR_FLAGS)))
+        selector[flag] = True
+    return selector
+
+
+def parse_args(argv=None):
     global args
-    parser = argparse.ArgumentParser(description='Decode an LLRP message')
-    parser.add_argument('msg', help='message in hexadecimal encoding')
+    parser = argparse.ArgumentParser(description='Decode LLRP messages')
+    parser.add_argument('msg', nargs='?',
+                        help='message in hexadecimal encoding')
+    parser.add_argument('-i', '--input', metavar='FILE',
+                        help='decode every message in FILE (- for stdin)')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='auto',
+                        help='format of the input: raw LLRP bytes, lines of'
+                        ' hex, pcap or sllurp.capture (default: detected)')
+    parser.add_argument('-p', '--port', type=int, default=LLRP_PORT,
+                        help='TCP port of LLRP traffic in a pcap (default'
+                        ' %(default)s)')
+    parser.add_argument('-o', '--output', choices=OUTPUTS,
+                        help='write messages as XML, JSON lines, one'
+                        ' tab-separated row per tag of each RO_ACCESS_REPORT,'
+                        ' or not at all (default: xml)')
+    parser.add_argument('-t', '--type', action='append', dest='types',
+                        help='only messages of this type (may be repeated)')
+    parser.add_argument('-s', '--selector', type=parse_selector,
+                        help='comma-separated TagReportContentSelector flags'
+                        ' the reports were made with, until an ADD_ROSPEC'
+                        ' in the input says otherwise (e.g. EnableAntennaID,'
+                        'EnablePeakRRSI)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='decode in this many processes (default'
+                        ' %(default)s)')
+    parser.add_argument('-b', '--batch-size', type=int, default=500,
+                        help='messages per batch handed to a process'
+                        ' (default %(default)s)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="don't print summary statistics")
     parser.add_argument('-d', '--debug', action='store_true')
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if not (args.msg or args.input):
+        parser.error('give a message or --input')
 
 
 def init_logging():
@@ -28,11 +573,39 @@ def init_logging():
     root.handlers = [stderr]
 
 
-if __name__ == '__main__':
-    parse_args()
+def main(argv=None):
+    parse_args(argv)
     init_logging()
 
-    m = binascii.unhexlify(args.msg)
-    msg = LLRPMessage(msgbytes=m)
-    print 'Decoded message:\n=========='
-    print msg
+    if args.msg and not args.output:
+        m = binascii.unhexlify(args.msg)
+        msg = LLRPMessage(msgbytes=m)
+        print('Decoded message:\n==========')
+        print(msg)
+        return 0
+
+    output = args.output or 'xml'
+    stats = DecodeStats()
+    if args.input:
+        msgs = read_messages(args.input, args.format, args.port, stats)
+    else:
+        msgs = frame_messages([binascii.unhexlify(args.msg)], stats)
+    types = set(args.types) if args.types else None
+
+    out = sys.stdout
+    if output == 'columns':
+        print('\t'.join(COLUMNS), file=out)
+    start = timer()
+    for text, batch_stats in decode_all(msgs, output, args.jobs,
+                                        args.batch_size, args.selector,
+                                        types):
+        out.write(text)
+        stats.merge(batch_stats)
+    out.flush()
+    if not args.quiet:
+        stats.report(timer() - start, sys.stderr)
+    return 1 if stats.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
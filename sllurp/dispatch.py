@@ -0,0 +1,302 @@
+"""Decouple decoding from the callbacks that consume messages.
+
+Without a DispatchQueue, LLRPClient calls every message callback as soon as
+it has framed a message, and carries on reading only once the callbacks
+return.  A callback may instead return a Deferred, e.g. while it pushes tags
+to a slow network peer.  A DispatchQueue then holds later messages until that
+Deferred fires, so callbacks still see messages one at a time and in order.
+At most maxsize messages wait.  When the queue is full, the overflow policy
+decides what happens:
+
+    block        pause reading from the reader until the queue has drained
+                 to half of maxsize; TCP flow control then holds the reader
+                 back
+    drop_oldest  drop the oldest waiting RO_ACCESS_REPORT
+    coalesce     merge the new RO_ACCESS_REPORT's tags into the newest
+                 waiting one, one entry per EPC; TagSeenCount is summed,
+                 PeakRSSI is the highest and FirstSeen timestamps are kept.
+                 Reports that cannot be merged (TagReportBatches) are
+                 dropped as with drop_oldest
+
+Only RO_ACCESS_REPORTs are ever dropped or merged.  Other messages are always
+queued, even past maxsize.  With block, the messages already read when the
+queue fills up are still queued, so the queue may briefly exceed maxsize.
+
+A ThreadedDispatcher runs callbacks on a thread pool instead of the reactor
+thread, so that heavy work in them does not delay KEEPALIVE_ACKs and the
+state machine.  Messages from one reader are handled in order, one at a
+time; different readers are handled in parallel.
+"""
+
+from collections import deque
+import logging
+
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from llrp_errors import LLRPError
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+
+class DispatchQueue(object):
+    def __init__(self, callbacks, maxsize=1000, overflow='block'):
+        """callbacks maps message names to lists of callables, as
+        LLRPClient keeps them.  Set producer to the transport to pause with
+        the block policy."""
+        if overflow not in OVERFLOW_POLICIES:
+            raise LLRPError('unknown overflow policy {}; use one of {}'.format(
+                overflow, ', '.join(OVERFLOW_POLICIES)))
+        self.callbacks = callbacks
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.producer = None
+
+        # [LLRPMessage, {EPC: index into its TagReportData} or None]
+        self._queue = deque()
+        self._busy = False  # delivering, or waiting for a callback's Deferred
+        self.paused = False
+
+        self.max_depth = 0
+        self.delivered = 0
+        self.dropped = 0       # RO_ACCESS_REPORTs dropped
+        self.dropped_tags = 0  # TagReportData entries in those decoded
+        self.coalesced = 0     # TagReportData entries merged into others
+        self.pauses = 0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def stats(self):
+        return {
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'dropped_tags': self.dropped_tags,
+            'coalesced': self.coalesced,
+            'pauses': self.pauses,
+            'paused': self.paused,
+        }
+
+    def put(self, lmsg):
+        if not self.callbacks.get(lmsg.getName()):
+            return
+        if len(self._queue) < self.maxsize or self.overflow == 'block' or \
+                lmsg.getName() != 'RO_ACCESS_REPORT':
+            self._queue.append([lmsg, None])
+        elif self.overflow == 'coalesce' and self._coalesce(lmsg):
+            pass
+        else:
+            self._dropOldest()
+            self._queue.append([lmsg, None])
+        self.max_depth = max(self.max_depth, len(self._queue))
+
+        if self.overflow == 'block' and len(self._queue) >= self.maxsize:
+            self._pause()
+        if not self._busy:
+            self._drain()
+
+    def _drain(self, *args):
+        self._busy = True
+        while self._queue:
+            lmsg, _ = self._queue.popleft()
+            if len(self._queue) <= self.maxsize // 2:
+                self._resume()
+            waiting = self._deliver(lmsg)
+            if waiting:
+                d = defer.DeferredList(waiting, consumeErrors=True)
+                d.addCallback(self._drain)
+                return
+        self._busy = False
+
+    def _deliver(self, lmsg):
+        """Call lmsg's callbacks; return the Deferreds they returned that
+        have not fired yet."""
+        self.delivered += 1
+        waiting = []
+        for fn in self.callbacks.get(lmsg.getName(), ()):
+            try:
+                ret = fn(lmsg)
+            except Exception:
+                logger.exception('%s callback failed', lmsg.getName())
+                continue
+            if isinstance(ret, defer.Deferred):
+                ret.addErrback(self._failed, lmsg.getName())
+                if not ret.called:
+                    waiting.append(ret)
+        return waiting
+
+    def _failed(self, failure, msg_name):
+        logger.error('%s callback failed: %s', msg_name,
+                     failure.getTraceback())
+
+    def _pause(self):
+        if self.paused or self.producer is None:
+            return
+        logger.debug('dispatch queue full; pausing reads')
+        self.paused = True
+        self.pauses += 1
+        self.producer.pauseProducing()
+
+    def _resume(self):
+        if not self.paused:
+            return
+        logger.debug('dispatch queue drained; resuming reads')
+        self.paused = False
+        self.producer.resumeProducing()
+
+    def _dropOldest(self):
+        for item in self._queue:
+            lmsg = item[0]
+            if lmsg.getName() == 'RO_ACCESS_REPORT':
+                self._queue.remove(item)
+                self.dropped += 1
+                # count tags only if they are at hand: decoding a report
+                # just to drop it would cost more than keeping it
+                if not lmsg._undecoded and lmsg.msgdict is not None:
+                    self.dropped_tags += len(
+                        lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData'])
+                return
+
+    def _coalesce(self, lmsg):
+        """Merge lmsg's tags into the newest waiting RO_ACCESS_REPORT.
+        Returns False if that cannot be done."""
+        # either report may fail to decode
+        if lmsg.msgdict is None:
+            return False
+        tags = lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData']
+        if not isinstance(tags, list):
+            return False
+        for item in reversed(self._queue):
+            if item[0].getName() == 'RO_ACCESS_REPORT':
+                break
+        else:
+            return False
+        if item[0].msgdict is None:
+            return False
+        into = item[0].msgdict['RO_ACCESS_REPORT']['TagReportData']
+        if not isinstance(into, list):
+            return False
+
+        if item[1] is None:
+            item[1] = {}
+            for i, tag in enumerate(into):
+                item[1][epc(tag)] = i
+        index = item[1]
+        for tag in tags:
+            key = epc(tag)
+            if key in index:
+                into[index[key]] = merge_tags(into[index[key]], tag)
+                self.coalesced += 1
+            else:
+                index[key] = len(into)
+                into.append(tag)
+        return True
+
+
+def epc(tag):
+    if 'EPC-96' in tag:
+        return tag['EPC-96']
+    return tag['EPCData']['EPC']
+
+
+def merge_tags(old, new):
+    """Return new, a later sighting of the same tag as old, updated to
+    cover both sightings."""
+    merged = dict(new)
+    if 'TagSeenCount' in old or 'TagSeenCount' in new:
+        merged['TagSeenCount'] = (old.get('TagSeenCount', (1,))[0] +
+                                  new.get('TagSeenCount', (1,))[0],)
+    if 'PeakRSSI' in old:
+        merged['PeakRSSI'] = max(old['PeakRSSI'],
+                                 new.get('PeakRSSI', old['PeakRSSI']))
+    for key in ('FirstSeenTimestampUTC', 'FirstSeenTimestampUptime'):
+        if key in old:
+            merged[key] = old[key]
+    return merged
+
+
+class ThreadedDispatcher(object):
+    def __init__(self, threads=4, reactor=reactor):
+        """Run callbacks on a pool of up to threads threads.  The pool is
+        stopped when reactor shuts down."""
+        self.reactor = reactor
+        self.pool = ThreadPool(minthreads=0, maxthreads=threads,
+                               name='sllurp-callbacks')
+        self.pool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+        # reader -> deque of (callable, LLRPMessage, Deferred) waiting for
+        # that reader's running call to finish
+        self._waiting = {}
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_backlog = 0
+
+    def stop(self):
+        if self.pool.started:
+            self.pool.stop()
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'backlog': sum(len(q) for q in self._waiting.values()),
+            'max_backlog': self.max_backlog,
+        }
+
+    def wrap(self, fn):
+        """Return a message callback that runs fn(lmsg) on the pool.  It
+        returns a Deferred that fires in the reactor thread once fn has
+        returned, so a DispatchQueue waits for it."""
+        def threaded(lmsg):
+            return self.submit(fn, lmsg)
+        threaded.wrapped = fn
+        return threaded
+
+    def submit(self, fn, lmsg):
+        self.submitted += 1
+        # decode here in the reactor thread: a lazy message must not be
+        # decoded by a pool thread while the reactor reads it too
+        lmsg.msgdict
+        d = defer.Deferred()
+        key = lmsg.peername
+        if key in self._waiting:
+            queue = self._waiting[key]
+            queue.append((fn, lmsg, d))
+            self.max_backlog = max(self.max_backlog, len(queue))
+        else:
+            self._waiting[key] = deque()
+            self._run(key, fn, lmsg, d)
+        return d
+
+    def _run(self, key, fn, lmsg, d):
+        result = deferToThreadPool(self.reactor, self.pool, fn, lmsg)
+        result.addCallbacks(self._completed, self._failed,
+                            errbackArgs=(lmsg.getName(),))
+        result.addBoth(self._next, key)
+        result.chainDeferred(d)
+
+    def _completed(self, result):
+        self.completed += 1
+        return result
+
+    def _failed(self, failure, msg_name):
+        self.failed += 1
+        logger.error('%s callback failed in thread: %s', msg_name,
+                     failure.getTraceback())
+
+    def _next(self, result, key):
+        queue = self._waiting[key]
+        if queue:
+            self._run(key, *queue.popleft())
+        else:
+            del self._waiting[key]
+        return result
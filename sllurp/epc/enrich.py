@@ -0,0 +1,123 @@
+'''
+Add decoded identifiers to tag reports.
+
+The same few thousand EPCs tend to be seen over and over, so EPCEnricher
+remembers the identity of the maxsize most recently seen EPCs (keyed by the
+raw EPC bytes) and decodes each EPC only the first time it is seen:
+
+    enricher = EPCEnricher()
+    enricher.attach(factory)   # before callbacks that use the identities
+    factory.addTagReportCallback(tag_seen_callback)
+
+Every TagReportData then carries an 'EPCIdentity': the dictionary returned
+by tds.decode_epc (scheme, uri and the scheme's fields), plus 'gtin', the
+GTIN-14, for SGTINs.  EPCs that cannot be decoded get None.  Identities are
+shared between tags, so do not modify them.
+'''
+
+from binascii import hexlify, unhexlify
+from gtin import combine_gtin_with_check_digit
+import tds
+
+SGTIN_SCHEMES = ('sgtin-96', 'sgtin-198')
+
+
+def identify(epc, decoder=tds.Decoder.default):
+    '''Given an EPC as raw bytes, return its identity, or None.'''
+    parsed = decoder.decode(hexlify(epc))
+    if parsed is None:
+        return None
+    if parsed['scheme'] in SGTIN_SCHEMES:
+        # the indicator digit leads the item reference
+        item = parsed['item_reference']
+        return dict(parsed, gtin=combine_gtin_with_check_digit(
+            item[:1] + parsed['company_prefix'] + item[1:]))
+    return parsed
+
+
+class EPCEnricher(object):
+    def __init__(self, maxsize=10000, decoder=None):
+        '''Remember the identities of up to maxsize EPCs, decoded with
+        decoder (a tds.Decoder; by default one without a cache of its
+        own).'''
+        self.maxsize = maxsize
+        self.decoder = decoder or tds.Decoder(cache_size=0)
+
+        # raw EPC -> [previous, next, EPC, identity], links of a circular
+        # list that runs from the least to the most recently seen EPC;
+        # OrderedDict would be several times slower to reorder on every hit
+        self._cache = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def stats(self):
+        return {
+            'size': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def lookup(self, epc):
+        '''Given an EPC as raw bytes, return its identity, or None.'''
+        root = self._root
+        link = self._cache.get(epc)
+        if link is not None:
+            self.hits += 1
+            # move the link to the most recently seen end
+            prev, next_, _, ident = link
+            prev[1] = next_
+            next_[0] = prev
+            last = root[0]
+            last[1] = root[0] = link
+            link[0] = last
+            link[1] = root
+            return ident
+
+        self.misses += 1
+        ident = identify(epc, self.decoder)
+        if len(self._cache) >= self.maxsize:
+            oldest = root[1]
+            root[1] = oldest[1]
+            oldest[1][0] = root
+            del self._cache[oldest[2]]
+            self.evictions += 1
+        last = root[0]
+        last[1] = root[0] = self._cache[epc] = [last, root, epc, ident]
+        return ident
+
+    def lookup_batch(self, epcs):
+        '''Given EPCs as raw bytes, return a list of their identities.'''
+        return [self.lookup(epc) for epc in epcs]
+
+    def enrich(self, tags):
+        '''Add an EPCIdentity to each of tags, the TagReportData of an
+        RO_ACCESS_REPORT (a list of dicts or a TagReportBatch).'''
+        if isinstance(tags, list):
+            for tag in tags:
+                if 'EPC-96' in tag:
+                    epc = tag['EPC-96']
+                else:
+                    epc = tag['EPCData']['EPC']
+                tag['EPCIdentity'] = self.lookup(unhexlify(epc))
+            return
+        # a TagReportBatch builds its dicts from extras on demand
+        idents = self.lookup_batch(tags.epc(i) for i in xrange(len(tags)))
+        for i, ident in enumerate(idents):
+            tags.extras.setdefault(i, {})['EPCIdentity'] = ident
+
+    def tagReportCallback(self, lmsg):
+        self.enrich(lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData'])
+
+    def attach(self, factory):
+        '''Enrich the tag reports of factory (an LLRPClientFactory or
+        LLRPSupervisor).  Callbacks see the identities only if they were
+        added after this.'''
+        factory.addTagReportCallback(self.tagReportCallback)
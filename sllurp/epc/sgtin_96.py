@@ -8,8 +8,19 @@ Header    Filter  Partition   Company Prefix  Item Reference  Serial
 Documentation here:
 http://www.gs1.org/sites/default/files/docs/tds/TDS_1_9_Standard.pdf
 
+parse_sgtin_96_batch() decodes many EPCs at once into columns, using NumPy
+when it is installed.
+
 '''
 
+from binascii import unhexlify
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 '''
 Table defining partition sizes for SGTIN-96
 '''
@@ -77,3 +88,144 @@ def parse_sgtin_96_to_uri(sgtin_96):
     tag_dict = parse_sgtin_96(sgtin_96)
     uri_template = "urn:epc:id:sgtin:{company_prefix}.{item_reference}.{serial}"
     return uri_template.format(**tag_dict)
+
+
+SGTIN_96_HEADER = 0x30
+SGTIN_96_URI_PREFIX = 'urn:epc:id:sgtin:'
+
+# company prefix and item reference together take 44 bits, the serial 38
+SERIAL_BITS = 38
+
+epc_words = struct.Struct('!IQ')
+
+BATCH_FIELDS = ('header', 'filter', 'partition', 'company_prefix',
+                'item_reference', 'serial', 'valid')
+
+
+def epc_bytes(epc):
+    '''Return an EPC given as a hex string or as raw bytes as raw bytes.'''
+    if len(epc) == 24:
+        return unhexlify(epc)
+    return bytes(bytearray(epc))
+
+
+def parse_sgtin_96_batch(epcs, use_numpy=None):
+    '''Given a sequence of SGTIN-96 EPCs (hex strings or 12-byte strings),
+    parse them all.
+
+    Returns a dictionary of columns, each with one entry per EPC: header,
+    filter, partition (as an integer), company_prefix and item_reference
+    (zero-padded strings), serial, and valid.  EPCs that are not valid
+    SGTIN-96s do not raise; their valid entry is False and their other
+    fields are meaningless.  The columns are NumPy arrays if NumPy is used
+    (by default, whenever it is installed) and lists otherwise.'''
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        return _parse_batch_numpy(epcs)
+    return _parse_batch(epcs)
+
+
+def _parse_batch(epcs):
+    header_col, filter_col, partition_col = [], [], []
+    company_col, item_col, serial_col, valid_col = [], [], [], []
+    serial_mask = (1 << SERIAL_BITS) - 1
+    # partition -> (item reference bits, company digits, item digits,
+    #               company limit, item limit)
+    layouts = dict((p, (n, l, k, 10 ** l, 10 ** k))
+                   for p, (m, l, n, k) in SGTIN_96_PARTITION_MAP.items())
+    invalid = (0, 0, 0, 1, 1)
+    for epc in epcs:
+        # the first 32 bits, and the 64 after them
+        if len(epc) == 24:
+            try:
+                w0, rest = int(epc[:8], 16), int(epc[8:], 16)
+            except ValueError:  # not hex; header 0 makes it invalid
+                w0, rest = 0, 0
+        elif len(epc) == 12:
+            w0, rest = epc_words.unpack(bytes(bytearray(epc)))
+        else:
+            w0, rest = 0, 0
+        header = w0 >> 24
+        partition = (w0 >> 18) & 7
+        company_item = ((w0 & 0x3ffff) << 26) | (rest >> SERIAL_BITS)
+        n, l, k, max_company, max_item = layouts.get(partition, invalid)
+        company = company_item >> n
+        item = company_item & ((1 << n) - 1)
+
+        header_col.append(header)
+        filter_col.append((w0 >> 21) & 7)
+        partition_col.append(partition)
+        company_col.append(str(company).zfill(l))
+        item_col.append(str(item).zfill(k))
+        serial_col.append(rest & serial_mask)
+        valid_col.append(header == SGTIN_96_HEADER and
+                         partition in layouts and
+                         company < max_company and item < max_item)
+    return dict(zip(BATCH_FIELDS, (header_col, filter_col, partition_col,
+                                   company_col, item_col, serial_col,
+                                   valid_col)))
+
+
+def _epc_bytes_or_empty(epc):
+    try:
+        return epc_bytes(epc)
+    except TypeError:  # not hex
+        return ''
+
+
+def _parse_batch_numpy(epcs):
+    count = len(epcs)
+    raw = [_epc_bytes_or_empty(epc) for epc in epcs]
+    lengths_ok = numpy.array([len(r) == 12 for r in raw], dtype=bool)
+    if not lengths_ok.all():
+        raw = [r if len(r) == 12 else '\x00' * 12 for r in raw]
+    words = numpy.frombuffer(''.join(raw), dtype='>u4').reshape(count, 3)
+    w0, w1, w2 = words.astype(numpy.uint64).T
+    # NumPy refuses to mix uint64 with Python ints in bit operations
+    u = numpy.uint64
+
+    header = (w0 >> u(24)).astype(numpy.uint8)
+    partition = ((w0 >> u(18)) & u(7)).astype(numpy.uint8)
+    # bits 14-57: the low 18 bits of the first word, the top 26 of the second
+    company_item = ((w0 & u(0x3ffff)) << u(26)) | (w1 >> u(6))
+    serial = ((w1 & u(0x3f)) << u(32)) | w2
+
+    valid = lengths_ok & (header == SGTIN_96_HEADER) & (partition <= 6)
+    company_prefix = numpy.empty(count, dtype='S12')
+    item_reference = numpy.empty(count, dtype='S7')
+    for p, (m, l, n, k) in SGTIN_96_PARTITION_MAP.items():
+        rows = numpy.flatnonzero(partition == p)
+        if not len(rows):
+            continue
+        ci = company_item[rows]
+        company = ci >> u(n)
+        item = ci & u((1 << n) - 1)
+        valid[rows] &= (company < 10 ** l) & (item < 10 ** k)
+        company_prefix[rows] = numpy.char.zfill(company.astype('S12'), l)
+        item_reference[rows] = numpy.char.zfill(item.astype('S7'), k)
+
+    return {
+        'header': header,
+        'filter': ((w0 >> u(21)) & u(7)).astype(numpy.uint8),
+        'partition': partition,
+        'company_prefix': company_prefix,
+        'item_reference': item_reference,
+        'serial': serial,
+        'valid': valid,
+    }
+
+
+def sgtin_96_batch_to_uris(columns):
+    '''Given the columns returned by parse_sgtin_96_batch, return a list of
+    tag URIs, with None for invalid EPCs.'''
+    if numpy is not None and isinstance(columns['valid'], numpy.ndarray):
+        # formatting Python objects beats numpy.char by far
+        columns = dict((field, columns[field].tolist())
+                       for field in ('company_prefix', 'item_reference',
+                                     'serial', 'valid'))
+    uri_template = SGTIN_96_URI_PREFIX + '{}.{}.{}'
+    return [uri_template.format(company, item, serial) if valid else None
+            for company, item, serial, valid in zip(
+                columns['company_prefix'], columns['item_reference'],
+                columns['serial'], columns['valid'])]
@@ -0,0 +1,306 @@
+'''
+Decode EPCs of any of the binary schemes of the EPC Tag Data Standard.
+
+The EPC header (its first 8 bits) selects the scheme:
+
+Header  Scheme      Fields after the header
+0x30    SGTIN-96    filter, partition, company prefix, item reference, serial
+0x31    SSCC-96     filter, partition, company prefix, serial reference
+0x32    SGLN-96     filter, partition, company prefix, location reference,
+                    extension
+0x33    GRAI-96     filter, partition, company prefix, asset type, serial
+0x34    GIAI-96     filter, partition, company prefix, individual asset
+                    reference
+0x35    GID-96      general manager, object class, serial
+0x36    SGTIN-198   filter, partition, company prefix, item reference,
+                    alphanumeric serial
+
+Documentation here:
+http://www.gs1.org/sites/default/files/docs/tds/TDS_1_9_Standard.pdf
+
+decode_epc() returns a dictionary of the fields, plus scheme, header and the
+pure identity URI, or None if the EPC is not a valid EPC of a known scheme;
+it never raises for a bad EPC.  Decodes are cached, so a tag that is seen
+over and over is only decoded once.
+'''
+
+from binascii import hexlify
+
+from sgtin_96 import SGTIN_96_PARTITION_MAP as SGTIN_PARTITION_MAP
+
+'''
+Partition tables like SGTIN_PARTITION_MAP: partition -> (company prefix
+bits, company prefix digits, reference bits, reference digits)
+'''
+SSCC_PARTITION_MAP = {
+    0: (40, 12, 18, 5),
+    1: (37, 11, 21, 6),
+    2: (34, 10, 24, 7),
+    3: (30, 9, 28, 8),
+    4: (27, 8, 31, 9),
+    5: (24, 7, 34, 10),
+    6: (20, 6, 38, 11)
+}
+SGLN_PARTITION_MAP = {
+    0: (40, 12, 1, 0),
+    1: (37, 11, 4, 1),
+    2: (34, 10, 7, 2),
+    3: (30, 9, 11, 3),
+    4: (27, 8, 14, 4),
+    5: (24, 7, 17, 5),
+    6: (20, 6, 21, 6)
+}
+GRAI_PARTITION_MAP = {
+    0: (40, 12, 4, 0),
+    1: (37, 11, 7, 1),
+    2: (34, 10, 10, 2),
+    3: (30, 9, 14, 3),
+    4: (27, 8, 17, 4),
+    5: (24, 7, 20, 5),
+    6: (20, 6, 24, 6)
+}
+GIAI_PARTITION_MAP = {
+    0: (40, 12, 42, 13),
+    1: (37, 11, 45, 14),
+    2: (34, 10, 48, 15),
+    3: (30, 9, 52, 16),
+    4: (27, 8, 55, 17),
+    5: (24, 7, 58, 18),
+    6: (20, 6, 62, 19)
+}
+
+# the characters allowed in alphanumeric serials, and how the URI escapes them
+GS1_CHARACTERS = frozenset(
+    '!"%&\'()*+,-./0123456789:;<=>?ABCDEFGHIJKLMNOPQRSTUVWXYZ_'
+    'abcdefghijklmnopqrstuvwxyz')
+URI_ESCAPES = {
+    '"': '%22',
+    '%': '%25',
+    '&': '%26',
+    '/': '%2F',
+    '<': '%3C',
+    '>': '%3E',
+    '?': '%3F'
+}
+
+# field kinds:
+#   digits   decimal, zero-padded to the given number of digits
+#   integer  decimal, below 10 ** digits if digits is given
+#   string   7-bit characters, padded with zeroes
+DIGITS = 'digits'
+INTEGER = 'integer'
+STRING = 'string'
+
+
+class Scheme(object):
+    '''One EPC binary encoding.
+
+    fields lists (name, bits, kind, digits) for every field after the
+    header, filter and partition.  For a partitioned scheme, the first two
+    fields take their bits and digits from partitions, a partition table as
+    above, and may be given as (name, None, kind, None).  The URI is uri
+    followed by the fields, separated by dots.'''
+
+    def __init__(self, name, header, bits, uri, fields, partitions=None):
+        self.name = name
+        self.header = header
+        self.bits = bits
+        self.uri = uri
+        self.fields = fields
+        self.partitions = partitions
+
+        # partition -> ((name, shift, mask, kind, format, limit), ...), the
+        # fields ready to be cut out of the EPC
+        self.layouts = {}
+        if partitions is None:
+            self.layouts[None] = self._layout(8, fields)
+        else:
+            for p, (m, l, n, k) in partitions.items():
+                (name1, _, kind1, _), (name2, _, kind2, _) = fields[:2]
+                self.layouts[p] = self._layout(
+                    8 + 3 + 3, ((name1, m, kind1, l), (name2, n, kind2, k)) +
+                    tuple(fields[2:]))
+
+    def _layout(self, offset, fields):
+        layout = []
+        for name, bits, kind, digits in fields:
+            offset += bits
+            if kind == STRING:
+                fmt = None
+            elif kind == DIGITS and digits:
+                fmt = '%0{}d'.format(digits)
+            elif kind == DIGITS:
+                fmt = ''  # no digits at all
+            else:
+                fmt = '%d'
+            layout.append((name, self.bits - offset, (1 << bits) - 1, kind,
+                           fmt, None if digits is None else 10 ** digits))
+        return tuple(layout)
+
+    def decode(self, value):
+        '''Given the scheme's bits of an EPC as an integer, parse each
+        field.  Returns a dictionary of the fields, or None if they are not
+        valid.'''
+        parsed = {'scheme': self.name, 'header': self.header}
+        if self.partitions is None:
+            layout = self.layouts[None]
+        else:
+            parsed['filter'] = int((value >> (self.bits - 11)) & 7)
+            partition = int((value >> (self.bits - 14)) & 7)
+            if partition not in self.layouts:
+                return None
+            parsed['partition'] = partition
+            layout = self.layouts[partition]
+
+        uri = []
+        for name, shift, mask, kind, fmt, limit in layout:
+            field = (value >> shift) & mask
+            if limit is not None and field >= limit:
+                return None
+            if kind == DIGITS:
+                field = fmt and fmt % field
+                uri.append(field)
+            elif kind == INTEGER:
+                field = int(field)
+                uri.append(fmt % field)
+            else:
+                field = decode_string(field, mask.bit_length() // 7)
+                if field is None:
+                    return None
+                uri.append(escape(field))
+            parsed[name] = field
+
+        parsed['uri'] = self.uri + '.'.join(uri)
+        return parsed
+
+
+def decode_string(value, chars):
+    '''Decode chars 7-bit characters, most significant first.  Returns None
+    if a character is not allowed or the zero padding is broken.'''
+    out = []
+    for shift in xrange((chars - 1) * 7, -1, -7):
+        c = (value >> shift) & 0x7f
+        if not c:
+            if value & ((1 << shift) - 1):
+                return None
+            break
+        c = chr(c)
+        if c not in GS1_CHARACTERS:
+            return None
+        out.append(c)
+    return ''.join(out)
+
+
+def escape(value):
+    return ''.join(URI_ESCAPES.get(c, c) for c in value)
+
+
+SCHEMES = {}
+MISSING = object()
+
+
+def register_scheme(scheme):
+    '''Add scheme to the schemes that decode_epc knows, replacing any with
+    the same header.'''
+    SCHEMES[scheme.header] = scheme
+    Decoder.default.clear()
+
+
+class Decoder(object):
+    def __init__(self, schemes=SCHEMES, cache_size=100000):
+        '''Decode EPCs of schemes, a dictionary of header -> Scheme.
+        Remembers up to cache_size decodes; once that many are cached, the
+        cache is emptied and filled up again.'''
+        self.schemes = schemes
+        self.cache_size = cache_size
+        self.cache = {}
+
+    def clear(self):
+        self.cache.clear()
+
+    def decode(self, epc):
+        '''Given an EPC hex string, return a dictionary of its fields, or
+        None.  The dictionary is shared with later calls for the same EPC,
+        so do not modify it.'''
+        parsed = self.cache.get(epc, MISSING)
+        if parsed is not MISSING:
+            return parsed
+        parsed = self._decode(epc)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[epc] = parsed
+        return parsed
+
+    def decode_bytes(self, epc):
+        '''Like decode, for an EPC as raw bytes.'''
+        return self.decode(hexlify(bytes(bytearray(epc))))
+
+    def _decode(self, epc):
+        bits = len(epc) * 4
+        try:
+            value = int(epc, 16)
+        except ValueError:
+            return None
+        scheme = self.schemes.get(value >> (bits - 8)) if bits >= 8 else None
+        if scheme is None or bits < scheme.bits:
+            return None
+        # EPC memory is padded to a whole number of 16-bit words
+        return scheme.decode(value >> (bits - scheme.bits))
+
+
+Decoder.default = Decoder()
+
+
+def decode_epc(epc):
+    '''Given an EPC hex string, parse each field.
+    Returns a dictionary of the fields, or None if it is not a valid EPC.'''
+    return Decoder.default.decode(epc)
+
+
+def decode_epc_bytes(epc):
+    '''Like decode_epc, for an EPC as raw bytes.'''
+    return Decoder.default.decode_bytes(epc)
+
+
+def epc_to_uri(epc):
+    '''Given an EPC hex string, return its pure identity URI, or None if it
+    is not a valid EPC.'''
+    parsed = Decoder.default.decode(epc)
+    return parsed and parsed['uri']
+
+
+for _scheme in (
+        Scheme('sgtin-96', 0x30, 96, 'urn:epc:id:sgtin:',
+               (('company_prefix', None, DIGITS, None),
+                ('item_reference', None, DIGITS, None),
+                ('serial', 38, INTEGER, None)),
+               SGTIN_PARTITION_MAP),
+        Scheme('sscc-96', 0x31, 96, 'urn:epc:id:sscc:',
+               # 24 unallocated bits follow
+               (('company_prefix', None, DIGITS, None),
+                ('serial_reference', None, DIGITS, None)),
+               SSCC_PARTITION_MAP),
+        Scheme('sgln-96', 0x32, 96, 'urn:epc:id:sgln:',
+               (('company_prefix', None, DIGITS, None),
+                ('location_reference', None, DIGITS, None),
+                ('extension', 41, INTEGER, None)),
+               SGLN_PARTITION_MAP),
+        Scheme('grai-96', 0x33, 96, 'urn:epc:id:grai:',
+               (('company_prefix', None, DIGITS, None),
+                ('asset_type', None, DIGITS, None),
+                ('serial', 38, INTEGER, None)),
+               GRAI_PARTITION_MAP),
+        Scheme('giai-96', 0x34, 96, 'urn:epc:id:giai:',
+               (('company_prefix', None, DIGITS, None),
+                ('individual_asset_reference', None, INTEGER, None)),
+               GIAI_PARTITION_MAP),
+        Scheme('gid-96', 0x35, 96, 'urn:epc:id:gid:',
+               (('general_manager', 28, INTEGER, None),
+                ('object_class', 24, INTEGER, None),
+                ('serial', 36, INTEGER, None))),
+        Scheme('sgtin-198', 0x36, 198, 'urn:epc:id:sgtin:',
+               (('company_prefix', None, DIGITS, None),
+                ('item_reference', None, DIGITS, None),
+                ('serial', 140, STRING, None)),
+               SGTIN_PARTITION_MAP)):
+    register_scheme(_scheme)
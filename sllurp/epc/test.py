@@ -1,6 +1,8 @@
 import unittest
 import sgtin_96
 import gtin
+import tds
+import enrich
 import logging
 
 logLevel = logging.WARNING
@@ -55,5 +57,133 @@ class SGTIN_96_Tests(unittest.TestCase):
         self.assertEqual(sgtin_96.parse_sgtin_96_to_uri(epc), uri)
 
 
+class SGTIN_96_Batch_Tests(unittest.TestCase):
+    epcs = ["30204ed9496334000000006e",
+            "3074257bf7194e4000001a85",
+            "3034257bf400b7800004cb2f"]
+    invalid = ["e2003412012345678901abcd",  # not an SGTIN-96
+               "303fffffffffffffffffffff",  # bad partition
+               "300fffffffffffffffffffff"]  # company prefix too large
+
+    def check_batch(self, use_numpy):
+        epcs = self.epcs + self.invalid
+        # the same EPCs as raw bytes
+        epcs = epcs + [sgtin_96.epc_bytes(epc) for epc in epcs]
+        cols = sgtin_96.parse_sgtin_96_batch(epcs, use_numpy=use_numpy)
+        self.assertEqual(list(cols['valid']), [True] * 3 + [False] * 3 +
+                         [True] * 3 + [False] * 3)
+        for i, epc in zip((0, 1, 2, 6, 7, 8), self.epcs * 2):
+            parsed = sgtin_96.parse_sgtin_96(epc)
+            parsed['partition'] = int(parsed['partition'], 2)
+            for field in ('header', 'filter', 'partition', 'company_prefix',
+                          'item_reference', 'serial'):
+                self.assertEqual(cols[field][i], parsed[field])
+
+        uris = sgtin_96.sgtin_96_batch_to_uris(cols)
+        expected = [sgtin_96.parse_sgtin_96_to_uri(epc) for epc in self.epcs]
+        self.assertEqual(uris, expected + [None] * 3 + expected + [None] * 3)
+
+    def check_not_hex(self, use_numpy):
+        epcs = [self.epcs[0], 'zz' + self.epcs[0][2:]]
+        cols = sgtin_96.parse_sgtin_96_batch(epcs, use_numpy=use_numpy)
+        self.assertEqual(list(cols['valid']), [True, False])
+        self.assertEqual(sgtin_96.sgtin_96_batch_to_uris(cols)[1], None)
+
+    def test_batch(self):
+        self.check_batch(use_numpy=False)
+        self.check_not_hex(use_numpy=False)
+
+    @unittest.skipIf(sgtin_96.numpy is None, 'NumPy is not installed')
+    def test_batch_numpy(self):
+        self.check_batch(use_numpy=True)
+        self.check_not_hex(use_numpy=True)
+
+
+class TDS_Tests(unittest.TestCase):
+    # examples from the Tag Data Standard
+    uris = {
+        "3074257bf7194e4000001a85": "urn:epc:id:sgtin:0614141.812345.6789",
+        "3174257bf4499602d2000000": "urn:epc:id:sscc:0614141.1234567890",
+        "3274257bf46072000000162e": "urn:epc:id:sgln:0614141.12345.5678",
+        "331800b0c00f4c8000000001": "urn:epc:id:grai:000707.015666.1",
+        "3474257bf7194e4000001a85":
+            "urn:epc:id:giai:0614141.223295693316430469",
+        "35000001000001000000000a": "urn:epc:id:gid:16.16.10",
+        "3674257bf6b7a659b2c2bf100000000000000000000000000000":
+            "urn:epc:id:sgtin:0614141.712345.32a%2Fb",
+    }
+
+    def test_uris(self):
+        for epc, uri in self.uris.items():
+            self.assertEqual(tds.epc_to_uri(epc), uri)
+            self.assertEqual(tds.decode_epc_bytes(epc.decode('hex'))['uri'],
+                             uri)
+
+    def test_fields(self):
+        parsed = tds.decode_epc("3674257bf6b7a659b2c2bf100000000000000000000000000000")
+        self.assertEqual(parsed['scheme'], 'sgtin-198')
+        self.assertEqual(parsed['filter'], 3)
+        self.assertEqual(parsed['partition'], 5)
+        self.assertEqual(parsed['company_prefix'], '0614141')
+        self.assertEqual(parsed['item_reference'], '712345')
+        self.assertEqual(parsed['serial'], '32a/b')
+
+        epc = "30204ed9496334000000006e"
+        parsed = tds.decode_epc(epc)
+        expected = sgtin_96.parse_sgtin_96(epc)
+        expected['partition'] = int(expected['partition'], 2)
+        for field in expected:
+            self.assertEqual(parsed[field], expected[field])
+
+    def test_invalid(self):
+        for epc in ("", "zz", "30", "e2003412012345678901abcd",
+                    "3174257bf7194e4000001a85",  # serial reference too large
+                    "303fffffffffffffffffffff"):  # bad partition
+            self.assertIsNone(tds.decode_epc(epc))
+
+    def test_cache(self):
+        decoder = tds.Decoder(cache_size=2)
+        first = decoder.decode("3074257bf7194e4000001a85")
+        self.assertIs(decoder.decode("3074257bf7194e4000001a85"), first)
+        decoder.decode("3174257bf4499602d2000000")
+        decoder.decode("3274257bf46072000000162e")
+        self.assertEqual(len(decoder.cache), 1)
+
+
+class Enrich_Tests(unittest.TestCase):
+    sgtin = "30204ed9496334000000006e"
+    sscc = "3174257bf4499602d2000000"
+
+    def test_enrich(self):
+        enricher = enrich.EPCEnricher()
+        tags = [{'EPC-96': self.sgtin},
+                {'EPCData': {'EPC': self.sscc}},
+                {'EPC-96': "e2003412012345678901abcd"},
+                {'EPC-96': self.sgtin}]
+        enricher.enrich(tags)
+        ident = tags[0]['EPCIdentity']
+        self.assertEqual(ident['uri'], sgtin_96.parse_sgtin_96_to_uri(self.sgtin))
+        self.assertEqual(ident['gtin'], "00846632286210")
+        self.assertEqual(tags[1]['EPCIdentity']['uri'],
+                         "urn:epc:id:sscc:0614141.1234567890")
+        self.assertIsNone(tags[2]['EPCIdentity'])
+        self.assertIs(tags[3]['EPCIdentity'], ident)
+        self.assertEqual(enricher.stats(), {'size': 3, 'hits': 1,
+                                            'misses': 3, 'evictions': 0})
+
+    def test_lru(self):
+        enricher = enrich.EPCEnricher(maxsize=2)
+        sgtin, sscc = self.sgtin.decode('hex'), self.sscc.decode('hex')
+        other = "3274257bf46072000000162e".decode('hex')
+        enricher.lookup_batch([sgtin, sscc, sgtin, other])
+        # sscc was the least recently seen
+        self.assertEqual(enricher.evictions, 1)
+        enricher.lookup(sgtin)
+        self.assertEqual(enricher.hits, 2)
+        enricher.lookup(sscc)
+        self.assertEqual(enricher.misses, 4)
+        self.assertEqual(len(enricher), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
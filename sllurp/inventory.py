@@ -6,6 +6,8 @@ import time
 from twisted.internet import reactor, defer
 
 import sllurp.llrp as llrp
+from sllurp.capture import CaptureWriter
+from sllurp.supervisor import LLRPSupervisor
 from sllurp.llrp_proto import Modulation_Name2Type, DEFAULT_MODULATION, \
     Modulation_DefaultTari
 
@@ -95,7 +97,15 @@ def parse_args():
     parser.add_argument('-r', '--reconnect', action='store_true',
                         default=False,
                         help='reconnect on connection failure or loss')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='spread readers over this many worker processes'
+                        ' (default 0=connect from this process)')
+    parser.add_argument('-c', '--capture',
+                        help='record all LLRP traffic to this capture file'
+                        ' (see sllurp.capture)')
     args = parser.parse_args()
+    if args.capture and args.workers:
+        parser.error('--capture cannot be combined with --workers')
 
 
 def init_logging():
@@ -139,37 +149,49 @@ def main():
     d = defer.Deferred()
     d.addCallback(finish)
 
-    fac = llrp.LLRPClientFactory(onFinish=d,
-                                 duration=args.time,
-                                 report_every_n_tags=args.every_n,
-                                 antennas=enabled_antennas,
-                                 tx_power=args.tx_power,
-                                 modulation=args.modulation,
-                                 tari=args.tari,
-                                 session=args.session,
-                                 tag_population=args.population,
-                                 start_inventory=True,
-                                 disconnect_when_done=(args.time > 0),
-                                 reconnect=args.reconnect,
-                                 tag_content_selector={
-                                     'EnableROSpecID': False,
-                                     'EnableSpecIndex': False,
-                                     'EnableInventoryParameterSpecID': False,
-                                     'EnableAntennaID': True,
-                                     'EnableChannelIndex': False,
-                                     'EnablePeakRRSI': True,
-                                     'EnableFirstSeenTimestamp': False,
-                                     'EnableLastSeenTimestamp': True,
-                                     'EnableTagSeenCount': True,
-                                     'EnableAccessSpecID': False
-                                 })
+    factory_args = dict(duration=args.time,
+                        report_every_n_tags=args.every_n,
+                        antennas=enabled_antennas,
+                        tx_power=args.tx_power,
+                        modulation=args.modulation,
+                        tari=args.tari,
+                        session=args.session,
+                        tag_population=args.population,
+                        start_inventory=True,
+                        disconnect_when_done=(args.time > 0),
+                        reconnect=args.reconnect,
+                        tag_content_selector={
+                            'EnableROSpecID': False,
+                            'EnableSpecIndex': False,
+                            'EnableInventoryParameterSpecID': False,
+                            'EnableAntennaID': True,
+                            'EnableChannelIndex': False,
+                            'EnablePeakRRSI': True,
+                            'EnableFirstSeenTimestamp': False,
+                            'EnableLastSeenTimestamp': True,
+                            'EnableTagSeenCount': True,
+                            'EnableAccessSpecID': False
+                        })
+    if args.capture:
+        capture = CaptureWriter(args.capture)
+        factory_args['capture'] = capture
+        reactor.addSystemEventTrigger('after', 'shutdown', capture.close)
+
+    if args.workers:
+        fac = LLRPSupervisor(args.host, port=args.port, workers=args.workers,
+                             onFinish=d, **factory_args)
+    else:
+        fac = llrp.LLRPClientFactory(onFinish=d, **factory_args)
 
     # tagReportCallback will be called every time the reader sends a TagReport
     # message (i.e., when it has "seen" tags).
     fac.addTagReportCallback(tagReportCallback)
 
-    for host in args.host:
-        reactor.connectTCP(host, args.port, fac, timeout=3)
+    if args.workers:
+        fac.start()
+    else:
+        for host in args.host:
+            reactor.connectTCP(host, args.port, fac, timeout=3)
 
     # catch ctrl-C and stop inventory before disconnecting
     reactor.addSystemEventTrigger('before', 'shutdown', politeShutdown, fac)
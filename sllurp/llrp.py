@@ -1,14 +1,21 @@
 from __future__ import print_function
 from collections import defaultdict
-import time
+from functools import partial
 import logging
 import pprint
+import random
 import struct
+from timeit import default_timer as timer
 from llrp_proto import LLRPROSpec, LLRPError, TLV_struct, TV_struct, \
     TLV_Type2Name, TV_Type2Name, Capability_Name2Type, AirProtocol, \
-    llrp_data2xml, LLRPMessageDict, Modulation_Name2Type, \
-    DEFAULT_MODULATION
+    llrp_data2xml, write_llrp_xml, write_llrp_jsonl, LLRPMessageDict, \
+    Modulation_Name2Type, DEFAULT_MODULATION, TagReportDataDecoder, \
+    decode_ROAccessReport, decode_ROAccessReport_columnar
 from binascii import hexlify
+from dispatch import DispatchQueue, ThreadedDispatcher
+from llrp_errors import LLRPResponseError
+from llrp_framer import LLRPFramer
+from metrics import ClientMetrics
 from util import BITMASK
 from twisted.internet import reactor, task, defer
 from twisted.internet.protocol import ClientFactory
@@ -16,6 +23,9 @@ from twisted.protocols.basic import LineReceiver
 
 LLRP_PORT = 5084
 
+# the message ID, after the Ver/Type and length of a message header
+msgid_struct = struct.Struct('!I')
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,13 +34,31 @@ class LLRPMessage(object):
     hdr_len = struct.calcsize(hdr_fmt)  # == 6 bytes
     full_hdr_fmt = hdr_fmt + 'I'
     full_hdr_len = struct.calcsize(full_hdr_fmt)  # == 10 bytes
-    msgdict = None
+    full_hdr = struct.Struct(full_hdr_fmt)
     msgbytes = None
-
-    def __init__(self, msgdict=None, msgbytes=None):
+    _msgdict = None
+    _undecoded = False  # msgbytes still waiting for a lazy deserialize()
+    decode_seconds = None  # time deserialize() took, once it has run
+
+    # header fields, filled in by serialize() or parseHeader()
+    name = None
+    ver = None
+    msgtype = None
+    msgid = None
+
+    def __init__(self, msgdict=None, msgbytes=None, decoders=None,
+                 lazy=False):
+        """decoders optionally maps message names to decoders that replace
+        the ones in TLV_struct (e.g., a TagReportDataDecoder-backed
+        RO_ACCESS_REPORT decoder).
+
+        With lazy=True, a message built from bytes only parses its header
+        up front; the body is decoded on first access to msgdict (or
+        anything that needs it, like isSuccess() or getParameter())."""
         if not (msgdict or msgbytes):
             raise LLRPError('Provide either a message dict or a sequence'
                             ' of bytes.')
+        self.decoders = decoders
         if msgdict:
             self.msgdict = LLRPMessageDict(msgdict)
             if not msgbytes:
@@ -38,9 +66,23 @@ class LLRPMessage(object):
         if msgbytes:
             self.msgbytes = msgbytes
             if not msgdict:
-                self.deserialize()
+                self.parseHeader()
+                self._undecoded = True
+                if not lazy:
+                    self.deserialize()
         self.peername = None
 
+    @property
+    def msgdict(self):
+        if self._undecoded:
+            self.deserialize()
+        return self._msgdict
+
+    @msgdict.setter
+    def msgdict(self, msgdict):
+        self._msgdict = msgdict
+        self._undecoded = False
+
     def serialize(self):
         if self.msgdict is None:
             raise LLRPError('No message dict to serialize.')
@@ -55,21 +97,23 @@ class LLRPMessage(object):
             raise LLRPError('Cannot find encoder for message type '
                             '{}'.format(name))
         data = encoder(self.msgdict[name])
-        self.msgbytes = struct.pack(self.full_hdr_fmt,
-                                    (ver << 10) | msgtype,
-                                    len(data) + self.full_hdr_len,
-                                    msgid) + data
+        self.msgbytes = self.full_hdr.pack((ver << 10) | msgtype,
+                                           len(data) + self.full_hdr_len,
+                                           msgid) + data
+        self.name, self.ver, self.msgtype, self.msgid = \
+            name, ver, msgtype, msgid
         logger.debug('serialized bytes: %s', hexlify(self.msgbytes))
         logger.debug('done serializing %s command', name)
 
-    def deserialize(self):
-        """Turns a sequence of bytes into a message dictionary."""
+    def parseHeader(self):
+        """Read name, version, type and ID from the message header without
+        touching the body."""
         if self.msgbytes is None:
             raise LLRPError('No message bytes to deserialize.')
-        data = ''.join(self.msgbytes)
+        if not isinstance(self.msgbytes, str):
+            self.msgbytes = ''.join(self.msgbytes)
 
-        msgtype, length, msgid = struct.unpack(self.full_hdr_fmt,
-                                               data[:self.full_hdr_len])
+        msgtype, length, msgid = self.full_hdr.unpack_from(self.msgbytes)
 
         TV_encoding = msgtype >> 15  # Check encoding before deserialization
         ver = (msgtype >> 10) & BITMASK(3)
@@ -78,29 +122,49 @@ class LLRPMessage(object):
         try:
             if TV_encoding:
                 name = TV_Type2Name[msgtype]
-                logger.debug('deserializing %s command (TV encoded)', name)
-                decoder = TV_struct[name]['decode']
+                self._decoder = TV_struct[name]['decode']
             else:
                 name = TLV_Type2Name[msgtype]
-                logger.debug('deserializing %s command (TLV encoded)', name)
-                decoder = TLV_struct[name]['decode']
+                self._decoder = TLV_struct[name]['decode']
         except KeyError:
             raise LLRPError('Cannot find decoder for message type '
                             '{}'.format(msgtype))
-        body = data[self.full_hdr_len:length]
+        if self.decoders and name in self.decoders:
+            self._decoder = self.decoders[name]
+        self.name, self.ver, self.msgtype, self.msgid = \
+            name, ver, msgtype, msgid
+        self.length = length
+
+    def deserialize(self):
+        """Turns a sequence of bytes into a message dictionary."""
+        if self.name is None:
+            self.parseHeader()
+        name = self.name
+        logger.debug('deserializing %s command', name)
+        body = self.msgbytes[self.full_hdr_len:self.length]
+        start = timer()
         try:
-            self.msgdict = {
-                name: dict(decoder(body))
-            }
-            self.msgdict[name]['Ver'] = ver
-            self.msgdict[name]['Type'] = msgtype
-            self.msgdict[name]['ID'] = msgid
+            body = dict(self._decoder(body))
+            body['Ver'] = self.ver
+            body['Type'] = self.msgtype
+            body['ID'] = self.msgid
+            self._msgdict = {name: body}
             logger.debug('done deserializing %s command', name)
         except LLRPError:
             logger.exception('Problem with %s message format', name)
-            return ''
+        # only now: another thread that sees _undecoded cleared must also
+        # see _msgdict
+        self._undecoded = False
+        self.decode_seconds = timer() - start
         return ''
 
+    def getParameter(self, param, default=None):
+        """Return one top-level parameter of the message body (decoding the
+        body first if that has not happened yet)."""
+        if not self.msgdict:
+            return default
+        return self.msgdict[self.getName()].get(param, default)
+
     def isSuccess(self):
         if not self.msgdict:
             return False
@@ -118,10 +182,22 @@ class LLRPMessage(object):
             return False
 
     def getName(self):
+        if self.name is not None:
+            return self.name
         if not self.msgdict:
             return None
         return self.msgdict.keys()[0]
 
+    def writeXML(self, fp):
+        """Write the message as XML (as repr() renders it) to the
+        file-like object fp."""
+        write_llrp_xml(self.msgdict, fp)
+
+    def writeJSON(self, fp):
+        """Write the message to the file-like object fp as a line of
+        JSON."""
+        write_llrp_jsonl(self.msgdict, fp)
+
     def __repr__(self):
         try:
             ret = llrp_data2xml(self.msgdict)
@@ -131,35 +207,156 @@ class LLRPMessage(object):
         return ret
 
 
+class ClientState(int):
+    """One of the LLRPClient.STATE_*: an int that knows its name."""
+
+    def __new__(cls, value, name):
+        self = int.__new__(cls, value)
+        self.name = name
+        return self
+
+    def __repr__(self):
+        return self.name
+
+    __str__ = __repr__
+
+    def __reduce__(self):
+        return ClientState, (int(self), self.name)
+
+
 class LLRPClient(LineReceiver):
-    STATE_DISCONNECTED = 1
-    STATE_CONNECTING = 2
-    STATE_CONNECTED = 3
-    STATE_SENT_ADD_ROSPEC = 4
-    STATE_SENT_ENABLE_ROSPEC = 5
-    STATE_INVENTORYING = 6
-    STATE_SENT_DELETE_ROSPEC = 7
-    STATE_SENT_DELETE_ACCESSSPEC = 8
-    STATE_SENT_GET_CAPABILITIES = 9
-    STATE_PAUSING = 10
-    STATE_PAUSED = 11
-    STATE_SENT_READER_CONFIG = 12
-    STATE_SENT_ENABLE_EVENTS_AND_REPORTS = 13
-    STATE_SENT_START_ROSPEC = 14
+    STATE_DISCONNECTED = ClientState(1, 'STATE_DISCONNECTED')
+    STATE_CONNECTING = ClientState(2, 'STATE_CONNECTING')
+    STATE_CONNECTED = ClientState(3, 'STATE_CONNECTED')
+    STATE_SENT_ADD_ROSPEC = ClientState(4, 'STATE_SENT_ADD_ROSPEC')
+    STATE_SENT_ENABLE_ROSPEC = ClientState(5, 'STATE_SENT_ENABLE_ROSPEC')
+    STATE_INVENTORYING = ClientState(6, 'STATE_INVENTORYING')
+    STATE_SENT_DELETE_ROSPEC = ClientState(7, 'STATE_SENT_DELETE_ROSPEC')
+    STATE_SENT_DELETE_ACCESSSPEC = ClientState(
+        8, 'STATE_SENT_DELETE_ACCESSSPEC')
+    STATE_SENT_GET_CAPABILITIES = ClientState(
+        9, 'STATE_SENT_GET_CAPABILITIES')
+    STATE_PAUSING = ClientState(10, 'STATE_PAUSING')
+    STATE_PAUSED = ClientState(11, 'STATE_PAUSED')
+    STATE_SENT_READER_CONFIG = ClientState(12, 'STATE_SENT_READER_CONFIG')
+    STATE_SENT_ENABLE_EVENTS_AND_REPORTS = ClientState(
+        13, 'STATE_SENT_ENABLE_EVENTS_AND_REPORTS')
+    STATE_SENT_START_ROSPEC = ClientState(14, 'STATE_SENT_START_ROSPEC')
+
+    # state -> the states setState() expects to change it to.  Staying in a
+    # state is always fine, and stopPolitely(), pause(force=True) and
+    # startInventory() may be called in (nearly) any state.
+    _STOP = (STATE_SENT_DELETE_ACCESSSPEC, STATE_PAUSING)
+    _START = (STATE_SENT_ADD_ROSPEC, STATE_SENT_START_ROSPEC)
+    TRANSITIONS = {
+        STATE_DISCONNECTED: _STOP + _START + (
+            STATE_CONNECTING, STATE_CONNECTED, STATE_SENT_GET_CAPABILITIES),
+        STATE_CONNECTING: _STOP + _START + (
+            STATE_CONNECTED, STATE_SENT_GET_CAPABILITIES),
+        STATE_CONNECTED: _STOP + _START + (STATE_SENT_GET_CAPABILITIES,),
+        STATE_SENT_GET_CAPABILITIES: _STOP + _START + (
+            STATE_SENT_READER_CONFIG,),
+        STATE_SENT_READER_CONFIG: _STOP + _START + (STATE_CONNECTED,),
+        STATE_SENT_ADD_ROSPEC: _STOP + _START + (STATE_SENT_ENABLE_ROSPEC,),
+        STATE_SENT_ENABLE_ROSPEC: _STOP + _START + (
+            STATE_SENT_START_ROSPEC, STATE_INVENTORYING),
+        STATE_SENT_START_ROSPEC: _STOP + _START + (STATE_INVENTORYING,),
+        STATE_SENT_ENABLE_EVENTS_AND_REPORTS: _STOP + _START + (
+            STATE_INVENTORYING,),
+        STATE_INVENTORYING: _STOP,
+        STATE_PAUSING: _STOP + _START + (STATE_PAUSED,),
+        STATE_PAUSED: _STOP + _START + (STATE_SENT_ENABLE_ROSPEC,),
+        STATE_SENT_DELETE_ACCESSSPEC: _STOP + _START + (
+            STATE_SENT_DELETE_ROSPEC,),
+        STATE_SENT_DELETE_ROSPEC: _STOP + _START + (
+            STATE_CONNECTED, STATE_DISCONNECTED),
+    }
+    TRANSITIONS = dict((st, frozenset(to + (st,)))
+                       for st, to in TRANSITIONS.items())
+    del _STOP, _START
+
+    # (state, message name) -> (method, extra arguments...) that handles the
+    # message in that state; see handleMessage()
+    _INVENTORY_MESSAGES = ('RO_ACCESS_REPORT', 'READER_EVENT_NOTIFICATION',
+                           'ADD_ACCESSSPEC_RESPONSE',
+                           'ENABLE_ACCESSSPEC_RESPONSE',
+                           'DISABLE_ACCESSSPEC_RESPONSE',
+                           'DELETE_ACCESSSPEC_RESPONSE')
+    MESSAGE_HANDLERS = {
+        (STATE_DISCONNECTED, 'READER_EVENT_NOTIFICATION'):
+            ('_handleConnectionEvent',),
+        (STATE_CONNECTING, 'READER_EVENT_NOTIFICATION'):
+            ('_handleConnectionEvent',),
+        (STATE_CONNECTED, 'READER_EVENT_NOTIFICATION'):
+            ('_handleConnectionEvent',),
+        (STATE_SENT_GET_CAPABILITIES, 'GET_READER_CAPABILITIES_RESPONSE'):
+            ('_handleCapabilities',),
+        (STATE_SENT_READER_CONFIG, 'SET_READER_CONFIG_RESPONSE'):
+            ('_handleReaderConfig',),
+        # (..., what failed, whether to stop on failure)
+        (STATE_SENT_ADD_ROSPEC, 'ADD_ROSPEC_RESPONSE'):
+            ('_handleResponse', 'adding ROSpec', True),
+        (STATE_PAUSING, 'DISABLE_ROSPEC_RESPONSE'):
+            ('_handleResponse', 'disabling ROSpec', False),
+        (STATE_SENT_ENABLE_ROSPEC, 'ENABLE_ROSPEC_RESPONSE'):
+            ('_handleResponse', 'enabling ROSpec', True),
+        (STATE_SENT_START_ROSPEC, 'START_ROSPEC_RESPONSE'):
+            ('_handleResponse', 'starting ROSpec', True),
+        (STATE_SENT_DELETE_ACCESSSPEC, 'DELETE_ACCESSSPEC_RESPONSE'):
+            ('_handleResponse', None, False),
+        (STATE_SENT_DELETE_ROSPEC, 'DELETE_ROSPEC_RESPONSE'):
+            ('_handleDeleteROSpec',),
+    }
+    for _name in _INVENTORY_MESSAGES:
+        MESSAGE_HANDLERS[STATE_INVENTORYING, _name] = \
+            ('_handleInventoryMessage',)
+    # tag reports that arrive after inventory stopped are dropped undecoded
+    for _state in TRANSITIONS:
+        if _state != STATE_INVENTORYING:
+            MESSAGE_HANDLERS[_state, 'RO_ACCESS_REPORT'] = ('_ignoreReport',)
+    del _INVENTORY_MESSAGES, _name, _state
+
+    # state -> (error logged for any other message, name of the message to
+    # handle it as anyway, or None to drop it).  Other messages in states
+    # missing here are dropped with a warning.
+    UNEXPECTED_MESSAGES = {
+        STATE_DISCONNECTED: ('unexpected message %s while connecting', None),
+        STATE_CONNECTING: ('unexpected message %s while connecting', None),
+        STATE_CONNECTED: ('unexpected message %s while connecting', None),
+        STATE_SENT_GET_CAPABILITIES:
+            ('unexpected response %s when getting capabilities', None),
+        STATE_SENT_READER_CONFIG:
+            ('unexpected response %s when getting reader cfg', None),
+        STATE_SENT_ADD_ROSPEC:
+            ('unexpected response %s when adding ROSpec', None),
+        STATE_PAUSING: ('unexpected response %s when disabling ROSpec',
+                        'DISABLE_ROSPEC_RESPONSE'),
+        STATE_SENT_ENABLE_ROSPEC: ('unexpected response %s when enabling'
+                                   ' ROSpec', 'ENABLE_ROSPEC_RESPONSE'),
+        STATE_SENT_START_ROSPEC: ('unexpected response %s when starting'
+                                  ' ROSpec', 'START_ROSPEC_RESPONSE'),
+        STATE_INVENTORYING: ('unexpected message %s while inventorying',
+                             None),
+        STATE_SENT_DELETE_ACCESSSPEC:
+            ('unexpected response %s when deleting AccessSpec',
+             'DELETE_ACCESSSPEC_RESPONSE'),
+        STATE_SENT_DELETE_ROSPEC: ('unexpected response %s when deleting'
+                                   ' ROSpec', 'DELETE_ROSPEC_RESPONSE'),
+    }
+
+    # state number -> ClientState
+    STATES = dict((int(st), st) for st in TRANSITIONS)
+    _state_list = sorted((st.name, st) for st in STATES.values())
 
     @classmethod
     def getStates(_):
-        state_names = [st for st in dir(LLRPClient) if st.startswith('STATE_')]
-        for state_name in state_names:
-            state_num = getattr(LLRPClient, state_name)
-            yield state_name, state_num
+        return iter(LLRPClient._state_list)
 
     @classmethod
     def getStateName(_, state):
         try:
-            return [st_name for st_name, st_num in LLRPClient.getStates()
-                    if st_num == state][0]
-        except IndexError:
+            return LLRPClient.STATES[state].name
+        except KeyError:
             raise LLRPError('unknown state {}'.format(state))
 
     def __init__(self, factory, duration=None, report_every_n_tags=None,
@@ -167,7 +364,20 @@ class LLRPClient(LineReceiver):
                  tari=0, start_inventory=True, reset_on_connect=True,
                  disconnect_when_done=True,
                  tag_content_selector={},
-                 session=2, tag_population=4):
+                 session=2, tag_population=4, columnar_reports=False,
+                 pipeline=False, request_timeout=None,
+                 dispatch_queue_size=None, dispatch_overflow='block',
+                 capture=None, metrics=True, clock=reactor):
+        """With pipeline=True, startInventory() and startAccess() send all
+        of their requests back to back (see sendRequests()) instead of
+        waiting for each response before sending the next request.
+        request_timeout is the default number of seconds sendRequest() waits
+        for a response (None waits forever).  With dispatch_queue_size,
+        message callbacks are called through a DispatchQueue of that size
+        with the dispatch_overflow policy (see sllurp.dispatch).  capture
+        is a sllurp.capture.CaptureWriter to record every message sent and
+        received to.  With metrics=False, the client keeps no
+        sllurp.metrics.ClientMetrics."""
         self.factory = factory
         self.setRawMode()
         self.state = LLRPClient.STATE_DISCONNECTED
@@ -189,14 +399,34 @@ class LLRPClient(LineReceiver):
             logger.info('will reset reader state on connect')
         self.disconnect_when_done = disconnect_when_done
         self.tag_content_selector = tag_content_selector
+        self.columnar_reports = columnar_reports
+        self.pipeline = pipeline
+        self.request_timeout = request_timeout
+        self.clock = clock
+        self.capture = capture
+        self.metrics = None
+        if metrics:
+            self.metrics = ClientMetrics(clock, dict(
+                (num, num.name) for num in LLRPClient.STATES.values()))
+            self.metrics.entered(self.state)
+        # (ROSpec, bytes of an ADD_ROSPEC for it with ID 0); see
+        # encodeAddROSpec()
+        self._add_rospec = None
         if self.start_inventory:
             logger.info('will start inventory on connect')
 
         logger.info('using antennas: %s', self.antennas)
 
-        # for partial data transfers
-        self.expectingRemainingBytes = 0
-        self.partialData = ''
+        # splits the incoming byte stream into LLRP messages
+        self.framer = LLRPFramer()
+
+        # per-connection decoder overrides passed to LLRPMessage; see
+        # compileDecoders()
+        self.decoders = {}
+        self.tag_decoder = None
+        if self.columnar_reports:
+            # TagReportData arrives as a TagReportBatch
+            self.decoders['RO_ACCESS_REPORT'] = decode_ROAccessReport_columnar
 
         # state-change callbacks: STATE_* -> [list of callables]
         self._state_callbacks = {}
@@ -207,9 +437,37 @@ class LLRPClient(LineReceiver):
         # msg_name -> [list of callables]
         self._message_callbacks = defaultdict(list)
 
+        # optional queue between decoding and the message callbacks
+        self.dispatch = None
+        if dispatch_queue_size:
+            self.dispatch = DispatchQueue(self._message_callbacks,
+                                          dispatch_queue_size,
+                                          dispatch_overflow)
+
         # Deferreds to fire during state machine machinations
         self._deferreds = defaultdict(list)
 
+        # the state machine, bound to this client once rather than looked up
+        # for every message: (state, msg_name) -> handler, and state ->
+        # handler of other messages
+        self._handlers = {}
+        for key, spec in self.MESSAGE_HANDLERS.items():
+            handler = getattr(self, spec[0])
+            if len(spec) > 1:
+                handler = partial(handler, *spec[1:])
+            self._handlers[key] = handler
+        self._unexpected = {}
+        for state, (error, msgName) in self.UNEXPECTED_MESSAGES.items():
+            self._unexpected[state] = partial(
+                self._unexpectedMessage, error,
+                self._handlers.get((state, msgName)))
+
+        # requests awaiting a response, matched by message ID:
+        # msgid -> (request name, Deferred, IDelayedCall of the timeout or
+        # None); see sendRequest()
+        self._pending = {}
+        self._next_msgid = 1
+
         self.disconnecting = False
         self.rospec = None
 
@@ -232,17 +490,37 @@ class LLRPClient(LineReceiver):
         logger.info('connected to %s (%s:%s)', self.peername, self.peer_ip,
                     self.peer_port)
         self.factory.protocols.add(self)
+        self.factory.resetDelay(t.connector)
+        if self.metrics is not None:
+            # carry on counting where the last connection to the reader left
+            self.metrics = self.factory.metricsFor(self.peername,
+                                                   self.metrics)
+            self.metrics.connected()
+            self.metrics.entered(self.state)
+        if self.dispatch is not None:
+            self.dispatch.producer = t
 
     def setState(self, newstate, onComplete=None):
-        assert newstate is not None
-        logger.debug('state change: %s -> %s',
-                     LLRPClient.getStateName(self.state),
-                     LLRPClient.getStateName(newstate))
+        try:
+            newstate = LLRPClient.STATES[newstate]
+        except KeyError:
+            raise LLRPError('unknown state {}'.format(newstate))
+        oldstate = self.state
+        if newstate in LLRPClient.TRANSITIONS.get(oldstate, ()):
+            logger.debug('state change: %s -> %s', oldstate, newstate)
+        else:
+            logger.warning('unexpected state change: %s -> %s', oldstate,
+                           newstate)
 
+        start = timer()
         self.state = newstate
+        if self.metrics is not None:
+            self.metrics.entered(newstate)
 
         for fn in self._state_callbacks[newstate]:
             fn(self)
+        if self.metrics is not None:
+            self.metrics.transitioned(oldstate, newstate, timer() - start)
 
     def _setState_wrapper(self, _, *args, **kwargs):
         """Version of setState suitable for calling via a Deferred callback.
@@ -251,6 +529,14 @@ class LLRPClient(LineReceiver):
 
     def connectionLost(self, reason):
         self.factory.protocols.remove(self)
+        if self.metrics is not None:
+            self.metrics.entered(LLRPClient.STATE_DISCONNECTED)
+        pending, self._pending = self._pending, {}
+        for msgid, (name, d, timeout_call) in pending.items():
+            if timeout_call is not None and timeout_call.active():
+                timeout_call.cancel()
+            d.errback(LLRPError('connection lost before response to {}'
+                                ' (ID {})'.format(name, msgid)))
 
     def parseCapabilities(self, capdict):
         def find_p(p, arr):
@@ -326,277 +612,252 @@ class LLRPClient(LineReceiver):
         del self._deferreds[msgName]
 
     def handleMessage(self, lmsg):
-        """Implements the LLRP client state machine."""
+        """Implements the LLRP client state machine.
+
+        Dispatch only looks at the message header; lmsg's body is decoded
+        when a callback or the state machine first needs it."""
         logger.debug('LLRPMessage received in state %s: %s', self.state, lmsg)
         msgName = lmsg.getName()
         lmsg.peername = self.peername
 
         # call per-message callbacks
-        logger.debug('starting message callbacks for %s', msgName)
-        for fn in self._message_callbacks[msgName]:
-            fn(lmsg)
-        logger.debug('done with message callbacks for %s', msgName)
+        if self.dispatch is not None:
+            self.dispatch.put(lmsg)
+        else:
+            logger.debug('starting message callbacks for %s', msgName)
+            callbacks = self._message_callbacks[msgName]
+            start = timer()
+            for fn in callbacks:
+                fn(lmsg)
+            if callbacks and self.metrics is not None:
+                self.metrics.callbacks(msgName, timer() - start)
+            logger.debug('done with message callbacks for %s', msgName)
 
         # keepalives can occur at any time
         if msgName == 'KEEPALIVE':
             self.send_KEEPALIVE_ACK()
             return
 
-        if msgName == 'RO_ACCESS_REPORT' and \
-                self.state != LLRPClient.STATE_INVENTORYING:
-            logger.debug('ignoring RO_ACCESS_REPORT because not inventorying')
+        # responses to requests made with sendRequest() bypass the state
+        # machine
+        if self._pending and self.resolveRequest(lmsg):
             return
 
-        logger.debug('in handleMessage(%s), there are %d Deferreds',
-                     msgName, len(self._deferreds[msgName]))
-
-        #######
-        # LLRP client state machine follows.  Beware: gets thorny.  Note the
-        # order of the LLRPClient.STATE_* fields.
-        #######
-
-        # in DISCONNECTED, CONNECTING, and CONNECTED states, expect only
-        # READER_EVENT_NOTIFICATION messages.
-        if self.state in (LLRPClient.STATE_DISCONNECTED,
-                          LLRPClient.STATE_CONNECTING,
-                          LLRPClient.STATE_CONNECTED):
-            if msgName != 'READER_EVENT_NOTIFICATION':
-                logger.error('unexpected message %s while connecting', msgName)
-                return
+        handler = self._handlers.get((self.state, msgName))
+        if handler is None:
+            handler = self._unexpected.get(self.state, self._ignoreMessage)
 
-            if not lmsg.isSuccess():
-                try:
-                    status = lmsg.msgdict[msgName]\
-                        ['ReaderEventNotificationData']\
-                        ['ConnectionAttemptEvent']['Status']
-                except KeyError:
-                    status = '(unknown status)'
-                logger.fatal('Could not start session on reader: %s', status)
-                return
+        if msgName != 'RO_ACCESS_REPORT' and lmsg.msgdict is None:
+            logger.error('could not decode %s; ignoring it', msgName)
+            return
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
+        handler(msgName, lmsg)
 
-            # a Deferred to call when we get GET_READER_CAPABILITIES_RESPONSE
-            d = defer.Deferred()
-            d.addCallback(self._setState_wrapper, LLRPClient.STATE_SENT_READER_CONFIG)
-            d.addErrback(self.panic, 'GET_READER_CAPABILITIES failed')
-            self.send_GET_READER_CAPABILITIES(onCompletion=d)
-
-        # in state SENT_GET_CAPABILITIES, expect only GET_CAPABILITIES_RESPONSE;
-        # respond to this message by advancing to state CONNECTED.
-        elif self.state == LLRPClient.STATE_SENT_GET_CAPABILITIES:
-            if msgName != 'GET_READER_CAPABILITIES_RESPONSE':
-                logger.error('unexpected response %s when getting capabilities',
-                             msgName)
-                return
+    # Message handlers of the state machine; see MESSAGE_HANDLERS and
+    # UNEXPECTED_MESSAGES.  Each takes the message name and the LLRPMessage.
 
-            if not lmsg.isSuccess():
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.fatal('Error %s getting capabilities: %s', status, err)
-                return
+    def _logFailure(self, msgName, lmsg, what, level=logging.CRITICAL):
+        status = lmsg.msgdict[msgName].get('LLRPStatus', {})
+        logger.log(level, 'Error %s %s: %s',
+                   status.get('StatusCode', '(unknown status)'), what,
+                   status.get('ErrorDescription', ''))
 
-            self.capabilities = lmsg.msgdict['GET_READER_CAPABILITIES_RESPONSE']
-            logger.debug('Capabilities: %s', pprint.pformat(self.capabilities))
+    def _handleConnectionEvent(self, msgName, lmsg):
+        if not lmsg.isSuccess():
             try:
-                self.parseCapabilities(self.capabilities)
-            except LLRPError as err:
-                logger.exception('Capabilities mismatch')
-                raise err
-
-            self.processDeferreds(msgName, lmsg.isSuccess())
-
-            # a Deferred to call when we get GET_READER_CAPABILITIES_RESPONSE
-            d = defer.Deferred()
-            d.addCallback(self._setState_wrapper, LLRPClient.STATE_CONNECTED)
-            d.addErrback(self.panic, 'SET_READER_CONFIG failed')
-            self.send_READER_CONFIG(onCompletion=d)
-
-        elif self.state == LLRPClient.STATE_SENT_READER_CONFIG:
-            if msgName != 'SET_READER_CONFIG_RESPONSE':
-                logger.error('unexpected response %s when getting reader cfg',
-                             msgName)
-                return
+                status = lmsg.msgdict[msgName]\
+                    ['ReaderEventNotificationData']\
+                    ['ConnectionAttemptEvent']['Status']
+            except KeyError:
+                status = '(unknown status)'
+            logger.fatal('Could not start session on reader: %s', status)
+            return
 
-            if not lmsg.isSuccess():
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.fatal('Error %s getting capabilities: %s', status, err)
-                return
+        self.processDeferreds(msgName, True)
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
+        # a Deferred to call when we get GET_READER_CAPABILITIES_RESPONSE
+        d = defer.Deferred()
+        d.addCallback(self._setState_wrapper,
+                      LLRPClient.STATE_SENT_READER_CONFIG)
+        d.addErrback(self.panic, 'GET_READER_CAPABILITIES failed')
+        self.send_GET_READER_CAPABILITIES(onCompletion=d)
+
+    def _handleCapabilities(self, msgName, lmsg):
+        if not lmsg.isSuccess():
+            self._logFailure(msgName, lmsg, 'getting capabilities')
+            return
 
-            if self.reset_on_connect:
-                d = self.stopPolitely(disconnect=False)
-                if self.start_inventory:
-                    d.addCallback(self.startInventory)
-            elif self.start_inventory:
-                self.startInventory()
-
-        # in state SENT_ADD_ROSPEC, expect only ADD_ROSPEC_RESPONSE; respond to
-        # favorable ADD_ROSPEC_RESPONSE by enabling the added ROSpec and
-        # advancing to state SENT_ENABLE_ROSPEC.
-        elif self.state == LLRPClient.STATE_SENT_ADD_ROSPEC:
-            if msgName != 'ADD_ROSPEC_RESPONSE':
-                logger.error('unexpected response %s when adding ROSpec',
-                             msgName)
-                return
+        self.capabilities = lmsg.msgdict[msgName]
+        logger.debug('Capabilities: %s', pprint.pformat(self.capabilities))
+        try:
+            self.parseCapabilities(self.capabilities)
+        except LLRPError as err:
+            logger.exception('Capabilities mismatch')
+            raise err
 
-            if not lmsg.isSuccess():
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.fatal('Error %s adding ROSpec: %s', status, err)
-                return
+        self.processDeferreds(msgName, True)
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
+        # a Deferred to call when we get SET_READER_CONFIG_RESPONSE
+        d = defer.Deferred()
+        d.addCallback(self._setState_wrapper, LLRPClient.STATE_CONNECTED)
+        d.addErrback(self.panic, 'SET_READER_CONFIG failed')
+        self.send_READER_CONFIG(onCompletion=d)
 
-        # in state PAUSING, we have sent a DISABLE_ROSPEC, so expect only
-        # DISABLE_ROSPEC_RESPONSE.  advance to state PAUSED.
-        elif self.state == LLRPClient.STATE_PAUSING:
-            if msgName != 'DISABLE_ROSPEC_RESPONSE':
-                logger.error('unexpected response %s '
-                             ' when disabling ROSpec', msgName)
+    def _handleReaderConfig(self, msgName, lmsg):
+        if not lmsg.isSuccess():
+            self._logFailure(msgName, lmsg, 'setting reader config')
+            return
 
-            if not lmsg.isSuccess():
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.error('DISABLE_ROSPEC failed with status %s: %s',
-                             status, err)
-                logger.warn('Error %s disabling ROSpec: %s', status, err)
+        self.processDeferreds(msgName, True)
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
+        if self.reset_on_connect:
+            d = self.stopPolitely(disconnect=False)
+            if self.start_inventory:
+                d.addCallback(self.startInventory)
+        elif self.start_inventory:
+            self.startInventory()
 
-        # in state SENT_ENABLE_ROSPEC, expect only ENABLE_ROSPEC_RESPONSE;
-        # respond to favorable ENABLE_ROSPEC_RESPONSE by starting the enabled
-        # ROSpec and advancing to state INVENTORYING.
-        elif self.state == LLRPClient.STATE_SENT_ENABLE_ROSPEC:
-            if msgName != 'ENABLE_ROSPEC_RESPONSE':
-                logger.error('unexpected response %s when enabling ROSpec',
-                             msgName)
-
-            if not lmsg.isSuccess():
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.error('ENABLE_ROSPEC failed with status %s: %s',
-                             status, err)
-                logger.fatal('Error %s enabling ROSpec: %s', status, err)
+    def _handleResponse(self, what, stop_on_failure, msgName, lmsg):
+        """Run the Deferreds waiting for a response.  Unless what is None,
+        log a failure to do what; with stop_on_failure, leave the Deferreds
+        waiting after a failure."""
+        if what is not None and not lmsg.isSuccess():
+            if stop_on_failure:
+                self._logFailure(msgName, lmsg, what)
                 return
+            self._logFailure(msgName, lmsg, what, logging.WARNING)
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
-
-        elif self.state == LLRPClient.STATE_SENT_START_ROSPEC:
-            if msgName != 'START_ROSPEC_RESPONSE':
-                logger.error('unexpected response %s when starting ROSpec',
-                             msgName)
-
-            if not lmsg.isSuccess():
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.error('START_ROSPEC failed with status %s: %s',
-                             status, err)
-                logger.fatal('Error %s starting ROSpec: %s', status, err)
-                return
+        self.processDeferreds(msgName, lmsg.isSuccess())
 
+    def _handleInventoryMessage(self, msgName, lmsg):
+        # don't decode tag reports just to find nobody is waiting
+        if self._deferreds.get(msgName):
             self.processDeferreds(msgName, lmsg.isSuccess())
 
-        elif self.state == LLRPClient.STATE_INVENTORYING:
-            if msgName not in ('RO_ACCESS_REPORT',
-                               'READER_EVENT_NOTIFICATION',
-                               'ADD_ACCESSSPEC_RESPONSE',
-                               'ENABLE_ACCESSSPEC_RESPONSE',
-                               'DISABLE_ACCESSSPEC_RESPONSE',
-                               'DELETE_ACCESSSPEC_RESPONSE'):
-                logger.error('unexpected message %s while inventorying',
-                             msgName)
-                return
-
-            self.processDeferreds(msgName, lmsg.isSuccess())
+    def _handleDeleteROSpec(self, msgName, lmsg):
+        if lmsg.isSuccess():
+            logger.info('reader finished inventory')
+            if self.disconnecting:
+                self.setState(LLRPClient.STATE_DISCONNECTED)
+            else:
+                self.setState(LLRPClient.STATE_CONNECTED)
+        else:
+            self._logFailure(msgName, lmsg, 'deleting ROSpec', logging.ERROR)
 
-        elif self.state == LLRPClient.STATE_SENT_DELETE_ACCESSSPEC:
-            if msgName != 'DELETE_ACCESSSPEC_RESPONSE':
-                logger.error('unexpected response %s when deleting AccessSpec',
-                             msgName)
+        self.processDeferreds(msgName, lmsg.isSuccess())
+        if self.disconnecting:
+            logger.info('disconnecting')
+            self.transport.loseConnection()
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
+    def _ignoreReport(self, msgName, lmsg):
+        logger.debug('ignoring RO_ACCESS_REPORT because not inventorying')
 
-        elif self.state == LLRPClient.STATE_SENT_DELETE_ROSPEC:
-            if msgName != 'DELETE_ROSPEC_RESPONSE':
-                logger.error('unexpected response %s when deleting ROSpec',
-                             msgName)
+    def _unexpectedMessage(self, error, handler, msgName, lmsg):
+        logger.error(error, msgName)
+        if handler is not None:
+            handler(msgName, lmsg)
 
-            if lmsg.isSuccess():
-                logger.info('reader finished inventory')
-                if self.disconnecting:
-                    self.setState(LLRPClient.STATE_DISCONNECTED)
-                else:
-                    self.setState(LLRPClient.STATE_CONNECTED)
+    def _ignoreMessage(self, msgName, lmsg):
+        logger.warn('message %s received in state %s; ignoring it', msgName,
+                    self.state)
 
-            else:
-                status = lmsg.msgdict[msgName]['LLRPStatus']['StatusCode']
-                err = lmsg.msgdict[msgName]['LLRPStatus']['ErrorDescription']
-                logger.error('DELETE_ROSPEC failed with status %s: %s',
-                             status, err)
+    def rawDataReceived(self, data):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('got %d bytes from reader: %s', len(data),
+                         hexlify(data))
 
-            self.processDeferreds(msgName, lmsg.isSuccess())
-            if self.disconnecting:
-                logger.info('disconnecting')
-                self.transport.loseConnection()
+        try:
+            for msgview in self.framer.feed(data):
+                if self.capture is not None:
+                    self.capture.write(msgview, self.peername,
+                                       self.clock.seconds())
+                lmsg = LLRPMessage(msgbytes=msgview.tobytes(),
+                                   decoders=self.decoders, lazy=True)
+                self.handleMessage(lmsg)
+                if self.metrics is not None:
+                    self.metrics.received(lmsg, len(msgview))
+        except LLRPError:
+            logger.exception('Failed to decode LLRPMessage; '
+                             'will not decode %d remaining bytes',
+                             len(self.framer))
+            self.framer.clear()
+
+    def nextMessageID(self):
+        """Return a fresh message ID for an outgoing message.  IDs count up
+        from 1 and wrap around before 2**32, skipping 0."""
+        msgid = self._next_msgid
+        self._next_msgid = msgid % 0xffffffff + 1
+        return msgid
+
+    def sendRequest(self, msgdict, timeout=None):
+        """Send a single-message dict like {'ADD_ROSPEC': {...}} under a
+        fresh message ID and return a Deferred that fires with the response
+        LLRPMessage.
+
+        The response is matched on its ID before the state machine sees it,
+        so any number of requests can be outstanding at once.  The Deferred
+        errbacks with LLRPResponseError if the reader answers with a failure
+        status or an ERROR_MESSAGE, and with LLRPError if no response comes
+        within timeout seconds (self.request_timeout by default)."""
+        name = msgdict.keys()[0]
+        msgid = self.nextMessageID()
+        body = dict(msgdict[name])
+        body['ID'] = msgid
+        if timeout is None:
+            timeout = self.request_timeout
 
-        else:
-            logger.warn('message %s received in unknown state!', msgName)
+        d = defer.Deferred()
+        timeout_call = None
+        if timeout:
+            timeout_call = self.clock.callLater(
+                timeout, self._requestTimedOut, msgid, timeout)
+        self._pending[msgid] = (name, d, timeout_call)
+        self.sendMessage({name: body})
+        return d
 
-        if self._deferreds[msgName]:
-            logger.error('there should NOT be Deferreds left for %s,'
-                         ' but there are!', msgName)
+    def sendRequests(self, msgdicts, timeout=None):
+        """Pipeline several requests: send them all without waiting, and
+        return a Deferred that fires with the list of responses once every
+        request succeeds, or errbacks (with a defer.FirstError) as soon as
+        one of them fails.  The reader still processes them in order."""
+        requests = [self.sendRequest(msgdict, timeout) for msgdict in msgdicts]
+        d = defer.DeferredList(requests, fireOnOneErrback=True,
+                               consumeErrors=True)
+        d.addCallback(lambda results: [lmsg for _, lmsg in results])
+        return d
 
-    def rawDataReceived(self, data):
-        logger.debug('got %d bytes from reader: %s', len(data),
-                     data.encode('hex'))
-
-        if self.expectingRemainingBytes:
-            if len(data) >= self.expectingRemainingBytes:
-                data = self.partialData + data
-                self.partialData = ''
-                self.expectingRemainingBytes -= len(data)
-            else:
-                # still not enough; wait until next time
-                self.partialData += data
-                self.expectingRemainingBytes -= len(data)
-                return
+    def resolveRequest(self, lmsg):
+        """Fire the Deferred of the pending request that lmsg answers.
+        Returns False if lmsg is not a response to a pending request."""
+        try:
+            name, d, timeout_call = self._pending[lmsg.msgid]
+        except KeyError:
+            return False
+        # reader-initiated messages carry IDs of the reader's choosing, so
+        # the name has to match as well
+        msgName = lmsg.getName()
+        if msgName not in (name + '_RESPONSE', 'ErrorMessage'):
+            return False
 
-        while data:
-            # parse the message header to grab its length
-            if len(data) >= LLRPMessage.full_hdr_len:
-                msg_type, msg_len, message_id = \
-                    struct.unpack(LLRPMessage.full_hdr_fmt,
-                                  data[:LLRPMessage.full_hdr_len])
-            else:
-                logger.warning('Too few bytes (%d) to unpack message header',
-                               len(data))
-                self.partialData = data
-                self.expectingRemainingBytes = \
-                    LLRPMessage.full_hdr_len - len(data)
-                break
-
-            logger.debug('expect %d bytes (have %d)', msg_len, len(data))
-
-            if len(data) < msg_len:
-                # got too few bytes
-                self.partialData = data
-                self.expectingRemainingBytes = msg_len - len(data)
-                break
-            else:
-                # got at least the right number of bytes
-                self.expectingRemainingBytes = 0
-                try:
-                    lmsg = LLRPMessage(msgbytes=data[:msg_len])
-                    self.handleMessage(lmsg)
-                    data = data[msg_len:]
-                except LLRPError:
-                    logger.exception('Failed to decode LLRPMessage; '
-                                     'will not decode %d remaining bytes',
-                                     len(data))
-                    break
+        del self._pending[lmsg.msgid]
+        if timeout_call is not None and timeout_call.active():
+            timeout_call.cancel()
+        logger.debug('%s (ID %d) answered by %s', name, lmsg.msgid, msgName)
+        if lmsg.isSuccess():
+            d.callback(lmsg)
+        else:
+            status = lmsg.getParameter('LLRPStatus', {})
+            d.errback(LLRPResponseError('{} failed with status {}: {}'.format(
+                name, status.get('StatusCode'),
+                status.get('ErrorDescription'))))
+        return True
+
+    def _requestTimedOut(self, msgid, timeout):
+        name, d, _ = self._pending.pop(msgid)
+        logger.warn('no response to %s (ID %d) after %s seconds', name, msgid,
+                    timeout)
+        d.errback(LLRPError('no response to {} (ID {}) after {}'
+                            ' seconds'.format(name, msgid, timeout)))
 
     def panic(self, failure, *args):
         logger.error('panic(): %s', args)
@@ -607,124 +868,124 @@ class LLRPClient(LineReceiver):
         logger.warn('complain(): %s', args)
 
     def send_KEEPALIVE_ACK(self):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'KEEPALIVE_ACK': {
                 'Ver':  1,
                 'Type': 72,
-                'ID':   0,
-            }}))
+                'ID':   self.nextMessageID(),
+            }})
 
     def send_GET_READER_CAPABILITIES(self, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'GET_READER_CAPABILITIES': {
                 'Ver':  1,
                 'Type': 1,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'RequestedData': Capability_Name2Type['All']
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_GET_CAPABILITIES)
         self._deferreds['GET_READER_CAPABILITIES_RESPONSE'].append(onCompletion)
 
     def send_READER_CONFIG(self, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'SET_READER_CONFIG': {
                 'Ver':  1,
                 'Type': 3,
                 'Code': 226,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'R': 0,
                 'Payload': 1
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_READER_CONFIG)
         self._deferreds['READER_CONFIG_RESPONSE'].append(onCompletion)
 
     def send_GET_READER_CONFIG(self, antenna, GPI, GPO, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'GET_READER_CONFIG': {
                 'Ver':  1,
                 'Type': 2,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'RequestedData': Capability_Name2Type['All'],
                 'Antenna': antenna,
                 'GPO': GPO,
                 'GPI': GPI
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_READER_CONFIG)
         self._deferreds['GET_READER_CONFIG_RESPONSE'].append(onCompletion)
 
     def send_ENABLE_EVENTS_AND_REPORTS(self, _, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'ENABLE_EVENTS_AND_REPORTS': {
                 'Ver':  1,
                 'Type': 64,
-                'ID':   0
-            }}))
+                'ID':   self.nextMessageID()
+            }})
         self.setState(LLRPClient.STATE_INVENTORYING)
 
     def send_ADD_ROSPEC(self, rospec, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'ADD_ROSPEC': {
                 'Ver':  1,
                 'Type': 20,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'ROSpecID': rospec['ROSpecID'],
                 'ROSpec': rospec,
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_ADD_ROSPEC)
         self._deferreds['ADD_ROSPEC_RESPONSE'].append(onCompletion)
 
     def send_ENABLE_ROSPEC(self, _, rospec, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'ENABLE_ROSPEC': {
                 'Ver':  1,
                 'Type': 24,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'ROSpecID': rospec['ROSpecID']
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_ENABLE_ROSPEC)
         self._deferreds['ENABLE_ROSPEC_RESPONSE'].append(onCompletion)
 
     def send_START_ROSPEC(self, _, rospec, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'START_ROSPEC': {
                 'Ver':  1,
                 'Type': 22,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'ROSpecID': rospec['ROSpecID']
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_START_ROSPEC)
         self._deferreds['START_ROSPEC_RESPONSE'].append(onCompletion)
 
     def send_ADD_ACCESSSPEC(self, accessSpec, onCompletion):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'ADD_ACCESSSPEC': {
                 'Ver':  1,
                 'Type': 40,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'AccessSpec': accessSpec,
-            }}))
+            }})
         self._deferreds['ADD_ACCESSSPEC_RESPONSE'].append(onCompletion)
 
     def send_DISABLE_ACCESSSPEC(self, accessSpecID=1, onCompletion=None):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'DISABLE_ACCESSSPEC': {
                 'Ver':  1,
                 'Type': 43,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'AccessSpecID': accessSpecID,
-            }}))
+            }})
 
         if onCompletion:
             self._deferreds['DISABLE_ACCESSSPEC_RESPONSE'].append(onCompletion)
 
     def send_ENABLE_ACCESSSPEC(self, _, accessSpecID, onCompletion=None):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'ENABLE_ACCESSSPEC': {
                 'Ver':  1,
                 'Type': 42,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'AccessSpecID': accessSpecID,
-            }}))
+            }})
 
         if onCompletion:
             self._deferreds['ENABLE_ACCESSSPEC_RESPONSE'].append(onCompletion)
@@ -733,19 +994,19 @@ class LLRPClient(LineReceiver):
                                writeSpecParam, stopParam, accessSpecID=1,
                                onCompletion=None):
         # logger.info('Deleting current accessSpec.')
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'DELETE_ACCESSSPEC': {
                 'Ver': 1,
                 'Type': 41,
-                'ID': 0,
+                'ID': self.nextMessageID(),
                 'AccessSpecID': accessSpecID  # ONE AccessSpec
-            }}))
+            }})
 
         # Hackfix to chain startAccess to send_DELETE, since appending a
         # deferred doesn't seem to work...
-        task.deferLater(reactor, 0, self.startAccess, readWords=readSpecParam,
-                        writeWords=writeSpecParam, accessStopParam=stopParam,
-                        accessSpecID=accessSpecID)
+        task.deferLater(self.clock, 0, self.startAccess,
+                        readWords=readSpecParam, writeWords=writeSpecParam,
+                        accessStopParam=stopParam, accessSpecID=accessSpecID)
 
     def startAccess(self, readWords=None, writeWords=None, target=None,
                     accessStopParam=None, accessSpecID=1, param=None,
@@ -824,6 +1085,21 @@ class LLRPClient(LineReceiver):
             }
         }
 
+        if self.pipeline:
+            d = self.sendRequests([
+                {'ADD_ACCESSSPEC': {
+                    'Ver':  1,
+                    'Type': 40,
+                    'AccessSpec': accessSpec,
+                }},
+                {'ENABLE_ACCESSSPEC': {
+                    'Ver':  1,
+                    'Type': 42,
+                    'AccessSpecID': accessSpecID,
+                }}])
+            d.addErrback(self.panic, 'AccessSpec setup failed')
+            return d
+
         d = defer.Deferred()
         d.addCallback(self.send_ENABLE_ACCESSSPEC, accessSpecID)
         d.addErrback(self.panic, 'ADD_ACCESSSPEC failed')
@@ -850,10 +1126,13 @@ class LLRPClient(LineReceiver):
         logger.info('starting inventory')
 
         if self.duration:
-            task.deferLater(reactor, self.duration, self.stopPolitely, True)
+            task.deferLater(self.clock, self.duration, self.stopPolitely, True)
 
         rospec = self.getROSpec()['ROSpec']
 
+        if self.pipeline:
+            return self._startInventoryPipelined(rospec)
+
         d2 = defer.Deferred()
         d2.addCallback(self.send_ENABLE_EVENTS_AND_REPORTS, onCompletion=None)
         d2.addErrback(self.panic, 'START_ROSPEC failed')
@@ -868,6 +1147,31 @@ class LLRPClient(LineReceiver):
 
         self.send_ADD_ROSPEC(rospec, onCompletion=d)
 
+    def _startInventoryPipelined(self, rospec):
+        # ADD, ENABLE and START all go out at once; the reader handles them
+        # in order, so ENABLE never overtakes the ADD it depends on
+        self.setState(LLRPClient.STATE_SENT_START_ROSPEC)
+        d = self.sendRequests([
+            {'ADD_ROSPEC': {
+                'Ver':  1,
+                'Type': 20,
+                'ROSpecID': rospec['ROSpecID'],
+                'ROSpec': rospec,
+            }},
+            {'ENABLE_ROSPEC': {
+                'Ver':  1,
+                'Type': 24,
+                'ROSpecID': rospec['ROSpecID']
+            }},
+            {'START_ROSPEC': {
+                'Ver':  1,
+                'Type': 22,
+                'ROSpecID': rospec['ROSpecID']
+            }}])
+        d.addCallback(self.send_ENABLE_EVENTS_AND_REPORTS, onCompletion=None)
+        d.addErrback(self.panic, 'ROSpec setup failed')
+        return d
+
     def getROSpec(self):
         if self.rospec:
             return self.rospec
@@ -881,8 +1185,24 @@ class LLRPClient(LineReceiver):
                                  session=self.session,
                                  tag_population=self.tag_population)
         logger.debug('ROSpec: %s', self.rospec)
+        self.compileDecoders()
         return self.rospec
 
+    def compileDecoders(self):
+        """Specialize the TagReportData decoder for the
+        TagReportContentSelector in our ROSpec."""
+        selector = self.rospec['ROSpec']['ROReportSpec']\
+            ['TagReportContentSelector']
+        gdc = self.capabilities.get('GeneralDeviceCapabilities', {})
+        uptime = not gdc.get('HasUTCClockCapability', True)
+        self.tag_decoder = TagReportDataDecoder(selector, uptime=uptime)
+        if self.columnar_reports:
+            decoder = decode_ROAccessReport_columnar
+        else:
+            decoder = decode_ROAccessReport
+        self.decoders['RO_ACCESS_REPORT'] = partial(
+            decoder, tag_decoder=self.tag_decoder)
+
     def stopPolitely(self, disconnect=False):
         """Delete all active ROSpecs.  Return a Deferred that will be called
            when the DELETE_ROSPEC_RESPONSE comes back."""
@@ -890,13 +1210,13 @@ class LLRPClient(LineReceiver):
         if disconnect:
             logger.info('will disconnect when stopped')
             self.disconnecting = True
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'DELETE_ACCESSSPEC': {
                 'Ver': 1,
                 'Type': 41,
-                'ID': 0,
+                'ID': self.nextMessageID(),
                 'AccessSpecID': 0  # all AccessSpecs
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_DELETE_ACCESSSPEC)
 
         d = defer.Deferred()
@@ -907,13 +1227,13 @@ class LLRPClient(LineReceiver):
         return d
 
     def stopAllROSpecs(self, *args):
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'DELETE_ROSPEC': {
                 'Ver':  1,
                 'Type': 21,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'ROSpecID': 0
-            }}))
+            }})
         self.setState(LLRPClient.STATE_SENT_DELETE_ROSPEC)
 
         d = defer.Deferred()
@@ -936,13 +1256,13 @@ class LLRPClient(LineReceiver):
 
         rospec = self.getROSpec()['ROSpec']
 
-        self.sendLLRPMessage(LLRPMessage(msgdict={
+        self.sendMessage({
             'DISABLE_ROSPEC': {
                 'Ver':  1,
                 'Type': 25,
-                'ID':   0,
+                'ID':   self.nextMessageID(),
                 'ROSpecID': rospec['ROSpecID']
-            }}))
+            }})
         self.setState(LLRPClient.STATE_PAUSING)
 
         d = defer.Deferred()
@@ -951,7 +1271,8 @@ class LLRPClient(LineReceiver):
         self._deferreds['DISABLE_ROSPEC_RESPONSE'].append(d)
 
         if duration_seconds > 0:
-            startAgain = task.deferLater(reactor, duration_seconds, lambda: 0)
+            startAgain = task.deferLater(self.clock, duration_seconds,
+                                         lambda: 0)
             startAgain.addCallback(self.resume)
 
         return d
@@ -975,19 +1296,74 @@ class LLRPClient(LineReceiver):
         d.addErrback(self.panic, 'resume() failed')
         self.send_ENABLE_ROSPEC(None, rospec, onCompletion=d)
 
+    def sendMessage(self, msgdict):
+        """Serialize a single-message dict and send it."""
+        (name, body), = msgdict.items()
+        if name == 'ADD_ROSPEC':
+            msgbytes = self.encodeAddROSpec(body['ROSpec'], body['ID'])
+        else:
+            msgbytes = LLRPMessage(msgdict=msgdict).msgbytes
+        self.sendBytes(msgbytes)
+
+    def encodeAddROSpec(self, rospec, msgid):
+        """Return the bytes of an ADD_ROSPEC for rospec with message ID
+        msgid.  Starting and resuming inventory sends the same ROSpec
+        again and again, so its bytes are kept, and later sends only pack
+        in the message ID.  A ROSpec must not be changed once sent."""
+        if self._add_rospec is None or self._add_rospec[0] is not rospec:
+            msgbytes = LLRPMessage(msgdict={'ADD_ROSPEC': {
+                'Ver': 1, 'Type': 20, 'ID': 0, 'ROSpecID': rospec['ROSpecID'],
+                'ROSpec': rospec}}).msgbytes
+            self._add_rospec = (rospec, bytearray(msgbytes))
+        msgbytes = self._add_rospec[1]
+        msgid_struct.pack_into(msgbytes, LLRPMessage.hdr_len, msgid)
+        return str(msgbytes)
+
     def sendLLRPMessage(self, llrp_msg):
         assert isinstance(llrp_msg, LLRPMessage)
         assert llrp_msg.msgbytes, "LLRPMessage is empty"
-        self.transport.write(llrp_msg.msgbytes)
+        self.sendBytes(llrp_msg.msgbytes)
+
+    def sendBytes(self, msgbytes):
+        if self.capture is not None:
+            self.capture.write(msgbytes, self.peername, self.clock.seconds(),
+                               sent=True)
+        if self.metrics is not None:
+            self.metrics.sent(msgbytes)
+        self.transport.write(msgbytes)
 
 
 class LLRPClientFactory(ClientFactory):
-    def __init__(self, onFinish=None, reconnect=False, **kwargs):
+    def __init__(self, onFinish=None, reconnect=False, reconnect_delay=1.0,
+                 max_reconnect_delay=60.0, reconnect_factor=2.0,
+                 reconnect_jitter=0.1, callback_threads=4, clock=reactor,
+                 **kwargs):
+        """With reconnect=True, a reader whose connection fails or is lost
+        is retried after reconnect_delay seconds, then after delays growing
+        by reconnect_factor up to max_reconnect_delay.  Each delay is spread
+        by +/- reconnect_jitter (a fraction) so that readers that dropped
+        together do not all come back at the same instant.  Retries are
+        scheduled on clock (the reactor by default), never slept through, so
+        one flapping reader does not hold up the others.  Callbacks added
+        with threaded=True run on a pool of up to callback_threads threads
+        (see sllurp.dispatch.ThreadedDispatcher)."""
         self.onFinish = onFinish
         self.reconnect = reconnect
-        self.reconnect_delay = 1.0  # seconds
+        self.reconnect_delay = reconnect_delay  # seconds
+        self.max_reconnect_delay = max_reconnect_delay
+        self.reconnect_factor = reconnect_factor
+        self.reconnect_jitter = reconnect_jitter
+        self.clock = clock
+        self.callback_threads = callback_threads
+        self.threads = None  # ThreadedDispatcher, once needed
         self.client_args = kwargs
 
+        # reconnection state per reader: (host, port) -> {'delay': seconds
+        # before the pending (or last) attempt, 'attempts': failures since
+        # the last successful connection, 'last_error': message of the last
+        # failure, 'pending': IDelayedCall of the scheduled attempt or None}
+        self.reconnect_state = {}
+
         # callbacks to pass to connected clients
         # (map of LLRPClient.STATE_* -> [list of callbacks])
         self._state_callbacks = {}
@@ -997,6 +1373,10 @@ class LLRPClientFactory(ClientFactory):
         # message callbacks to pass to connected clients
         self._message_callbacks = defaultdict(list)
 
+        # 'host:port' -> ClientMetrics of the reader, kept across
+        # reconnections
+        self.metrics = {}
+
         self.protocols = set()
 
     def startedConnecting(self, connector):
@@ -1006,11 +1386,21 @@ class LLRPClientFactory(ClientFactory):
         assert state in self._state_callbacks
         self._state_callbacks[state].append(cb)
 
-    def addTagReportCallback(self, cb):
-        self._message_callbacks['RO_ACCESS_REPORT'].append(cb)
+    def addTagReportCallback(self, cb, threaded=False):
+        self.addMessageCallback('RO_ACCESS_REPORT', cb, threaded)
+
+    def addMessageCallback(self, msg_type, cb, threaded=False):
+        """With threaded=True, cb runs on the callback thread pool; calls
+        for messages from the same reader are made one after another, in
+        order."""
+        if threaded:
+            if self.threads is None:
+                self.threads = ThreadedDispatcher(self.callback_threads)
+            cb = self.threads.wrap(cb)
+        self._message_callbacks[msg_type].append(cb)
 
     def buildProtocol(self, _):
-        proto = LLRPClient(factory=self, **self.client_args)
+        proto = LLRPClient(factory=self, clock=self.clock, **self.client_args)
 
         # register state-change callbacks with new client
         for state, cbs in self._state_callbacks.items():
@@ -1035,8 +1425,7 @@ class LLRPClientFactory(ClientFactory):
         logger.info('lost connection: %s', reason.getErrorMessage())
         ClientFactory.clientConnectionLost(self, connector, reason)
         if self.reconnect:
-            time.sleep(self.reconnect_delay)
-            connector.connect()
+            self.scheduleReconnect(connector, reason)
         elif not self.protocols:
             if self.onFinish:
                 self.onFinish.callback(None)
@@ -1045,12 +1434,73 @@ class LLRPClientFactory(ClientFactory):
         logger.info('connection failed: %s', reason.getErrorMessage())
         ClientFactory.clientConnectionFailed(self, connector, reason)
         if self.reconnect:
-            time.sleep(self.reconnect_delay)
-            connector.connect()
+            self.scheduleReconnect(connector, reason)
         elif not self.protocols:
             if self.onFinish:
                 self.onFinish.callback(None)
 
+    def _reconnectState(self, connector):
+        dest = connector.getDestination()
+        key = (dest.host, dest.port)
+        if key not in self.reconnect_state:
+            self.reconnect_state[key] = {'delay': self.reconnect_delay,
+                                         'attempts': 0,
+                                         'last_error': None,
+                                         'pending': None}
+        return self.reconnect_state[key]
+
+    def scheduleReconnect(self, connector, reason):
+        """Arrange for connector to be retried after the reader's current
+        backoff delay."""
+        st = self._reconnectState(connector)
+        if st['pending'] is not None and st['pending'].active():
+            return
+        try:
+            delay = min(self.max_reconnect_delay,
+                        self.reconnect_delay *
+                        self.reconnect_factor ** st['attempts'])
+        except OverflowError:
+            delay = self.max_reconnect_delay
+        if self.reconnect_jitter:
+            delay *= random.uniform(1 - self.reconnect_jitter,
+                                    1 + self.reconnect_jitter)
+        st['delay'] = delay
+        st['attempts'] += 1
+        st['last_error'] = reason.getErrorMessage()
+        dest = connector.getDestination()
+        logger.info('reconnecting to %s:%s in %.1f seconds (attempt %d)',
+                    dest.host, dest.port, delay, st['attempts'])
+        st['pending'] = self.clock.callLater(delay, self._reconnect,
+                                             connector, st)
+
+    def _reconnect(self, connector, st):
+        st['pending'] = None
+        connector.connect()
+
+    def resetDelay(self, connector):
+        """Forget past failures of the reader behind connector, so that the
+        next reconnection starts over from reconnect_delay."""
+        st = self._reconnectState(connector)
+        st['delay'] = self.reconnect_delay
+        st['attempts'] = 0
+
+    def stopTrying(self):
+        """Cancel scheduled reconnections and do not schedule new ones."""
+        self.reconnect = False
+        for st in self.reconnect_state.values():
+            if st['pending'] is not None and st['pending'].active():
+                st['pending'].cancel()
+            st['pending'] = None
+
+    def getReconnectStates(self):
+        """Reconnection state of every reader seen so far, keyed by
+        'host:port'; see reconnect_state."""
+        return {'{}:{}'.format(*key): {'delay': st['delay'],
+                                       'attempts': st['attempts'],
+                                       'last_error': st['last_error'],
+                                       'pending': st['pending'] is not None}
+                for key, st in self.reconnect_state.items()}
+
     def resumeInventory(self):
         for proto in self.protocols:
             proto.resume()
@@ -1061,6 +1511,7 @@ class LLRPClientFactory(ClientFactory):
 
     def politeShutdown(self):
         """Stop inventory on all connected readers."""
+        self.stopTrying()
         protoDeferreds = []
         for proto in self.protocols:
             protoDeferreds.append(proto.stopPolitely(disconnect=True))
@@ -1071,3 +1522,20 @@ class LLRPClientFactory(ClientFactory):
                   for proto in self.protocols}
         logger.info('states: %s', states)
         return states
+
+    def metricsFor(self, peername, metrics):
+        """Return the ClientMetrics of the reader at peername, or start
+        keeping metrics for it if there are none yet."""
+        return self.metrics.setdefault('{}:{}'.format(*peername), metrics)
+
+    def getMetrics(self):
+        """Snapshot of the metrics of every reader seen so far, keyed by
+        'host:port' (see sllurp.metrics)."""
+        return {reader: metrics.snapshot()
+                for reader, metrics in self.metrics.items()}
+
+    def getDispatchStats(self):
+        """DispatchQueue metrics of each connected reader (see
+        sllurp.dispatch), for clients with a dispatch queue."""
+        return {str(proto.peername[0]): proto.dispatch.stats()
+                for proto in self.protocols if proto.dispatch is not None}
@@ -0,0 +1,417 @@
+"""LLRP client for asyncio programs.
+
+AsyncLLRPClient is an asyncio Protocol wrapped around an ordinary
+LLRPClient.  Framing, decoding and the state machine are the very same code
+the Twisted client runs; only the transport and the clock come from the
+asyncio event loop, so no reactor thread is involved.
+
+The control calls return Futures, which fail with LLRPResponseError if the
+reader rejects one of the requests involved.  On Python 2, sllurp runs on
+trollius:
+
+    from trollius import From, coroutine
+
+    @coroutine
+    def inventory():
+        client = yield From(connect('reader', start_inventory=False))
+        yield From(client.start_inventory())
+        while True:
+            report = yield From(client.reports.get())
+            if report is None:  # connection closed
+                break
+            tags = report.msgdict['RO_ACCESS_REPORT']['TagReportData']
+            ...
+        yield From(client.stop_politely(disconnect=True))
+"""
+
+from __future__ import print_function
+from collections import defaultdict, deque
+import logging
+import socket
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from twisted.internet import error
+from twisted.python.failure import Failure
+
+from llrp import LLRPClient, LLRP_PORT
+from llrp_errors import LLRPError, LLRPResponseError
+
+logger = logging.getLogger(__name__)
+
+ensure_future = getattr(asyncio, 'ensure_future', None) or \
+    getattr(asyncio, 'async')
+
+try:
+    StopAsyncIteration = StopAsyncIteration
+except NameError:
+    # Python 2 has no async for; __anext__ is never called there
+    StopAsyncIteration = StopIteration
+
+
+class AsyncioClock(object):
+    """The part of Twisted's IReactorTime that LLRPClient uses (callLater
+    and seconds), backed by an asyncio event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def seconds(self):
+        return self.loop.time()
+
+    def callLater(self, delay, f, *args, **kwargs):
+        return DelayedCall(self.loop, delay, f, args, kwargs)
+
+
+class DelayedCall(object):
+    """An asyncio TimerHandle that behaves like a Twisted IDelayedCall."""
+
+    def __init__(self, loop, delay, f, args, kwargs):
+        self.time = loop.time() + delay
+        self.called = False
+        self.cancelled = False
+        self._handle = loop.call_later(delay, self._fire, f, args, kwargs)
+
+    def _fire(self, f, args, kwargs):
+        self.called = True
+        f(*args, **kwargs)
+
+    def getTime(self):
+        return self.time
+
+    def active(self):
+        return not (self.called or self.cancelled)
+
+    def cancel(self):
+        if self.cancelled:
+            raise error.AlreadyCancelled
+        if self.called:
+            raise error.AlreadyCalled
+        self.cancelled = True
+        self._handle.cancel()
+
+
+class TransportAdapter(object):
+    """Lets LLRPClient write to an asyncio transport."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def loseConnection(self):
+        self.transport.close()
+
+    def pauseProducing(self):
+        self.transport.pause_reading()
+
+    def resumeProducing(self):
+        self.transport.resume_reading()
+
+
+def deferred_to_future(d, loop):
+    """Return a Future that resolves like Deferred d."""
+    fut = asyncio.Future(loop=loop)
+
+    def done(result):
+        if not fut.done():
+            fut.set_result(result)
+
+    def failed(failure):
+        exc = failure.value
+        if not isinstance(exc, Exception):
+            # the state machine errbacks with the client state
+            exc = LLRPError('request failed in state {}'.format(exc))
+        if not fut.done():
+            fut.set_exception(exc)
+
+    d.addCallbacks(done, failed)
+    return fut
+
+
+class TagReportStream(object):
+    """RO_ACCESS_REPORT messages in order of arrival.
+
+    Iterate with `async for` on Python 3, or call get() for a Future of the
+    next report (None once the connection has closed).  At most maxsize
+    reports wait for a consumer; if it falls behind, the oldest are dropped
+    and counted in self.dropped."""
+
+    def __init__(self, loop, maxsize=1000):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.closed = False
+        self._reports = deque()
+        self._waiters = deque()  # (Future, exception class to end with)
+
+    def __len__(self):
+        return len(self._reports)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._get(StopAsyncIteration)
+
+    def get(self):
+        return self._get(None)
+
+    def _get(self, end):
+        fut = asyncio.Future(loop=self.loop)
+        if self._reports:
+            fut.set_result(self._reports.popleft())
+        elif self.closed:
+            self._end(fut, end)
+        else:
+            self._waiters.append((fut, end))
+        return fut
+
+    def _end(self, fut, end):
+        if end is None:
+            fut.set_result(None)
+        else:
+            fut.set_exception(end())
+
+    def put(self, lmsg):
+        while self._waiters:
+            fut, _ = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(lmsg)
+                return
+        if self.maxsize and len(self._reports) >= self.maxsize:
+            self._reports.popleft()
+            self.dropped += 1
+        self._reports.append(lmsg)
+
+    def close(self):
+        self.closed = True
+        while self._waiters:
+            fut, end = self._waiters.popleft()
+            if not fut.done():
+                self._end(fut, end)
+
+
+class AsyncLLRPClient(asyncio.Protocol):
+    def __init__(self, loop=None, host=None, report_queue_size=1000,
+                 **kwargs):
+        """kwargs are passed on to LLRPClient (start_inventory, duration,
+        antennas, ...).  host, if given, is used as the reader's name in
+        peername instead of its IP address."""
+        self.loop = loop or asyncio.get_event_loop()
+        self.host = host
+
+        # LLRPClient adds itself here when connected, as it would to its
+        # factory's protocols
+        self.protocols = set()
+
+        self.client = LLRPClient(self, clock=AsyncioClock(self.loop),
+                                 **kwargs)
+        self.reports = TagReportStream(self.loop, report_queue_size)
+        self.client.addMessageCallback('RO_ACCESS_REPORT', self.reports.put)
+        for _, st_num in LLRPClient.getStates():
+            self.client.addStateCallback(st_num, self._stateChanged)
+
+        # futures waiting for a state: state -> [Future]
+        self._state_waiters = defaultdict(list)
+        # futures waiting for a message: name -> [(Future, watch)]; with
+        # watch, the future only fails if the message reports a failure
+        # (see _until()), and is left alone otherwise
+        self._message_waiters = defaultdict(list)
+
+        self.closed = asyncio.Future(loop=self.loop)
+
+    @property
+    def state(self):
+        return self.client.state
+
+    # asyncio.Protocol
+
+    def connection_made(self, transport):
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        peer = transport.get_extra_info('peername')
+        client = self.client
+        client.transport = TransportAdapter(transport)
+        if client.dispatch is not None:
+            client.dispatch.producer = client.transport
+        client.peer_ip, client.peer_port = peer[:2]
+        client.peername = (self.host or client.peer_ip, client.peer_port)
+        logger.info('connected to %s (%s:%s)', client.peername,
+                    client.peer_ip, client.peer_port)
+        self.protocols.add(client)
+
+    def data_received(self, data):
+        self.client.dataReceived(data)
+
+    def connection_lost(self, exc):
+        logger.info('lost connection to %s: %s', self.client.peername, exc)
+        self.client.connectionLost(Failure(exc or error.ConnectionDone()))
+        self.reports.close()
+        lost = LLRPError('connection lost')
+        futs = [fut for waiters in self._state_waiters.values()
+                for fut in waiters]
+        futs.extend(fut for waiters in self._message_waiters.values()
+                    for fut, _ in waiters)
+        for fut in futs:
+            if not fut.done():
+                fut.set_exception(lost)
+        self._state_waiters.clear()
+        for waiters in self._message_waiters.values():
+            del waiters[:]
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    # waiting for the state machine
+
+    def wait_for_state(self, state):
+        """Return a Future that resolves once the client reaches state
+        (one of LLRPClient.STATE_*)."""
+        fut = asyncio.Future(loop=self.loop)
+        if self.client.state == state:
+            fut.set_result(state)
+        else:
+            self._state_waiters[state].append(fut)
+        return fut
+
+    def _stateChanged(self, client):
+        for fut in self._state_waiters.pop(client.state, ()):
+            if not fut.done():
+                fut.set_result(client.state)
+
+    def wait_for_message(self, msg_name):
+        """Return a Future of the next msg_name LLRPMessage from the reader.
+        A response with a failure status raises LLRPResponseError."""
+        fut = asyncio.Future(loop=self.loop)
+        self._waitFor(msg_name, fut, False)
+        return fut
+
+    def _until(self, fut, responses):
+        """Make fut fail as soon as one of the responses (message names)
+        comes back with a failure status.  Returns fut."""
+        for msg_name in responses:
+            self._waitFor(msg_name, fut, True)
+        return fut
+
+    def _waitFor(self, msg_name, fut, watch):
+        if msg_name not in self._message_waiters:
+            self.client.addMessageCallback(
+                msg_name, lambda lmsg: self._messageReceived(msg_name, lmsg))
+        self._message_waiters[msg_name].append((fut, watch))
+
+    def _messageReceived(self, msg_name, lmsg):
+        # keep the key: the message callback stays registered.  Unless
+        # callbacks go through a dispatch queue, this runs before the state
+        # machine sees lmsg, so a failure reaches the futures before
+        # whatever the state machine would resolve them with.
+        waiters, self._message_waiters[msg_name] = \
+            self._message_waiters[msg_name], []
+        status = lmsg.getParameter('LLRPStatus')
+        exc = None
+        if status and status.get('StatusCode') != 'Success':
+            exc = LLRPResponseError('{} failed with status {}: {}'.format(
+                msg_name, status.get('StatusCode'),
+                status.get('ErrorDescription')))
+        for fut, watch in waiters:
+            if fut.done():
+                continue
+            if exc is not None:
+                fut.set_exception(exc)
+            elif not watch:
+                fut.set_result(lmsg)
+
+    # control
+
+    def start_inventory(self):
+        """Add, enable and start the ROSpec; resolves once inventorying."""
+        fut = self._until(self.wait_for_state(LLRPClient.STATE_INVENTORYING),
+                          ('ADD_ROSPEC_RESPONSE', 'ENABLE_ROSPEC_RESPONSE',
+                           'START_ROSPEC_RESPONSE'))
+        self.client.startInventory()
+        return fut
+
+    def pause(self, duration_seconds=0, force=False):
+        """Disable the ROSpec; resolves once the reader confirms."""
+        d = self.client.pause(duration_seconds, force)
+        if d is None:
+            return self._done(None)
+        return self._until(deferred_to_future(d, self.loop),
+                           ('DISABLE_ROSPEC_RESPONSE',))
+
+    def resume(self):
+        """Re-enable a paused ROSpec (or start inventory if there is none);
+        resolves once inventorying again."""
+        if self.client.state not in (LLRPClient.STATE_PAUSED,
+                                     LLRPClient.STATE_CONNECTED,
+                                     LLRPClient.STATE_DISCONNECTED):
+            return self._done(None)
+        if self.client.state == LLRPClient.STATE_PAUSED:
+            responses = ('ENABLE_ROSPEC_RESPONSE',)
+        else:
+            responses = ('ADD_ROSPEC_RESPONSE', 'ENABLE_ROSPEC_RESPONSE',
+                         'START_ROSPEC_RESPONSE')
+        fut = self._until(self.wait_for_state(LLRPClient.STATE_INVENTORYING),
+                          responses)
+        self.client.resume()
+        return fut
+
+    def stop_politely(self, disconnect=False):
+        """Delete all AccessSpecs and ROSpecs; resolves once the reader has
+        deleted them."""
+        d = self.client.stopPolitely(disconnect)
+        return self._until(deferred_to_future(d, self.loop),
+                           ('DELETE_ROSPEC_RESPONSE',))
+
+    def start_access(self, **kwargs):
+        """Add and enable an AccessSpec (see LLRPClient.startAccess for the
+        arguments); resolves with the ENABLE_ACCESSSPEC_RESPONSE."""
+        fut = self._until(self.wait_for_message('ENABLE_ACCESSSPEC_RESPONSE'),
+                          ('ADD_ACCESSSPEC_RESPONSE',))
+        try:
+            self.client.startAccess(**kwargs)
+        except LLRPError as err:
+            for msg_name in ('ADD_ACCESSSPEC_RESPONSE',
+                             'ENABLE_ACCESSSPEC_RESPONSE'):
+                self._message_waiters[msg_name] = [
+                    w for w in self._message_waiters[msg_name]
+                    if w[0] is not fut]
+            fut.set_exception(err)
+        return fut
+
+    def close(self):
+        transport = self.client.transport
+        if transport is not None:
+            transport.loseConnection()
+        return self.closed
+
+    def _done(self, result):
+        fut = asyncio.Future(loop=self.loop)
+        fut.set_result(result)
+        return fut
+
+
+def connect(host, port=LLRP_PORT, loop=None, **kwargs):
+    """Connect to the reader at host:port.  Returns a Future of the
+    AsyncLLRPClient, resolved once the TCP connection is up; kwargs are
+    passed on to AsyncLLRPClient."""
+    loop = loop or asyncio.get_event_loop()
+    proto = AsyncLLRPClient(loop=loop, host=host, **kwargs)
+    fut = asyncio.Future(loop=loop)
+
+    def connected(conn):
+        if conn.cancelled():
+            fut.cancel()
+        elif conn.exception() is not None:
+            fut.set_exception(conn.exception())
+        else:
+            fut.set_result(proto)
+
+    conn = ensure_future(loop.create_connection(lambda: proto, host, port),
+                         loop=loop)
+    conn.add_done_callback(connected)
+    return fut
@@ -6,6 +6,7 @@ logger = logging.getLogger(__name__)
 
 tve_header = '!B'
 tve_header_len = struct.calcsize(tve_header)
+tve_header_struct = struct.Struct(tve_header)
 
 tve_param_formats = {
     # param type: (param name, struct format)
@@ -24,33 +25,40 @@ tve_param_formats = {
     16: ('AccessSpecID', '!I')
 }
 
-def decode_tve_parameter (data):
+# param type: (param name, struct.Struct of the whole TVE parameter)
+tve_param_structs = dict(
+    (msgtype, (name, struct.Struct(tve_header + fmt[1:])))
+    for msgtype, (name, fmt) in tve_param_formats.items())
+
+def decode_tve_parameter (data, offset=0):
     """Generic byte decoding function for TVE parameters.
 
-    Given an array of bytes, tries to interpret a TVE parameter from the
-    beginning of the array.  Returns the decoded data and the number of bytes it
-    read."""
+    Given an array of bytes, tries to interpret a TVE parameter starting at
+    data[offset].  Returns the decoded data and the offset just past it (the
+    number of bytes it read, for the default offset of 0), or None and the
+    unchanged offset."""
 
     # decode the TVE field's header (1 bit "reserved" + 7-bit type)
-    (msgtype,) = struct.unpack(tve_header, data[:tve_header_len])
+    try:
+        (msgtype,) = tve_header_struct.unpack_from(data, offset)
+    except struct.error:
+        return None, offset
     if not msgtype & 0b10000000:
         # not a TV-encoded param
-        return None, 0
+        return None, offset
     msgtype = msgtype & 0x7f
     try:
-        param_name, param_fmt = tve_param_formats[msgtype]
+        param_name, param_struct = tve_param_structs[msgtype]
         logger.debug('found %s (type=%s)', param_name, msgtype)
     except KeyError as err:
-        return None, 0
+        return None, offset
 
     # decode the body
-    nbytes = struct.calcsize(param_fmt)
-    end = tve_header_len + nbytes
     try:
-        unpacked = struct.unpack(param_fmt, data[tve_header_len:end])
-        return {param_name: unpacked}, end
+        unpacked = param_struct.unpack_from(data, offset)[1:]
+        return {param_name: unpacked}, offset + param_struct.size
     except struct.error:
-        return None, 0
+        return None, offset
 
 def decode_parameter (data):
     """Decode a single parameter."""
@@ -0,0 +1,129 @@
+import struct
+import logging
+from llrp_errors import LLRPError
+from util import BITMASK
+
+logger = logging.getLogger(__name__)
+
+# every LLRP message starts with a 10-byte header: Rsvd/Ver/Type (2 bytes),
+# message length (4 bytes, includes the header) and message ID (4 bytes)
+msg_header = struct.Struct('!HII')
+msg_header_len = msg_header.size
+
+# and every TLV parameter with a 4-byte header: Rsvd/Type (2 bytes) and
+# parameter length (2 bytes, includes the header)
+par_header = struct.Struct('!HH')
+
+
+def parameters(data, offset=0, end=None):
+    """(type, offset, length) of the TLV parameters in data[offset:end],
+    up to the first whose length is too short to be one."""
+    if end is None:
+        end = len(data)
+    while offset + par_header.size <= end:
+        partype, length = par_header.unpack_from(data, offset)
+        if length < par_header.size:
+            return
+        yield partype & BITMASK(10), offset, length
+        offset += length
+
+
+class LLRPFramer(object):
+    """Splits a stream of bytes from a reader into LLRP messages.
+
+    Incoming chunks are appended to a single growable buffer.  Message
+    headers are read in place and complete messages are handed out as
+    memoryviews into that buffer, so each byte received is copied into the
+    buffer once and never re-sliced as further messages are consumed.
+
+    Typical use:
+
+        framer = LLRPFramer()
+        for msgview in framer.feed(data):
+            handle(msgview.tobytes())
+
+    Views that the caller keeps stay valid: if the buffer cannot be compacted
+    in place because views into it are still alive, the framer moves to a
+    fresh buffer and leaves the old one to its readers.
+    """
+
+    # compact the buffer once this many consumed bytes sit at its front
+    compact_threshold = 64 * 1024
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0  # offset of the first unconsumed byte in _buf
+
+    def __len__(self):
+        """Number of buffered bytes not yet handed out as messages."""
+        return len(self._buf) - self._pos
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        msg = self.next_message()
+        if msg is None:
+            raise StopIteration
+        return msg
+    __next__ = next
+
+    def feed(self, data):
+        """Append a chunk of received bytes.
+
+        Returns the framer itself so that complete messages can be iterated
+        over directly."""
+        self._compact()
+        try:
+            self._buf.extend(data)
+        except BufferError:
+            # somebody still holds a view into the current buffer
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+            self._buf.extend(data)
+        return self
+
+    def peek_header(self):
+        """Return (msgtype, length, msgid) of the next message without
+        consuming it, or None if fewer than 10 bytes are buffered."""
+        if len(self._buf) - self._pos < msg_header_len:
+            return None
+        return msg_header.unpack_from(self._buf, self._pos)
+
+    def next_message(self):
+        """Return a memoryview of the next complete message, or None if the
+        buffer does not hold one yet."""
+        hdr = self.peek_header()
+        if hdr is None:
+            return None
+        msg_len = hdr[1]
+        if msg_len < msg_header_len:
+            raise LLRPError('invalid LLRP message length {}'.format(msg_len))
+        start = self._pos
+        end = start + msg_len
+        if end > len(self._buf):
+            logger.debug('expect %d bytes (have %d)', msg_len,
+                         len(self._buf) - start)
+            return None
+        self._pos = end
+        return memoryview(self._buf)[start:end]
+
+    def clear(self):
+        """Drop any buffered partial message."""
+        self._buf = bytearray()
+        self._pos = 0
+
+    def _compact(self):
+        if not self._pos:
+            return
+        try:
+            if self._pos == len(self._buf):
+                del self._buf[:]
+                self._pos = 0
+            elif self._pos >= self.compact_threshold:
+                del self._buf[:self._pos]
+                self._pos = 0
+        except BufferError:
+            # views into the buffer are still alive; feed() will switch to a
+            # fresh buffer if it has to grow this one
+            pass
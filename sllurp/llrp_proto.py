@@ -23,10 +23,13 @@
 # TODO: use generic functions from llrp_decoder where possible
 #
 
+import json
 import logging
 import struct
 from collections import defaultdict
-from binascii import hexlify
+from StringIO import StringIO
+from array import array
+from binascii import hexlify, unhexlify
 from util import BIT, BITMASK, func, reverse_dict
 import llrp_decoder
 from llrp_errors import LLRPError
@@ -39,9 +42,17 @@ __all__ = [
     # Class
     "LLRPROSpec",
     "LLRPMessageDict",
+    "TagReportDataDecoder",
+    "TagReportBatch",
 
     # Misc
     "func",
+    "iter_llrp_xml",
+    "write_llrp_xml",
+    "iter_llrp_json",
+    "llrp_data2json",
+    "write_llrp_jsonl",
+    "set_codec_trace",
 ]
 
 logger = logging.getLogger(__name__)
@@ -97,7 +108,7 @@ def bin2dump(data, label=''):
     return str[:-1]
 
 def getType(data):
-    return struct.unpack("!H", data[:2])[0]
+    return ushort_struct.unpack_from(data)[0]
 
 
 def dump(data, label):
@@ -120,6 +131,16 @@ par_header_len = struct.calcsize(par_header)
 tve_header = '!B'
 tve_header_len = struct.calcsize(tve_header)
 
+gen_header_struct = struct.Struct(gen_header)
+msg_header_struct = struct.Struct(msg_header)
+par_header_struct = struct.Struct(par_header)
+tve_header_struct = struct.Struct(tve_header)
+
+# lone fields that sit between variable-length parts of a parameter
+ubyte_struct = struct.Struct('!B')
+ushort_struct = struct.Struct('!H')
+uint_struct = struct.Struct('!I')
+
 AirProtocol = {
     'UnspecifiedAirProtocol': 0,
     'EPCGlobalClass1Gen2': 1,
@@ -179,6 +200,15 @@ for m in ConnEvent_Name2Type:
     i = ConnEvent_Name2Type[m]
     ConnEvent_Type2Name[i] = m
 
+# 16.2.7.6.4 ROSpec events
+ROSpecEvent_Name2Type = {
+    'Start_of_ROSpec':          0,
+    'End_of_ROSpec':            1,
+    'Preemption_of_ROSpec':     2
+}
+
+ROSpecEvent_Type2Name = reverse_dict(ROSpecEvent_Name2Type)
+
 # http://www.gs1.org/gsmp/kc/epcglobal/llrp/llrp_1_0_1-standard-20070813.pdf
 # Section 14.1.1 Error messages
 Error_Name2Type = {
@@ -248,14 +278,21 @@ DEFAULT_MODULATION = 'M4'
 TLV_struct = {}  # Type-Length-Value encoded
 TV_struct = {}  # Type-Value encoded
 
+# Entries with fixed-size fields describe them in 'format': for parameters it
+# covers the header and the fixed fields that follow it, for messages the
+# fixed part of the body.  It is compiled once, at the end of this module,
+# into 'struct' (a struct.Struct) and 'length' (its size), which is what the
+# encoders and decoders use.
+
 
 # 16.1.1 GET_READER_CAPABILITIES
 def encode_GetReaderCapabilities(msg):
     req = msg['RequestedData']
-    return struct.pack('!B', req)
+    return TLV_struct['GET_READER_CAPABILITIES']['struct'].pack(req)
 
 TLV_struct['GET_READER_CAPABILITIES'] = {
     'type': 1,
+    'format': '!B',
     'fields': [
         'Ver', 'Type', 'ID',
         'RequestedData'
@@ -267,7 +304,6 @@ TLV_struct['GET_READER_CAPABILITIES'] = {
 # 16.1.2 GET_READER_CAPABILITIES_RESPONSE
 def decode_GetReaderCapabilitiesResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -324,7 +360,6 @@ TLV_struct['ADD_ROSPEC'] = {
 # 16.1.4 ADD_ROSPEC_RESPONSE
 def decode_AddROSpecResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -353,10 +388,11 @@ TLV_struct['ADD_ROSPEC_RESPONSE'] = {
 def encode_DeleteROSpec(msg):
         msgid = msg['ROSpecID']
 
-        return struct.pack('!I', msgid)
+        return TLV_struct['DELETE_ROSPEC']['struct'].pack(msgid)
 
 TLV_struct['DELETE_ROSPEC'] = {
     'type': 21,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'ROSpecID'
@@ -368,7 +404,6 @@ TLV_struct['DELETE_ROSPEC'] = {
 # 16.1.6 DELETE_ROSPEC_RESPONSE
 def decode_DeleteROSpecResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -397,10 +432,11 @@ TLV_struct['DELETE_ROSPEC_RESPONSE'] = {
 def encode_StartROSpec(msg):
         msgid = msg['ROSpecID']
 
-        return struct.pack('!I', msgid)
+        return TLV_struct['START_ROSPEC']['struct'].pack(msgid)
 
 TLV_struct['START_ROSPEC'] = {
     'type': 22,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'ROSpecID'
@@ -412,7 +448,6 @@ TLV_struct['START_ROSPEC'] = {
 # 16.1.8 START_ROSPEC_RESPONSE
 def decode_StartROSpecResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -441,10 +476,11 @@ TLV_struct['START_ROSPEC_RESPONSE'] = {
 def encode_StopROSpec(msg):
         msgid = msg['ROSpecID']
 
-        return struct.pack('!I', msgid)
+        return TLV_struct['STOP_ROSPEC']['struct'].pack(msgid)
 
 TLV_struct['STOP_ROSPEC'] = {
     'type': 23,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'ROSpecID'
@@ -456,7 +492,6 @@ TLV_struct['STOP_ROSPEC'] = {
 # 16.1.10 STOP_ROSPEC_RESPONSE
 def decode_StopROSpecResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -485,10 +520,11 @@ TLV_struct['STOP_ROSPEC_RESPONSE'] = {
 def encode_EnableROSpec(msg):
     msgid = msg['ROSpecID']
 
-    return struct.pack('!I', msgid)
+    return TLV_struct['ENABLE_ROSPEC']['struct'].pack(msgid)
 
 TLV_struct['ENABLE_ROSPEC'] = {
     'type': 24,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'ROSpecID'
@@ -500,7 +536,6 @@ TLV_struct['ENABLE_ROSPEC'] = {
 # 16.1.12 ENABLE_ROSPEC_RESPONSE
 def decode_EnableROSpecResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -529,10 +564,11 @@ TLV_struct['ENABLE_ROSPEC_RESPONSE'] = {
 def encode_DisableROSpec(msg):
         msgid = msg['ROSpecID']
 
-        return struct.pack('!I', msgid)
+        return TLV_struct['DISABLE_ROSPEC']['struct'].pack(msgid)
 
 TLV_struct['DISABLE_ROSPEC'] = {
     'type': 25,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'ROSpecID'
@@ -544,7 +580,6 @@ TLV_struct['DISABLE_ROSPEC'] = {
 # 16.1.14 DISABLE_ROSPEC_RESPONSE
 def decode_DisableROSpecResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -570,12 +605,21 @@ TLV_struct['DISABLE_ROSPEC_RESPONSE'] = {
 
 
 # 16.1.30 RO_ACCESS_REPORT
-def decode_ROAccessReport(data):
+def decode_ROAccessReport(data, tag_decoder=None):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     msg['TagReportData'] = []
+    if tag_decoder is not None:
+        # walk the parameters by offset instead of re-slicing the report
+        offset = 0
+        while offset < len(data):
+            ret, offset = tag_decoder.decode_from(data, offset)
+            if ret is None:
+                break
+            msg['TagReportData'].append(ret)
+        return msg
+
     while True:
         try:
             ret, data = TLV_decode('TagReportData')(data)
@@ -630,7 +674,6 @@ TLV_struct['KEEPALIVE_ACK'] = {
 # 16.1.33 READER_EVENT_NOTIFICATION
 def decode_ReaderEventNotification(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('ReaderEventNotificationData')(data)
@@ -669,7 +712,6 @@ TLV_struct['CLOSE_CONNECTION'] = {
 # 16.1.41 CLOSE_CONNECTION_RESPONSE
 def decode_CloseConnectionResponse(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
 
     # Decode parameters
     ret, body = TLV_decode('LLRPStatus')(data)
@@ -697,27 +739,26 @@ TLV_struct['CLOSE_CONNECTION_RESPONSE'] = {
 
 # 16.2.2.1 UTCTimestamp Parameter
 def decode_UTCTimestamp(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['UTCTimestamp']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_UTCTimestamp (type=%d len=%d)', msgtype, length)
 
     # Decode fields
-    (par['Microseconds'], ) = struct.unpack('!Q', body)
+    par['Microseconds'] = \
+        TLV_struct['UTCTimestamp']['struct'].unpack_from(data)[2]
 
     return par, data[length:]
 
 TLV_struct['UTCTimestamp'] = {
     'type':   128,
+    'format': '!HHQ',
     'fields': [
         'Type',
         'Microseconds'
@@ -727,27 +768,25 @@ TLV_struct['UTCTimestamp'] = {
 
 # ?.?.?.? Uptime Parameter (7.1.3.1.1.2 Uptime Parameter in 2010 requirements)
 def decode_Uptime(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['Uptime']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_Uptime (type=%d len=%d)', msgtype, length)
 
     # Decode fields
-    (par['Microseconds'], ) = struct.unpack('!Q', body)
+    par['Microseconds'] = TLV_struct['Uptime']['struct'].unpack_from(data)[2]
 
     return par, data[length:]
 
 TLV_struct['Uptime'] = {
     'type':   129,
+    'format': '!HHQ',
     'fields': [
         'Type',
         'Microseconds'
@@ -756,27 +795,24 @@ TLV_struct['Uptime'] = {
 }
 
 def decode_RegulatoryCapabilities(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['RegulatoryCapabilities']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_RegulatoryCapabilities (type=%d len=%d)',
+                 msgtype, length)
 
-    fmt = '!HH'
-    fmt_len = struct.calcsize(fmt)
+    fmt = TLV_struct['RegulatoryCapabilities']['struct']
     # Decode fields
     (par['CountryCode'],
-     par['CommunicationsStandard']) = struct.unpack(fmt, body[:fmt_len])
+     par['CommunicationsStandard']) = fmt.unpack_from(data)[2:]
 
-    body = body[fmt_len:]
+    body = data[fmt.size:length]
     ret, body = TLV_decode('UHFBandCapabilities')(body)
     if ret:
         par['UHFBandCapabilities'] = ret
@@ -785,6 +821,7 @@ def decode_RegulatoryCapabilities(data):
 
 TLV_struct['RegulatoryCapabilities'] = {
     'type': 143,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'CountryCode',
@@ -796,17 +833,16 @@ TLV_struct['RegulatoryCapabilities'] = {
 
 
 def decode_UHFBandCapabilities(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['UHFBandCapabilities']['type']:
         return (None, data)
     body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_UHFBandCapabilities (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
     i = 0
@@ -843,25 +879,26 @@ TLV_struct['UHFBandCapabilities'] = {
 
 
 def decode_TransmitPowerLevelTableEntry(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['TransmitPowerLevelTableEntry']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_TransmitPowerLevelTableEntry (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
-    par['Index'], par['TransmitPowerValue'] = struct.unpack('!HH', body)
+    par['Index'], par['TransmitPowerValue'] = \
+        TLV_struct['TransmitPowerLevelTableEntry']['struct'].unpack_from(
+            data)[2:]
 
     return par, data[length:]
 
 TLV_struct['TransmitPowerLevelTableEntry'] = {
     'type': 145,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'Index',
@@ -872,23 +909,21 @@ TLV_struct['TransmitPowerLevelTableEntry'] = {
 
 
 def decode_FrequencyInformation(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['FrequencyInformation']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_FrequencyInformation (type=%d len=%d)',
+                 msgtype, length)
 
-    fmt_len = struct.calcsize('!B')
+    fmt = TLV_struct['FrequencyInformation']['struct']
     # Decode fields
-    (flags, ) = struct.unpack('!B', body[:fmt_len])
+    flags = fmt.unpack_from(data)[2]
     par['Hopping'] = flags & BIT(7) == BIT(7)
-    body = body[fmt_len:]
+    body = data[fmt.size:length]
 
     i = 0
     ret, body = TLV_decode('FrequencyHopTable')(body)
@@ -905,6 +940,7 @@ def decode_FrequencyInformation(data):
 
 TLV_struct['FrequencyInformation'] = {
     'type': 146,
+    'format': '!HHB',
     'fields': [
         'Type',
         'Hopping',
@@ -916,37 +952,31 @@ TLV_struct['FrequencyInformation'] = {
 
 
 def decode_FrequencyHopTable(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['FrequencyHopTable']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
-
-    fmt = '!BBH'
-    fmt_len = struct.calcsize(fmt)
+    logger.debug('decode_FrequencyHopTable (type=%d len=%d)', msgtype, length)
 
-    id_fmt = '!I'
-    id_fmt_len = struct.calcsize(id_fmt)
+    fmt = TLV_struct['FrequencyHopTable']['struct']
     # Decode fields
     (par['HopTableId'],
      flags,
-     par['NumHops']) = struct.unpack(fmt, body[: fmt_len])
-    body = body[fmt_len:]
+     par['NumHops']) = fmt.unpack_from(data)[2:]
+    offset = fmt.size
     num = int(par['NumHops'])
     for x in range(1, num + 1):
-        par['Frequency' + str(x)] = struct.unpack(id_fmt, body[: id_fmt_len])
-        body = body[id_fmt_len:]
+        par['Frequency' + str(x)] = uint_struct.unpack_from(data, offset)
+        offset += uint_struct.size
 
     return par, data[length:]
 
 TLV_struct['FrequencyHopTable'] = {
     'type': 147,
+    'format': '!HHBBH',
     'fields': [
         'Type',
         'HopTableId',
@@ -958,35 +988,30 @@ TLV_struct['FrequencyHopTable'] = {
 
 
 def decode_FixedFrequencyTable(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['FixedFrequencyTable']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
-
-    fmt = '!H'
-    fmt_len = struct.calcsize(fmt)
+    logger.debug('decode_FixedFrequencyTable (type=%d len=%d)',
+                 msgtype, length)
 
-    id_fmt = '!I'
-    id_fmt_len = struct.calcsize(id_fmt)
+    fmt = TLV_struct['FixedFrequencyTable']['struct']
     # Decode fields
-    par['NumFrequencies'] = struct.unpack(fmt, body[: fmt_len])
-    body = body[fmt_len:]
+    par['NumFrequencies'] = fmt.unpack_from(data)[2:]
+    offset = fmt.size
     num = int(par['NumFrequencies'])
     for x in range(1, num + 1):
-        par['Frequency' + str(x)] = struct.unpack(id_fmt, body[:id_fmt_len])
-        body = body[id_fmt_len:]
+        par['Frequency' + str(x)] = uint_struct.unpack_from(data, offset)
+        offset += uint_struct.size
 
     return par, data[length:]
 
 TLV_struct['FixedFrequencyTable'] = {
     'type': 148,
+    'format': '!HHH',
     'fields': [
         'Type',
         'NumFrequencies',
@@ -997,20 +1022,18 @@ TLV_struct['FixedFrequencyTable'] = {
 
 
 def decode_UHFRFModeTable(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_UHFRFModeTable (type=%d len=%d)', msgtype, length)
 
     if msgtype != TLV_struct['UHFRFModeTable']['type']:
         return (None, data)
 
     body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_UHFRFModeTable (type=%d len=%d)', msgtype, length)
 
     # Decode fields
     i = 0
@@ -1033,20 +1056,17 @@ TLV_struct['UHFRFModeTable'] = {
 
 
 def decode_UHFC1G2RFModeTableEntry(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_UHFC1G2RFModeTableEntry (type=%d len=%d)',
+                 msgtype, length)
 
     if msgtype != TLV_struct['UHFC1G2RFModeTableEntry']['type']:
         return (None, data)
 
-    body = data[par_header_len:length]
-
     # Decode fields
     (par['ModeIdentifier'],
      RC,
@@ -1057,7 +1077,8 @@ def decode_UHFC1G2RFModeTableEntry(data):
      par['PIE'],
      par['MinTari'],
      par['MaxTari'],
-     par['StepTari']) = struct.unpack('!IBBBBIIIII', body)
+     par['StepTari']) = \
+        TLV_struct['UHFC1G2RFModeTableEntry']['struct'].unpack_from(data)[2:]
 
     # parse RC
     par['R'] = RC >> 7
@@ -1067,6 +1088,7 @@ def decode_UHFC1G2RFModeTableEntry(data):
 
 TLV_struct['UHFC1G2RFModeTableEntry'] = {
     'type': 329,
+    'format': '!HHIBBBBIIIII',
     'fields': [
         'Type',
         'ModeIdentifier',
@@ -1084,28 +1106,29 @@ TLV_struct['UHFC1G2RFModeTableEntry'] = {
 
 
 def decode_RFSurveyFrequencyCapabilities(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
 
     if msgtype != TLV_struct['RFSurveyFrequencyCapabilities']['type']:
         return (None, data)
 
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_RFSurveyFrequencyCapabilities (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
     (par['MinimumFrequency'],
-     par['MaximumFrequency']) = struct.unpack('!II', body)
+     par['MaximumFrequency']) = \
+        TLV_struct['RFSurveyFrequencyCapabilities']['struct'].unpack_from(
+            data)[2:]
 
     return par, data[length:]
 
 TLV_struct['RFSurveyFrequencyCapabilities'] = {
     'type': 365,
+    'format': '!HHII',
     'fields': [
         'Type',
         'MinimumFrequency',
@@ -1117,19 +1140,16 @@ TLV_struct['RFSurveyFrequencyCapabilities'] = {
 
 # 16.2.3.2 LLRPCapabilities Parameter
 def decode_LLRPCapabilities(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['LLRPCapabilities']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_LLRPCapabilities (type=%d len=%d)', msgtype, length)
 
     # Decode fields
     (flags,
@@ -1139,7 +1159,8 @@ def decode_LLRPCapabilities(data):
      par['MaxNumSpecsPerROSpec'],
      par['MaxNumInventoryParametersSpecsPerAISpec'],
      par['MaxNumAccessSpec'],
-     par['MaxNumOpSpecsPerAccessSpec']) = struct.unpack('!BBHIIIII', body)
+     par['MaxNumOpSpecsPerAccessSpec']) = \
+        TLV_struct['LLRPCapabilities']['struct'].unpack_from(data)[2:]
 
     par['CanDoRFSurvey'] = (flags & BIT(7) == BIT(7))
     par['CanReportBufferFillWarning'] = (flags & BIT(6) == BIT(6))
@@ -1151,6 +1172,7 @@ def decode_LLRPCapabilities(data):
 
 TLV_struct['LLRPCapabilities'] = {
     'type': 142,
+    'format': '!HHBBHIIIII',
     'fields': [
         'Type',
         'CanDoRFSurvey',
@@ -1171,35 +1193,32 @@ TLV_struct['LLRPCapabilities'] = {
 
 # 16.2.3.2 GeneralDeviceCapabilities Parameter
 def decode_GeneralDeviceCapabilities(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['GeneralDeviceCapabilities']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_GeneralDeviceCapabilities (type=%d len=%d)',
+                 msgtype, length)
 
-    fmt = '!HHIIH'
-    fmt_len = struct.calcsize(fmt)
+    fmt = TLV_struct['GeneralDeviceCapabilities']['struct']
     # Decode fields
     (par['MaxNumberOfAntennaSupported'],
      flags,
      par['DeviceManufacturerName'],
      par['ModelName'],
-     par['FirmwareVersionByteCount']) = struct.unpack(fmt, body[:fmt_len])
+     par['FirmwareVersionByteCount']) = fmt.unpack_from(data)[2:]
 
     par['CanSetAntennaProperties'] = (flags & BIT(15) == BIT(15))
     par['HasUTCClockCapability'] = (flags & BIT(14) == BIT(14))
 
-    pastVer = fmt_len + par['FirmwareVersionByteCount']
-    par['ReaderFirmwareVersion'] = body[fmt_len:pastVer]
-    body = body[pastVer:]
+    pastVer = fmt.size + par['FirmwareVersionByteCount']
+    par['ReaderFirmwareVersion'] = data[fmt.size:pastVer]
+    body = data[pastVer:length]
     ret, body = TLV_decode('ReceiveSensitivityTableEntry')(body)
     if ret:
         par['ReceiveSensitivityTableEntry'] = ret
@@ -1224,6 +1243,7 @@ def decode_GeneralDeviceCapabilities(data):
 
 TLV_struct['GeneralDeviceCapabilities'] = {
     'type': 137,
+    'format': '!HHHHIIH',
     'fields': [
         'Type',
         'MaxNumberOfAntennaSupported',
@@ -1244,25 +1264,26 @@ TLV_struct['GeneralDeviceCapabilities'] = {
 
 
 def decode_MaximumReceiveSensitivity(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['MaximumReceiveSensitivity']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_MaximumReceiveSensitivity (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
-    (par['MaximumSensitivityValue']) = struct.unpack('!H', body)
+    par['MaximumSensitivityValue'] = \
+        TLV_struct['MaximumReceiveSensitivity']['struct'].unpack_from(
+            data)[2:]
 
     return par, data[length:]
 
 TLV_struct['MaximumReceiveSensitivity'] = {
     'type': 363,
+    'format': '!HHH',
     'fields': [
         'Type',
         'MaximumSensitivityValue'
@@ -1272,26 +1293,27 @@ TLV_struct['MaximumReceiveSensitivity'] = {
 
 
 def decode_ReceiveSensitivityTableEntry(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['ReceiveSensitivityTableEntry']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_ReceiveSensitivityTableEntry (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
     (par['Index'],
-     par['ReceiveSensitivityValue']) = struct.unpack('!HH', body)
+     par['ReceiveSensitivityValue']) = \
+        TLV_struct['ReceiveSensitivityTableEntry']['struct'].unpack_from(
+            data)[2:]
 
     return par, data[length:]
 
 TLV_struct['ReceiveSensitivityTableEntry'] = {
     'type': 139,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'Index',
@@ -1302,27 +1324,28 @@ TLV_struct['ReceiveSensitivityTableEntry'] = {
 
 
 def decode_PerAntennaReceiveSensitivityRange(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['PerAntennaReceiveSensitivityRange']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_PerAntennaReceiveSensitivityRange (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
     (par['AntennaID'],
      par['ReceiveSensitivityIndexMin'],
-     par['ReceiveSensitivityIndexMax']) = struct.unpack('!HHH', body)
+     par['ReceiveSensitivityIndexMax']) = \
+        TLV_struct['PerAntennaReceiveSensitivityRange']['struct'].unpack_from(
+            data)[2:]
 
     return par, data[length:]
 
 TLV_struct['PerAntennaReceiveSensitivityRange'] = {
     'type': 149,
+    'format': '!HHHHH',
     'fields': [
         'Type',
         'AntennaID',
@@ -1334,34 +1357,31 @@ TLV_struct['PerAntennaReceiveSensitivityRange'] = {
 
 
 def decode_PerAntennaAirProtocol(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['PerAntennaAirProtocol']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_PerAntennaAirProtocol (type=%d len=%d)',
+                 msgtype, length)
 
-    fmt = '!HH'
-    fmt_len = struct.calcsize(fmt)
+    fmt = TLV_struct['PerAntennaAirProtocol']['struct']
 
     # Decode fields
     (par['AntennaID'],
-     par['NumProtocols']) = struct.unpack(fmt, body[:fmt_len])
-    body = body[fmt_len:]
+     par['NumProtocols']) = fmt.unpack_from(data)[2:]
     num = int(par['NumProtocols'])
-    id_fmt = '!B'
     for i in xrange(num):
-        par['ProtocolID{}'.format(i+1)] = struct.unpack(id_fmt, body[i])[0]
+        par['ProtocolID{}'.format(i+1)] = \
+            ubyte_struct.unpack_from(data, fmt.size + i)[0]
 
     return par, data[length:]
 
 TLV_struct['PerAntennaAirProtocol'] = {
     'type': 140,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'AntennaID',
@@ -1373,26 +1393,25 @@ TLV_struct['PerAntennaAirProtocol'] = {
 
 
 def decode_GPIOCapabilities(data):
-    logger.debug(func())
     par = {}
     if len(data) == 0:
         return None, data
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['GPIOCapabilities']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_GPIOCapabilities (type=%d len=%d)', msgtype, length)
 
     # Decode fields
     (par['NumGPIs'],
-     par['NumGPIs']) = struct.unpack('!HH', body)
+     par['NumGPIs']) = \
+        TLV_struct['GPIOCapabilities']['struct'].unpack_from(data)[2:]
 
     return par, data[length:]
 
 TLV_struct['GPIOCapabilities'] = {
     'type': 141,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'NumGPIs',
@@ -1404,7 +1423,6 @@ TLV_struct['GPIOCapabilities'] = {
 
 def decode_ErrorMessage(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
     ret, body = TLV_decode('LLRPStatus')(data)
     if ret:
         msg['LLRPStatus'] = ret
@@ -1431,21 +1449,20 @@ def encode_ROSpec(par):
     priority = par['Priority'] & BITMASK(7)
     state = ROSpecState_Name2Type[par['CurrentState']] & BITMASK(7)
 
-    msg_header = '!HHIBB'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['ROSpec']['struct']
 
     data = TLV_encode('ROBoundarySpec')(par['ROBoundarySpec'])
     data += TLV_encode('AISpec')(par['AISpec'])
     data += TLV_encode('ROReportSpec')(par['ROReportSpec'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len,
-                       msgid, priority, state) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           msgid, priority, state) + data
 
     return data
 
 TLV_struct['ROSpec'] = {
     'type': 177,
+    'format': '!HHIBB',
     'fields': [
         'Type',
         'ROSpecID',
@@ -1481,11 +1498,13 @@ def encode_GET_READER_CONFIG(msg):
     antenna = msg['Antenna']
     gpi = msg['GPI']
     gpo = msg['GPO']
-    return struct.pack('!HBHH', antenna, req, gpi, gpo)
+    return TLV_struct['GET_READER_CONFIG']['struct'].pack(antenna, req, gpi,
+                                                          gpo)
 
 # 17.1.40 GET_READER_CONFIG
 TLV_struct['GET_READER_CONFIG'] = {
     'type': 2,
+    'format': '!HBHH',
     'fields': [
         'Ver', 'Type', 'ID',
         'RequestedData', 'Antenna', 'GPO', 'GPI'
@@ -1637,21 +1656,22 @@ TLV_struct['GET_READER_CONFIG_RESPONSE'] = {
 def encode_SET_READER_CONFIG(par):
     # See "Table 6: Parameter Listing" for type codes
     if par["Code"] == 226:  # EventsAndReports
-        payloadFormat = "B"
+        payloadStruct = ubyte_struct
         payload = (par["Payload"] << 7) & 0xFF  # payload must be 0 or 1
     else:
         raise Exception("Type code (%i) has not been implemented" % par["Type"])
 
-    data = struct.pack("!B", par["R"])  # Restore Factory Settings (0) = No
-    data += struct.pack("!H", par["Code"])  # Parameter code
-    data += struct.pack("!H", struct.calcsize("!HH" + payloadFormat))
-    data += struct.pack("!"+payloadFormat, payload)
+    # Restore Factory Settings (0) = No, then the parameter's own TLV header
+    data = TLV_struct['SET_READER_CONFIG']['struct'].pack(
+        par["R"], par["Code"], par_header_len + payloadStruct.size)
+    data += payloadStruct.pack(payload)
 
     return data
 
 # 17.1.42 SET_READER_CONFIG
 TLV_struct['SET_READER_CONFIG'] = {
     'type': 3,
+    'format': '!BHH',
     'fields': [
         'Ver',
         'Type',
@@ -1668,7 +1688,6 @@ TLV_struct['SET_READER_CONFIG'] = {
 # 17.1.43 SET_READER_CONFIG_RESPONSE
 def decode_SET_READER_CONFIG(data):
     msg = LLRPMessageDict()
-    logger.debug(func())
     ret, body = TLV_decode('LLRPStatus')(data)
     if ret:
         msg['LLRPStatus'] = ret
@@ -1692,28 +1711,24 @@ TLV_struct['SET_READER_CONFIG_RESPONSE'] = {
 # 17.2.5.1 AccessSpec
 def encode_AccessSpec(par):
     msgtype = TLV_struct['AccessSpec']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['AccessSpec']['struct']
 
-    data = struct.pack('!I', int(par['AccessSpecID']))
-    data += struct.pack('!H', int(par['AntennaID']))
-    data += struct.pack('!B', par['ProtocolID'])
-    data += struct.pack('!B', par['C'] and (1 << 7) or 0)
-    data += struct.pack('!I', par['ROSpecID'])
-
-    data += TLV_encode('AccessSpecStopTrigger')(par['AccessSpecStopTrigger'])
+    data = TLV_encode('AccessSpecStopTrigger')(par['AccessSpecStopTrigger'])
     data += TLV_encode('AccessCommand')(par['AccessCommand'])
     if 'AccessReportSpec' in par:
         data += TLV_encode('AccessReportSpec')(par['AccessReportSpec'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           int(par['AccessSpecID']), int(par['AntennaID']),
+                           par['ProtocolID'], par['C'] and (1 << 7) or 0,
+                           par['ROSpecID']) + data
 
     return data
 
 # 17.2.5.1 AccessSpec
 TLV_struct['AccessSpec'] = {
     'type': 207,
+    'format': '!HHIHBBI',
     'fields': [
         'Type',
         'AccessSpecID',
@@ -1730,17 +1745,19 @@ TLV_struct['AccessSpec'] = {
 
 # 17.2.6.1 LLRPConfigurationStateValue Parameter
 def decode_LLRPConfigurationStateValue(data):
-    Type, Length, LLRPConfigurationStateValue = struct.unpack("!HHI", data[:8])
+    Type, Length, LLRPConfigurationStateValue = \
+        TLV_struct['LLRPConfigurationStateValue']['struct'].unpack_from(data)
 
     par = {'Type': Type,
            'Length': Length,
            'LLRPConfigurationStateValue': LLRPConfigurationStateValue}
 
-    return par, data[8:]
+    return par, data[TLV_struct['LLRPConfigurationStateValue']['length']:]
 
 # 17.2.6.1 LLRPConfigurationStateValue Parameter
 TLV_struct['LLRPConfigurationStateValue'] = {
     'type': 217,
+    'format': '!HHI',
     'fields': [
         'Type', 'Length', 'LLRPConfigurationStateValue'
     ],
@@ -1749,10 +1766,12 @@ TLV_struct['LLRPConfigurationStateValue'] = {
 
 # 17.2.6.2 Identification Parameter
 def decode_Identification(data):
-    Type, Length, IDType, ByteCount = struct.unpack("!HHBH", data[:7])
+    Type, Length, IDType, ByteCount = \
+        TLV_struct['Identification']['struct'].unpack_from(data)
 
-    endIdx = 7+ByteCount
-    ReaderID = struct.unpack("!"+"B"*(ByteCount-2), data[7:endIdx])
+    startIdx = TLV_struct['Identification']['length']
+    endIdx = startIdx + ByteCount
+    ReaderID = struct.unpack("!"+"B"*(ByteCount-2), data[startIdx:endIdx])
 
     par = {'Type': Type,
            'Length': Length,
@@ -1765,6 +1784,7 @@ def decode_Identification(data):
 # 17.2.6.2 Identification Parameter
 TLV_struct['Identification'] = {
     'type': 218,
+    'format': '!HHBH',
     'fields': [
         'Type', 'Length', 'IDType', 'ByteCount', 'ReaderID'
     ],
@@ -1773,7 +1793,8 @@ TLV_struct['Identification'] = {
 
 # 17.2.6.3 GPOWriteData Parameter
 def decode_GPOWriteData(data):
-    Type, Length, GPOPortNumber, GPOData = struct.unpack("!HHHB", data[:7])
+    Type, Length, GPOPortNumber, GPOData = \
+        TLV_struct['GPOWriteData']['struct'].unpack_from(data)
     GPOData = GPOData >> 7
 
     par = {'Type': Type,
@@ -1781,11 +1802,12 @@ def decode_GPOWriteData(data):
            'GPOPortNumber': GPOPortNumber,
            'GPOData': GPOData}
 
-    return par, data[7:]
+    return par, data[TLV_struct['GPOWriteData']['length']:]
 
 # 17.2.6.3 GPOWriteData Parameter
 TLV_struct['GPOWriteData'] = {
     'type': 219,
+    'format': '!HHHB',
     'fields': [
         'Type', 'Length', 'GPOPortNumber', 'GPOData'
     ],
@@ -1795,18 +1817,20 @@ TLV_struct['GPOWriteData'] = {
 
 # 17.2.6.4 KeepaliveSpec Parameter
 def decode_KeepaliveSpec(data):
-    Type, Length, KeepaliveTriggerType, TimeInterval = struct.unpack("!HHBI", data[:9])
+    Type, Length, KeepaliveTriggerType, TimeInterval = \
+        TLV_struct['KeepaliveSpec']['struct'].unpack_from(data)
 
     par = {'Type': Type,
            'Length': Length,
            'KeepaliveTriggerType': KeepaliveTriggerType,
            'TimeInterval': TimeInterval}
 
-    return par, data[9:]
+    return par, data[TLV_struct['KeepaliveSpec']['length']:]
 
 # 17.2.6.4 KeepaliveSpec Parameter
 TLV_struct['KeepaliveSpec'] = {
     'type': 220,
+    'format': '!HHBI',
     'fields': [
         'Type', 'Length', 'KeepaliveTriggerType', 'TimeInterval'
     ],
@@ -1816,7 +1840,8 @@ TLV_struct['KeepaliveSpec'] = {
 
 # 17.2.6.5 AntennaProperties Parameter
 def decode_AntennaProperties(data):
-    Type, Length, Connected, AntennaID, AntennaGain = struct.unpack("!HHBHH", data[:9])
+    Type, Length, Connected, AntennaID, AntennaGain = \
+        TLV_struct['AntennaProperties']['struct'].unpack_from(data)
     Connected = Connected >> 7  # Antenna Connected (True/False)
 
     par = {'Type': Type,
@@ -1830,6 +1855,7 @@ def decode_AntennaProperties(data):
 # 17.2.6.5 AntennaProperties Parameter
 TLV_struct['AntennaProperties'] = {
     'type': 221,
+    'format': '!HHBHH',
     'fields': [
         'Type', 'Length', 'Connected', 'AntennaID', 'AntennaGain'
     ],
@@ -1838,7 +1864,8 @@ TLV_struct['AntennaProperties'] = {
 
 # 17.2.6.9 GPIPortCurrentState Parameter
 def decode_GPIPortCurrentState(data):
-    Type, Length, GPIPortNum, GPIConfig, GPIState = struct.unpack("!HHHBB", data[:8])
+    Type, Length, GPIPortNum, GPIConfig, GPIState = \
+        TLV_struct['GPIPortCurrentState']['struct'].unpack_from(data)
     GPIConfig = GPIConfig >> 7
 
     par = {'Type': Type,
@@ -1847,11 +1874,12 @@ def decode_GPIPortCurrentState(data):
            'GPIConfig': GPIConfig,
            'GPIState': GPIState}
 
-    return par, data[8:]
+    return par, data[TLV_struct['GPIPortCurrentState']['length']:]
 
 # 17.2.6.9 GPIPortCurrentState Parameter
 TLV_struct['GPIPortCurrentState'] = {
     'type': 225,
+    'format': '!HHHBB',
     'fields': [
         'Type', 'Length', 'GPIPortNum', 'GPIConfig', 'GPIState'
     ],
@@ -1860,18 +1888,20 @@ TLV_struct['GPIPortCurrentState'] = {
 
 # 17.2.6.10 EventsAndReports Parameter
 def decode_EventsAndReports(data):
-    Type, Length, HoldEventsAndReportsUponReconnect = struct.unpack("!HHB", data[:5])
+    Type, Length, HoldEventsAndReportsUponReconnect = \
+        TLV_struct['EventsAndReports']['struct'].unpack_from(data)
     HoldEventsAndReportsUponReconnect = HoldEventsAndReportsUponReconnect >> 7
 
     par = {'Type': Type,
            'Length': Length,
            'HoldEventsAndReportsUponReconnect': HoldEventsAndReportsUponReconnect}
 
-    return par, data[5:]
+    return par, data[TLV_struct['EventsAndReports']['length']:]
 
 # 17.2.6.10 EventsAndReports Parameter
 TLV_struct['EventsAndReports'] = {
     'type': 226,
+    'format': '!HHB',
     'fields': [
         'Type', 'Length', 'HoldEventsAndReportsUponReconnect'
     ],
@@ -1881,8 +1911,8 @@ TLV_struct['EventsAndReports'] = {
 
 # 17.2.7.5 ReaderEventNotificationSpec
 def decode_ReaderEventNotificationSpec(data):
-    Type, Length = struct.unpack("!HH", data[:4])
-    body = data[4:]
+    Type, Length = par_header_struct.unpack_from(data)
+    body = data[par_header_len:]
 
     if Type != TLV_struct['ReaderEventNotificationSpec']['type']:
         return {}, data
@@ -1909,7 +1939,8 @@ TLV_struct['ReaderEventNotificationSpec'] = {
 
 # 17.2.7.5.1 EventNotificationState Parameter
 def decode_EventNotificationState(data):
-    Type, Length, EventType, NotificationState = struct.unpack("!HHHB", data[:7])
+    Type, Length, EventType, NotificationState = \
+        TLV_struct['EventNotificationState']['struct'].unpack_from(data)
     NotificationState = NotificationState >> 7
 
     if Type != TLV_struct['EventNotificationState']['type']:
@@ -1920,11 +1951,12 @@ def decode_EventNotificationState(data):
            'EventType': EventType,
            'NotificationState': NotificationState}
 
-    return par, data[7:]
+    return par, data[TLV_struct['EventNotificationState']['length']:]
 
 # 17.2.7.5.1 EventNotificationState Parameter
 TLV_struct['EventNotificationState'] = {
     'type': 245,
+    'format': '!HHHB',
     'fields': [
         'Type', 'Length', 'EventType', 'NotificationState'
     ],
@@ -1964,11 +1996,12 @@ TLV_struct['ADD_ACCESSSPEC_RESPONSE'] = {
 
 # 17.1.23 DELETE_ACCESSSPEC
 def encode_DeleteAccessSpec(msg):
-    return struct.pack('!I', msg['AccessSpecID'])
+    return TLV_struct['DELETE_ACCESSSPEC']['struct'].pack(msg['AccessSpecID'])
 
 # 17.1.23 DELETE_ACCESSSPEC
 TLV_struct['DELETE_ACCESSSPEC'] = {
     'type': 41,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'AccessSpecID'
@@ -1995,11 +2028,12 @@ TLV_struct['DELETE_ACCESSSPEC_RESPONSE'] = {
 
 # 17.1.25 ENABLE_ACCESSSPEC
 def encode_EnableAccessSpec(msg):
-    return struct.pack('!I', msg['AccessSpecID'])
+    return TLV_struct['ENABLE_ACCESSSPEC']['struct'].pack(msg['AccessSpecID'])
 
 # 17.1.25 ENABLE_ACCESSSPEC
 TLV_struct['ENABLE_ACCESSSPEC'] = {
     'type': 42,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'AccessSpecID'
@@ -2026,11 +2060,12 @@ TLV_struct['ENABLE_ACCESSSPEC_RESPONSE'] = {
 
 # 17.1.27 DISABLE_ACCESSSPEC
 def encode_DisableAccessSpec(msg):
-    return struct.pack('!I', msg['AccessSpecID'])
+    return TLV_struct['DISABLE_ACCESSSPEC']['struct'].pack(msg['AccessSpecID'])
 
 # 17.1.27 DISABLE_ACCESSSPEC
 TLV_struct['DISABLE_ACCESSSPEC'] = {
     'type': 43,
+    'format': '!I',
     'fields': [
         'Ver', 'Type', 'ID',
         'AccessSpecID'
@@ -2057,19 +2092,17 @@ TLV_struct['DISABLE_ACCESSSPEC_RESPONSE'] = {
 
 def encode_AccessSpecStopTrigger(par):
     msgtype = TLV_struct['AccessSpecStopTrigger']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-
-    data = struct.pack('!B', int(par['AccessSpecStopTriggerType']))
-    data += struct.pack('!H', int(par['OperationCountValue']))
+    msg_header = TLV_struct['AccessSpecStopTrigger']['struct']
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, msg_header.size,
+                           int(par['AccessSpecStopTriggerType']),
+                           int(par['OperationCountValue']))
 
     return data
 
 TLV_struct['AccessSpecStopTrigger'] = {
     'type': 208,
+    'format': '!HHBH',
     'fields': [
         'Type',
         'AccessSpecStopTriggerType',
@@ -2081,8 +2114,6 @@ TLV_struct['AccessSpecStopTrigger'] = {
 
 def encode_AccessCommand(par):
     msgtype = TLV_struct['AccessCommand']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
 
     data = encode_C1G2TagSpec(par['TagSpecParameter'])
 
@@ -2096,8 +2127,7 @@ def encode_AccessCommand(par):
     else:
         data += encode_C1G2Read(par['OpSpecParameter'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = par_header_struct.pack(msgtype, len(data) + par_header_len) + data
 
     return data
 
@@ -2114,8 +2144,6 @@ TLV_struct['AccessCommand'] = {
 
 def encode_C1G2TagSpec(par):
     msgtype = TLV_struct['C1G2TagSpec']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
 
     targets = par['C1G2TargetTag']
     if type(targets) != list:
@@ -2123,8 +2151,7 @@ def encode_C1G2TagSpec(par):
     for target in targets:
         data = encode_C1G2TargetTag(target)
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = par_header_struct.pack(msgtype, len(data) + par_header_len) + data
     return data
 
 TLV_struct['C1G2TagSpec'] = {
@@ -2138,37 +2165,33 @@ TLV_struct['C1G2TagSpec'] = {
 
 
 def encode_bitstring(bstr, length_bytes):
-    def B(x):
-        return struct.pack('!B', x)
-    Bs = map(B, struct.unpack('>' + 'B'*len(bstr), bstr))
-    Bs += ['\x00'] * (length_bytes - len(bstr))
-    return ''.join(Bs)
+    return bstr + '\x00' * (length_bytes - len(bstr))
 
 
 def encode_C1G2TargetTag(par):
     msgtype = TLV_struct['C1G2TargetTag']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['C1G2TargetTag']['struct']
 
-    data = struct.pack('!B', ((int(par['MB']) << 6) |
-                       (par['M'] and (1 << 5) or 0)))
-    data += struct.pack('!H', int(par['Pointer']))
-    data += struct.pack('!H', int(par['MaskBitCount']))
+    data = ''
     if int(par['MaskBitCount']):
         numBytes = ((par['MaskBitCount'] - 1) / 8) + 1
         data += encode_bitstring(par['TagMask'], numBytes)
 
-    data += struct.pack('!H', int(par['DataBitCount']))
+    data += ushort_struct.pack(int(par['DataBitCount']))
     if int(par['DataBitCount']):
         numBytes = ((par['DataBitCount'] - 1) / 8) + 1
         data += encode_bitstring(par['TagData'], numBytes)
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           ((int(par['MB']) << 6) |
+                            (par['M'] and (1 << 5) or 0)),
+                           int(par['Pointer']),
+                           int(par['MaskBitCount'])) + data
     return data
 
 TLV_struct['C1G2TargetTag'] = {
     'type': 339,
+    'format': '!HHBHH',
     'fields': [
         'Type',
         'MB',
@@ -2186,20 +2209,18 @@ TLV_struct['C1G2TargetTag'] = {
 # 16.2.1.3.2.2 C1G2Read
 def encode_C1G2Read(par):
     msgtype = TLV_struct['C1G2Read']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-    data = struct.pack('!H', int(par['OpSpecID']))
-    data += struct.pack('!I', int(par['AccessPassword']))
-    data += struct.pack('!B', int(par['MB']) << 6)
-    data += struct.pack('!H', int(par['WordPtr']))
-    data += struct.pack('!H', int(par['WordCount']))
-
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    msg_header = TLV_struct['C1G2Read']['struct']
+    data = msg_header.pack(msgtype, msg_header.size,
+                           int(par['OpSpecID']),
+                           int(par['AccessPassword']),
+                           int(par['MB']) << 6,
+                           int(par['WordPtr']),
+                           int(par['WordCount']))
     return data
 
 TLV_struct['C1G2Read'] = {
     'type': 341,
+    'format': '!HHHIBHH',
     'fields': [
         'Type',
         'OpSpecID',
@@ -2215,22 +2236,21 @@ TLV_struct['C1G2Read'] = {
 # 16.2.1.3.2.3 C1G2Write
 def encode_C1G2Write(par):
     msgtype = TLV_struct['C1G2Write']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-
-    data = struct.pack('!H', int(par['OpSpecID']))
-    data += struct.pack('!I', int(par['AccessPassword']))
-    data += struct.pack('!B', int(par['MB']) << 6)
-    data += struct.pack('!H', int(par['WordPtr']))
-    data += struct.pack('!H', int(par['WriteDataWordCount']))
-    data += par['WriteData']
-
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    msg_header = TLV_struct['C1G2Write']['struct']
+
+    data = par['WriteData']
+
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           int(par['OpSpecID']),
+                           int(par['AccessPassword']),
+                           int(par['MB']) << 6,
+                           int(par['WordPtr']),
+                           int(par['WriteDataWordCount'])) + data
     return data
 
 TLV_struct['C1G2Write'] = {
     'type': 342,
+    'format': '!HHHIBHH',
     'fields': [
         'Type',
         'OpSpecID',
@@ -2247,20 +2267,19 @@ TLV_struct['C1G2Write'] = {
 # 16.2.1.3.2.5 C1G2Lock Parameter
 def encode_C1G2Lock(par):
     msgtype = TLV_struct['C1G2Lock']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['C1G2Lock']['struct']
 
-    data = struct.pack('!H', int(par['OpSpecID']))
-    data += struct.pack('!I', int(par['AccessPassword']))
-    for payload in par['LockPayload']:
-        data += encode_C1G2LockPayload(payload)
+    data = ''.join(encode_C1G2LockPayload(payload)
+                   for payload in par['LockPayload'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           int(par['OpSpecID']),
+                           int(par['AccessPassword'])) + data
     return data
 
 TLV_struct['C1G2Lock'] = {
     'type': 344,
+    'format': '!HHHI',
     'fields': [
         'Type',
         'OpSpecID',
@@ -2273,18 +2292,16 @@ TLV_struct['C1G2Lock'] = {
 # 16.2.1.3.2.5.1 C1G2LockPayload Parameter
 def encode_C1G2LockPayload(par):
     msgtype = TLV_struct['C1G2LockPayload']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['C1G2LockPayload']['struct']
 
-    data = struct.pack('!B', int(par['Privilege']))
-    data += struct.pack('!b', int(par['DataField']))
-
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, msg_header.size,
+                           int(par['Privilege']),
+                           int(par['DataField']))
     return data
 
 TLV_struct['C1G2LockPayload'] = {
     'type': 345,
+    'format': '!HHBb',
     'fields': [
         'Type',
         'OpSpecID',
@@ -2297,22 +2314,21 @@ TLV_struct['C1G2LockPayload'] = {
 # 16.2.1.3.2.7 C1G2BlockWrite
 def encode_C1G2BlockWrite(par):
     msgtype = TLV_struct['C1G2BlockWrite']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-
-    data = struct.pack('!H', int(par['OpSpecID']))
-    data += struct.pack('!I', int(par['AccessPassword']))
-    data += struct.pack('!B', int(par['MB']) << 6)
-    data += struct.pack('!H', int(par['WordPtr']))
-    data += struct.pack('!H', int(par['WriteDataWordCount']))
-    data += par['WriteData']
-
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    msg_header = TLV_struct['C1G2BlockWrite']['struct']
+
+    data = par['WriteData']
+
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           int(par['OpSpecID']),
+                           int(par['AccessPassword']),
+                           int(par['MB']) << 6,
+                           int(par['WordPtr']),
+                           int(par['WriteDataWordCount'])) + data
     return data
 
 TLV_struct['C1G2BlockWrite'] = {
     'type': 347,
+    'format': '!HHHIBHH',
     'fields': [
         'Type',
         'OpSpecID',
@@ -2326,29 +2342,28 @@ TLV_struct['C1G2BlockWrite'] = {
 }
 
 def decode_AccessReportSpec(data):
-    Type, Length, AccessReportTrigger = struct.unpack("!HHB", data[:5])
+    Type, Length, AccessReportTrigger = \
+        TLV_struct['AccessReportSpec']['struct'].unpack_from(data)
 
     par = {'Type': Type,
            'Length': Length,
            'AccessReportTrigger': AccessReportTrigger}
 
-    return par, data[5:]
+    return par, data[TLV_struct['AccessReportSpec']['length']:]
 
 
 def encode_AccessReportSpec(par):
     msgtype = TLV_struct['AccessReportSpec']['type']
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-
-    data = struct.pack('!B', par['AccessReportTrigger'])
+    msg_header = TLV_struct['AccessReportSpec']['struct']
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, msg_header.size,
+                           par['AccessReportTrigger'])
 
     return data
 
 TLV_struct['AccessReportSpec'] = {
     'type': 239,
+    'format': '!HHB',
     'fields': [
         'Type',
         'AccessReportTrigger'
@@ -2362,14 +2377,10 @@ TLV_struct['AccessReportSpec'] = {
 def encode_ROBoundarySpec(par):
     msgtype = TLV_struct['ROBoundarySpec']['type']
 
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-
     data = TLV_encode('ROSpecStartTrigger')(par['ROSpecStartTrigger'])
     data += TLV_encode('ROSpecStopTrigger')(par['ROSpecStopTrigger'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = par_header_struct.pack(msgtype, len(data) + par_header_len) + data
 
     return data
 
@@ -2389,18 +2400,15 @@ def encode_ROSpecStartTrigger(par):
     msgtype = TLV_struct['ROSpecStartTrigger']['type']
     t_type = StartTrigger_Name2Type[par['ROSpecStartTriggerType']]
 
-    msg_header = '!HHB'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['ROSpecStartTrigger']['struct']
 
-    data = ''
-
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len, t_type) + data
+    data = msg_header.pack(msgtype, msg_header.size, t_type)
 
     return data
 
 TLV_struct['ROSpecStartTrigger'] = {
     'type': 179,
+    'format': '!HHB',
     'fields': [
         'Type',
         'ROSpecStartTriggerType',
@@ -2417,19 +2425,15 @@ def encode_ROSpecStopTrigger(par):
     t_type = StopTrigger_Name2Type[par['ROSpecStopTriggerType']]
     duration = par['DurationTriggerValue']
 
-    msg_header = '!HHBI'
-    msg_header_len = struct.calcsize(msg_header)
-
-    data = ''
+    msg_header = TLV_struct['ROSpecStopTrigger']['struct']
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len,
-                       t_type, duration) + data
+    data = msg_header.pack(msgtype, msg_header.size, t_type, duration)
 
     return data
 
 TLV_struct['ROSpecStopTrigger'] = {
     'type': 182,
+    'format': '!HHBI',
     'fields': [
         'Type',
         'ROSpecStopTriggerType',
@@ -2444,9 +2448,7 @@ TLV_struct['ROSpecStopTrigger'] = {
 def encode_AISpec(par):
     msgtype = TLV_struct['AISpec']['type']
 
-    msg_header = '!HHH'
-    msg_header_len = struct.calcsize(msg_header)
-    data = ''
+    msg_header = TLV_struct['AISpec']['struct']
 
     antid = par['AntennaIDs']
     antennas = []
@@ -2454,19 +2456,19 @@ def encode_AISpec(par):
         antennas = antid.split()
     else:
         antennas.extend(antid)
-    for a in antennas:
-        data += struct.pack('!H', int(a))
+    data = ''.join(ushort_struct.pack(int(a)) for a in antennas)
 
     data += TLV_encode('AISpecStopTrigger')(par['AISpecStopTrigger'])
     data += TLV_encode('InventoryParameterSpec')(par['InventoryParameterSpec'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len, len(antennas)) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           len(antennas)) + data
 
     return data
 
 TLV_struct['AISpec'] = {
     'type': 183,
+    'format': '!HHH',
     'fields': [
         'Type',
         'AntennaCount',
@@ -2484,19 +2486,15 @@ def encode_AISpecStopTrigger(par):
     t_type = StopTrigger_Name2Type[par['AISpecStopTriggerType']]
     duration = int(par['DurationTriggerValue'])
 
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['AISpecStopTrigger']['struct']
 
-    data = struct.pack('!B', t_type)
-    data += struct.pack('!I', int(duration))
-
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len) + data
+    data = msg_header.pack(msgtype, msg_header.size, t_type, duration)
 
     return data
 
 TLV_struct['AISpecStopTrigger'] = {
     'type': 184,
+    'format': '!HHBI',
     'fields': [
         'Type',
         'AISpecStopTriggerType',
@@ -2512,22 +2510,22 @@ TLV_struct['AISpecStopTrigger'] = {
 def encode_InventoryParameterSpec(par):
     msgtype = TLV_struct['InventoryParameterSpec']['type']
 
-    msg_header = '!HH'
-    msg_header_len = struct.calcsize(msg_header)
-    data = struct.pack('!H', par['InventoryParameterSpecID'])
-    data += struct.pack('!B', par['ProtocolID'])
+    msg_header = TLV_struct['InventoryParameterSpec']['struct']
+    data = ''
 
     for antconf in par['AntennaConfiguration']:
         logger.debug('encoding AntennaConfiguration: %s', antconf)
         data += TLV_encode('AntennaConfiguration')(antconf)
 
-    data = struct.pack(msg_header, msgtype,
-                       msg_header_len + len(data)) + data
+    data = msg_header.pack(msgtype, msg_header.size + len(data),
+                           par['InventoryParameterSpecID'],
+                           par['ProtocolID']) + data
 
     return data
 
 TLV_struct['InventoryParameterSpec'] = {
     'type': 186,
+    'format': '!HHHB',
     'fields': [
         'Type',
         'InventoryParameterSpecID',
@@ -2541,21 +2539,22 @@ TLV_struct['InventoryParameterSpec'] = {
 # 16.2.6.6 AntennaConfiguration Parameter
 def encode_AntennaConfiguration(par):
     msgtype = TLV_struct['AntennaConfiguration']['type']
-    msg_header = '!HH'
-    data = struct.pack('!H', int(par['AntennaID']))
+    msg_header = TLV_struct['AntennaConfiguration']['struct']
+    data = ''
     if 'RFReceiver' in par:
         data += TLV_encode('RFReceiver')(par['RFReceiver'])
     if 'RFTransmitter' in par:
         data += TLV_encode('RFTransmitter')(par['RFTransmitter'])
     if 'C1G2InventoryCommand' in par:
         data += TLV_encode('C1G2InventoryCommand')(par['C1G2InventoryCommand'])
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           int(par['AntennaID'])) + data
     return data
 
 def decode_AntennaConfiguration(data):
-    Type, Length, AntennaID = struct.unpack("!HHH", data[:6])
-    body = data[6:]
+    Type, Length, AntennaID = \
+        TLV_struct['AntennaConfiguration']['struct'].unpack_from(data)
+    body = data[TLV_struct['AntennaConfiguration']['length']:]
 
     if Type != TLV_struct['AntennaConfiguration']['type']:
         return {}, data
@@ -2578,6 +2577,7 @@ def decode_AntennaConfiguration(data):
 
 TLV_struct['AntennaConfiguration'] = {
     'type': 222,
+    'format': '!HHH',
     'fields': [
         'Type',
         'AntennaID',
@@ -2592,23 +2592,24 @@ TLV_struct['AntennaConfiguration'] = {
 }
 
 def decode_RFReceiver(data):
-    Type, Length, ReceiverSensitivity = struct.unpack("!HHH", data[:6])
+    Type, Length, ReceiverSensitivity = \
+        TLV_struct['RFReceiver']['struct'].unpack_from(data)
     par = {'Type': Type,
            'Length': Length,
            'ReceiverSensitivity': ReceiverSensitivity}
-    return par, data[6:]
+    return par, data[TLV_struct['RFReceiver']['length']:]
 
 # 16.2.6.7 RFReceiver Parameter
 def encode_RFReceiver(par):
     msgtype = TLV_struct['RFReceiver']['type']
-    msg_header = '!HH'
-    data = struct.pack('!H', par['ReceiverSensitivity'])
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    msg_header = TLV_struct['RFReceiver']['struct']
+    data = msg_header.pack(msgtype, msg_header.size,
+                           par['ReceiverSensitivity'])
     return data
 
 TLV_struct['RFReceiver'] = {
     'type': 223,
+    'format': '!HHH',
     'fields': [
         'Type',
         'ReceiverSensitivity',
@@ -2619,27 +2620,28 @@ TLV_struct['RFReceiver'] = {
 
 
 def decode_RFTransmitter(data):
-    Type, Length, HopTableId, ChannelIndex, TransmitPower = struct.unpack("!HHHHH", data[:10])
+    Type, Length, HopTableId, ChannelIndex, TransmitPower = \
+        TLV_struct['RFTransmitter']['struct'].unpack_from(data)
     par = {'Type': Type,
            'Length': Length,
            'HopTableId': HopTableId,
            'ChannelIndex': ChannelIndex,
            'TransmitPower': TransmitPower}
-    return par, data[10:]
+    return par, data[TLV_struct['RFTransmitter']['length']:]
 
 # 16.2.6.8 RFTransmitter Parameter
 def encode_RFTransmitter(par):
     msgtype = TLV_struct['RFTransmitter']['type']
-    msg_header = '!HH'
-    data = struct.pack('!H', par['HopTableId'])
-    data += struct.pack('!H', par['ChannelIndex'])
-    data += struct.pack('!H', par['TransmitPower'])
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    msg_header = TLV_struct['RFTransmitter']['struct']
+    data = msg_header.pack(msgtype, msg_header.size,
+                           par['HopTableId'],
+                           par['ChannelIndex'],
+                           par['TransmitPower'])
     return data
 
 TLV_struct['RFTransmitter'] = {
     'type': 224,
+    'format': '!HHHHH',
     'fields': [
         'Type',
         'HopTableId',
@@ -2654,8 +2656,8 @@ TLV_struct['RFTransmitter'] = {
 # 16.3.1.2.1 C1G2InventoryCommand Parameter
 def encode_C1G2InventoryCommand(par):
     msgtype = TLV_struct['C1G2InventoryCommand']['type']
-    msg_header = '!HH'
-    data = struct.pack('!B', (par['TagInventoryStateAware'] and 1 or 0) << 7)
+    msg_header = TLV_struct['C1G2InventoryCommand']['struct']
+    data = ''
     if 'C1G2Filter' in par:
         data += TLV_encode('C1G2Filter')(par['C1G2Filter'])
     if 'C1G2RFControl' in par:
@@ -2664,12 +2666,14 @@ def encode_C1G2InventoryCommand(par):
         data += TLV_encode('C1G2SingulationControl')(par['C1G2SingulationControl'])
     # XXX custom parameters
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    state_aware = (par['TagInventoryStateAware'] and 1 or 0) << 7
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           state_aware) + data
     return data
 
 TLV_struct['C1G2InventoryCommand'] = {
     'type': 330,
+    'format': '!HHB',
     'fields': [
         'TagInventoryStateAware',
         'C1G2Filter',
@@ -2695,15 +2699,15 @@ TLV_struct['C1G2Filter'] = {
 # 16.3.1.2.1.2 C1G2RFControl Parameter
 def encode_C1G2RFControl(par):
     msgtype = TLV_struct['C1G2RFControl']['type']
-    msg_header = '!HH'
-    data = struct.pack('!H', par['ModeIndex'])
-    data += struct.pack('!H', par['Tari'])
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    msg_header = TLV_struct['C1G2RFControl']['struct']
+    data = msg_header.pack(msgtype, msg_header.size,
+                           par['ModeIndex'],
+                           par['Tari'])
     return data
 
 TLV_struct['C1G2RFControl'] = {
     'type': 335,
+    'format': '!HHHH',
     'fields': [
         'ModeIndex',
         'Tari',
@@ -2715,16 +2719,16 @@ TLV_struct['C1G2RFControl'] = {
 # 16.3.1.2.1.3 C1G2SingulationControl Parameter
 def encode_C1G2SingulationControl(par):
     msgtype = TLV_struct['C1G2SingulationControl']['type']
-    msg_header = '!HH'
-    data = struct.pack('!B', par['Session'] << 6)
-    data += struct.pack('!H', par['TagPopulation'])
-    data += struct.pack('!I', par['TagTransitTime'])
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    msg_header = TLV_struct['C1G2SingulationControl']['struct']
+    data = msg_header.pack(msgtype, msg_header.size,
+                           par['Session'] << 6,
+                           par['TagPopulation'],
+                           par['TagTransitTime'])
     return data
 
 TLV_struct['C1G2SingulationControl'] = {
     'type': 336,
+    'format': '!HHBHI',
     'fields': [
         'Session',
         'TagPopulation',
@@ -2736,8 +2740,11 @@ TLV_struct['C1G2SingulationControl'] = {
 
 # 16.2.7.1 ROReportSpec Parameter
 def decode_ROReportSpec(data):
-    Type, Length, ROReportTrigger, N = struct.unpack("!HHBH", data[:7])
-    TagReportContentSelector, body = TLV_struct['TagReportContentSelector']['decode'](data[7:])
+    Type, Length, ROReportTrigger, N = \
+        TLV_struct['ROReportSpec']['struct'].unpack_from(data)
+    TagReportContentSelector, body = \
+        TLV_struct['TagReportContentSelector']['decode'](
+            data[TLV_struct['ROReportSpec']['length']:])
 
     par = {'Type': Type,
            'N': N,
@@ -2753,19 +2760,18 @@ def encode_ROReportSpec(par):
     n = int(par['N'])
     roReportTrigger = ROReportTrigger_Name2Type[par['ROReportTrigger']]
 
-    msg_header = '!HHBH'
-    msg_header_len = struct.calcsize(msg_header)
+    msg_header = TLV_struct['ROReportSpec']['struct']
 
     data = TLV_encode('TagReportContentSelector')(par['TagReportContentSelector'])
 
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + msg_header_len,
-                       roReportTrigger, n) + data
+    data = msg_header.pack(msgtype, len(data) + msg_header.size,
+                           roReportTrigger, n) + data
 
     return data
 
 TLV_struct['ROReportSpec'] = {
     'type': 237,
+    'format': '!HHBH',
     'fields': [
         'N',
         'ROReportTrigger',
@@ -2778,7 +2784,8 @@ TLV_struct['ROReportSpec'] = {
 
 # 16.2.7.1 TagReportContentSelector Parameter
 def decode_TagReportContentSelector(data):
-    Type, Length, EnableBits = struct.unpack("!HHH", data[:6])
+    Type, Length, EnableBits = \
+        TLV_struct['TagReportContentSelector']['struct'].unpack_from(data)
 
     EnableROSpecID = (EnableBits >> 15) & 1
     EnableSpecIndex = (EnableBits >> 14) & 1
@@ -2805,13 +2812,13 @@ def decode_TagReportContentSelector(data):
            'EnableTagSeenCount': EnableTagSeenCount,
            'EnableAccessSpecID': EnableAccessSpecID}
 
-    return par, data[6:]
+    return par, data[TLV_struct['TagReportContentSelector']['length']:]
 
 # 16.2.7.1 TagReportContentSelector Parameter
 def encode_TagReportContentSelector(par):
     msgtype = TLV_struct['TagReportContentSelector']['type']
 
-    msg_header = '!HH'
+    msg_header = TLV_struct['TagReportContentSelector']['struct']
 
     flags = 0
     i = 15
@@ -2820,14 +2827,13 @@ def encode_TagReportContentSelector(par):
             flags = flags | (1 << i)
         i = i - 1
 
-    data = struct.pack('!H', flags)
-    data = struct.pack(msg_header, msgtype,
-                       len(data) + struct.calcsize(msg_header)) + data
+    data = msg_header.pack(msgtype, msg_header.size, flags)
 
     return data
 
 TLV_struct['TagReportContentSelector'] = {
     'type': 238,
+    'format': '!HHH',
     'fields': [
         'EnableROSpecID',
         'EnableSpecIndex',
@@ -2848,13 +2854,11 @@ TLV_struct['TagReportContentSelector'] = {
 # 16.2.7.3 TagReportData Parameter
 def decode_TagReportData(data):
     par = {}
-    logger.debug(func())
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['TagReportData']['type']:
         return (None, data)
@@ -2875,13 +2879,14 @@ def decode_TagReportData(data):
             raise LLRPError('missing or invalid EPCData parameter')
 
     # grab TV-encoded parameters
-    while body:
-        ret, nbytes = llrp_decoder.decode_tve_parameter(body)
+    offset = 0
+    while offset < len(body):
+        ret, offset = llrp_decoder.decode_tve_parameter(body, offset)
         if ret:
             par.update(ret)
-            body = body[nbytes:]
         else:
             break
+    body = body[offset:]
 
     ret, body = decode_OpSpecResult(body)
     if ret:
@@ -2915,16 +2920,294 @@ TLV_struct['TagReportData'] = {
 }
 
 
+def decode_TagReportData_from(data, offset=0):
+    """decode_TagReportData for the parameter at data[offset:], returning
+    (par, offset just past the parameter)."""
+    if len(data) - offset < par_header_len:
+        return None, offset
+    msgtype, length = par_header_struct.unpack_from(data, offset)
+    if msgtype & BITMASK(10) != TLV_struct['TagReportData']['type'] or \
+            length < par_header_len:
+        return None, offset
+    par, _ = decode_TagReportData(data[offset:offset + length])
+    return par, offset + length
+
+
+class TagReportDataDecoder(object):
+    """TagReportData decoder specialized for one TagReportContentSelector.
+
+    The selector sent in the ROReportSpec tells us which TV-encoded fields
+    the reader will put in each TagReportData, and in which order.  For the
+    common case of an EPC-96 followed by exactly those fields, the whole
+    parameter is unpacked with a single precompiled struct.Struct.  Anything
+    else (EPCData, OpSpecResults, Uptime instead of UTC timestamps, ...)
+    falls back to decode_TagReportData, so the result is always the same as
+    the generic decoder's.
+
+    Instances can be used wherever TLV_decode('TagReportData') is."""
+
+    # TV parameters enabled by each selector flag, in the order the spec
+    # lays them out inside TagReportData
+    selector_layout = (
+        ('EnableROSpecID', 9, 9),
+        ('EnableSpecIndex', 14, 14),
+        ('EnableInventoryParameterSpecID', 10, 10),
+        ('EnableAntennaID', 1, 1),
+        ('EnablePeakRRSI', 6, 6),
+        ('EnableChannelIndex', 7, 7),
+        ('EnableFirstSeenTimestamp', 2, 3),  # (UTC type, Uptime type)
+        ('EnableLastSeenTimestamp', 4, 5),
+        ('EnableTagSeenCount', 8, 8),
+        ('EnableAccessSpecID', 16, 16),
+    )
+
+    def __init__(self, selector, uptime=False):
+        fmt = par_header + 'B12s'
+        types = [0x80 | TV_struct['EPC-96']['type']]
+        names = []
+        for flag, utc_type, uptime_type in self.selector_layout:
+            if not selector.get(flag):
+                continue
+            tvtype = uptime_type if uptime else utc_type
+            name, tvfmt = llrp_decoder.tve_param_formats[tvtype]
+            fmt += 'B' + tvfmt.lstrip('!')
+            types.append(0x80 | tvtype)
+            names.append(name)
+        self.fast = struct.Struct(fmt)
+        self.length = self.fast.size
+        self.types = tuple(types)
+        self.names = tuple(names)
+        self.fast_hits = 0
+        self.fallbacks = 0
+
+    def unpack_from(self, data, offset=0):
+        """Fast path only: return the raw unpacked values of the
+        TagReportData at data[offset:] if it has exactly the expected
+        layout, otherwise None.
+
+        In the returned tuple, [3] is the raw EPC-96 and [5::2] are the
+        values of the fields listed in self.names."""
+        if len(data) - offset < self.length:
+            return None
+        vals = self.fast.unpack_from(data, offset)
+        if (vals[0] & BITMASK(10) == 240 and vals[1] == self.length and
+                vals[2::2] == self.types):
+            self.fast_hits += 1
+            return vals
+        return None
+
+    def decode_from(self, data, offset=0):
+        """Decode the TagReportData at data[offset:].
+
+        Returns (par, offset just past the parameter), or (None, offset) if
+        there is no TagReportData there."""
+        vals = self.unpack_from(data, offset)
+        if vals is not None:
+            par = {'EPC-96': hexlify(vals[3])}
+            for name, val in zip(self.names, vals[5::2]):
+                par[name] = (val,)
+            return par, offset + self.length
+        self.fallbacks += 1
+        return decode_TagReportData_from(data, offset)
+
+    def __call__(self, data):
+        par, end = self.decode_from(data)
+        return par, data[end:]
+
+
+class TagReportBatch(object):
+    """Columnar form of the TagReportData in one RO_ACCESS_REPORT.
+
+    Rather than a dict per tag (holding 1-tuples), the report is kept as
+    one array per field, filled in a single pass over the report:
+
+        epc_data, epc_offsets   raw EPC bytes of all tags back to back;
+                                tag i is epc_data[epc_offsets[i]:
+                                epc_offsets[i+1]] (see epc())
+        AntennaID, PeakRSSI, ChannelIndex, TagSeenCount, ...
+                                one column per TV field, see column()
+
+    Fields that do not fit a column (ROSpecID, OpSpecResult, EPCData
+    headers, ...) are kept per tag in self.extras.
+
+    For existing callbacks the batch is also a read-only sequence of the
+    usual per-tag dicts; those are built on demand by __getitem__."""
+
+    # TagReportData field -> array typecode (None: plain list, for 64-bit
+    # timestamps that array.array cannot hold on every platform)
+    column_types = (
+        ('AntennaID', 'H'),
+        ('PeakRSSI', 'b'),
+        ('ChannelIndex', 'H'),
+        ('TagSeenCount', 'H'),
+        ('FirstSeenTimestampUTC', None),
+        ('FirstSeenTimestampUptime', None),
+        ('LastSeenTimestampUTC', None),
+        ('LastSeenTimestampUptime', None),
+    )
+    column_bits = dict((name, BIT(i))
+                       for i, (name, _) in enumerate(column_types))
+
+    def __init__(self):
+        self.epc_data = bytearray()
+        self.epc_offsets = array('L', [0])
+        self.columns = {}
+        self.present = array('H')  # per tag: column_bits of its fields
+        self.extras = {}  # tag index -> dict of non-column fields
+
+    def __len__(self):
+        return len(self.present)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('tag index out of range')
+        par = dict(self.extras.get(i, ()))
+        if 'EPCData' not in par:
+            par['EPC-96'] = hexlify(self.epc(i))
+        bits = self.present[i]
+        for name, _ in self.column_types:
+            if bits & self.column_bits[name]:
+                par[name] = (self.columns[name][i],)
+        return par
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def epc(self, i):
+        """Raw EPC bytes of tag i."""
+        return bytes(self.epc_data[self.epc_offsets[i]:
+                                   self.epc_offsets[i + 1]])
+
+    def column(self, name):
+        """Values of TagReportData field name, one per tag (0 for tags that
+        did not report the field), or None if no tag reported it."""
+        col = self.columns.get(name)
+        if col is None:
+            return None
+        if len(col) < len(self):
+            col.extend([0] * (len(self) - len(col)))
+        return col
+
+    def _column_for(self, name):
+        col = self.columns.get(name)
+        if col is None:
+            typecode = dict(self.column_types)[name]
+            col = array(typecode) if typecode else []
+            self.columns[name] = col
+        n = len(self.present)
+        if len(col) < n:
+            col.extend([0] * (n - len(col)))
+        return col
+
+    def _raw_columns(self, names):
+        """The append methods of the columns (padded to the current length)
+        that raw values of the fields names go into, and the present bits of
+        such a tag; None if some field has no column."""
+        if not all(name in self.column_bits for name in names):
+            return None
+        bits = 0
+        for name in names:
+            bits |= self.column_bits[name]
+        return [self._column_for(name).append for name in names], bits
+
+    def append_raw(self, epc, names, vals):
+        """Add a tag from raw values, as unpacked by
+        TagReportDataDecoder.unpack_from."""
+        bits = 0
+        extras = {}
+        for name, val in zip(names, vals):
+            if name in self.column_bits:
+                self._column_for(name).append(val)
+                bits |= self.column_bits[name]
+            else:
+                extras[name] = (val,)
+        self.epc_data.extend(epc)
+        self.epc_offsets.append(len(self.epc_data))
+        if extras:
+            self.extras[len(self.present)] = extras
+        self.present.append(bits)
+
+    def append(self, par):
+        """Add a tag from a decode_TagReportData dict."""
+        extras = {}
+        bits = 0
+        for name, val in par.items():
+            if name in self.column_bits:
+                self._column_for(name).append(val[0])
+                bits |= self.column_bits[name]
+            elif name != 'EPC-96':
+                extras[name] = val
+        if 'EPC-96' in par:
+            epc = par['EPC-96']
+        else:
+            epc = par['EPCData']['EPC']
+        self.epc_data.extend(unhexlify(epc))
+        self.epc_offsets.append(len(self.epc_data))
+        if extras:
+            self.extras[len(self.present)] = extras
+        self.present.append(bits)
+
+    @classmethod
+    def from_report(cls, data, tag_decoder=None):
+        """Build a batch from the parameters of an RO_ACCESS_REPORT."""
+        batch = cls()
+        offset = 0
+        # the fast path appends straight to the columns of the decoder's
+        # fields, looked up once and again after every other tag (which may
+        # have left them short)
+        raw = None
+        epc_data, epc_offsets = batch.epc_data, batch.epc_offsets
+        present = batch.present
+        while offset < len(data):
+            if tag_decoder is not None:
+                vals = tag_decoder.unpack_from(data, offset)
+                if vals is not None:
+                    if raw is None:
+                        raw = batch._raw_columns(tag_decoder.names) or False
+                    if raw:
+                        appends, bits = raw
+                        for append, val in zip(appends, vals[5::2]):
+                            append(val)
+                        epc_data.extend(vals[3])
+                        epc_offsets.append(len(epc_data))
+                        present.append(bits)
+                    else:
+                        batch.append_raw(vals[3], tag_decoder.names,
+                                         vals[5::2])
+                    offset += tag_decoder.length
+                    continue
+                tag_decoder.fallbacks += 1
+            par, offset = decode_TagReportData_from(data, offset)
+            if par is None:
+                break
+            batch.append(par)
+            raw = None
+        return batch
+
+
+def decode_ROAccessReport_columnar(data, tag_decoder=None):
+    """decode_ROAccessReport, but TagReportData is a TagReportBatch."""
+    msg = LLRPMessageDict()
+    msg['TagReportData'] = TagReportBatch.from_report(data, tag_decoder)
+    return msg
+
+
 def decode_OpSpecResult(data):
     # handle any of the C1G2*OpSpecResult types
     par = {}
-    logger.debug(func())
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     c1g2opspecresults = ('C1G2ReadOpSpecResult',
                          'C1G2WriteOpSpecResult',
@@ -2938,25 +3221,25 @@ def decode_OpSpecResult(data):
     ok_types = (TLV_struct[x]['type'] for x in c1g2opspecresults)
     if msgtype not in ok_types:
         return (None, data)
-    body = data[par_header_len:length]
 
     # all OpSpecResults begin with Result and OpSpecID
-    par['Result'], par['OpSpecID'] = struct.unpack('!BH', body[:3])
-    body = body[3:]
+    fmt = TLV_struct['OpSpecResult']['struct']
+    par['Result'], par['OpSpecID'] = fmt.unpack_from(data)[2:]
+    body = data[fmt.size:length]
 
     if msgtype == TLV_struct['C1G2ReadOpSpecResult']['type']:
-        wordcnt = struct.unpack('!H', body[:2])[0]
+        wordcnt = ushort_struct.unpack_from(body)[0]
         par['ReadDataWordCount'] = wordcnt
         end = 2 + (wordcnt*2)
         par['ReadData'] = body[2:end]
 
     elif msgtype in (TLV_struct['C1G2WriteOpSpecResult']['type'],
                      TLV_struct['C1G2BlockWriteOpSpecResult']['type']):
-        par['NumWordsWritten'] = struct.unpack('!H', body[:2])[0]
+        par['NumWordsWritten'] = ushort_struct.unpack_from(body)[0]
 
     if msgtype == TLV_struct['C1G2GetBlockPermalockStatusOpSpecResult']\
         ['type']:
-        wordcnt = struct.unpack('!H', body[:2])[0]
+        wordcnt = ushort_struct.unpack_from(body)[0]
         par['StatusWordCount'] = wordcnt
         end = 2 + (wordcnt*2)
         par['PermalockStatus'] = body[2:end]
@@ -2965,6 +3248,7 @@ def decode_OpSpecResult(data):
 
 TLV_struct['OpSpecResult'] = {
     'type': -1,
+    'format': '!HHBH',
     'fields': [
         'Type',
         'Result',
@@ -3082,23 +3366,22 @@ def decode_EPCData(data):
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['EPCData']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_EPCData (type=%d len=%d)', msgtype, length)
 
     # Decode fields
-    (par['EPCLengthBits'], ) = struct.unpack('!H',
-                                             body[0:struct.calcsize('!H')])
-    par['EPC'] = body[struct.calcsize('!H'):].encode('hex')
+    fmt = TLV_struct['EPCData']['struct']
+    par['EPCLengthBits'] = fmt.unpack_from(data)[2]
+    par['EPC'] = data[fmt.size:length].encode('hex')
 
     return par, data[length:]
 
 TLV_struct['EPCData'] = {
     'type': 241,
+    'format': '!HHH',
     'fields': [
         'Type',
         'EPCLengthBits',
@@ -3115,14 +3398,13 @@ def decode_EPC96(data):
     if len(data) == 0:
         return None, data
 
-    header = data[0:tve_header_len]
-    (msgtype, ) = struct.unpack(tve_header, header)
+    (msgtype, ) = tve_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(7)
     if msgtype != TV_struct['EPC-96']['type']:
         return (None, data)
-    length = tve_header_len + (96 / 8)
+    length = TV_struct['EPC-96']['length']
     body = data[tve_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_EPC96 (type=%d len=%d)', msgtype, length)
 
     # Decode fields
     par['EPC'] = body.encode('hex')
@@ -3131,6 +3413,7 @@ def decode_EPC96(data):
 
 TV_struct['EPC-96'] = {
     'type': 13,
+    'format': '!B12s',
     'fields': [
         'Type',
         'EPC'
@@ -3146,21 +3429,21 @@ def decode_ROSpecID(data):
     if len(data) == 0:
         return None, data
 
-    header = data[0:tve_header_len]
-    (msgtype, ), length = struct.unpack(tve_header, header), 1 + 4
+    (msgtype, ) = tve_header_struct.unpack_from(data)
+    length = TV_struct['ROSpecID']['length']
     msgtype = msgtype & BITMASK(7)
-    if msgtype != TLV_struct['ROSpecID']['type']:
+    if msgtype != TV_struct['ROSpecID']['type']:
         return (None, data)
-    body = data[tve_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_ROSpecID (type=%d len=%d)', msgtype, length)
 
     # Decode fields
-    (par['ROSpecID'], ) = struct.unpack('!I', body)
+    par['ROSpecID'] = TV_struct['ROSpecID']['struct'].unpack_from(data)[1]
 
     return par, data[length:]
 
 TV_struct['ROSpecID'] = {
     'type': 9,
+    'format': '!BI',
     'fields': [
         'Type',
         'ROSpecID'
@@ -3176,11 +3459,11 @@ def decode_ReaderEventNotificationData(data):
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_ReaderEventNotificationData (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode parameters
     ret, body = TLV_decode('UTCTimestamp')(body)
@@ -3195,6 +3478,10 @@ def decode_ReaderEventNotificationData(data):
         else:
             raise LLRPError('missing UTCTimestamp and Uptime parameter')
 
+    ret, body = TLV_decode('ROSpecEvent')(body)
+    if ret:
+        par['ROSpecEvent'] = ret
+
     ret, body = TLV_decode('ConnectionAttemptEvent')(body)
     if ret:
         par['ConnectionAttemptEvent'] = ret
@@ -3229,24 +3516,57 @@ TLV_struct['ReaderEventNotificationData'] = {
 }
 
 
+# 16.2.7.6.4 ROSpecEvent Parameter
+def decode_ROSpecEvent(data):
+    par = {}
+
+    if len(data) == 0:
+        return None, data
+
+    msgtype, length = par_header_struct.unpack_from(data)
+    msgtype = msgtype & BITMASK(10)
+    if msgtype != TLV_struct['ROSpecEvent']['type']:
+        return (None, data)
+    logger.debug('decode_ROSpecEvent (type=%d len=%d)', msgtype, length)
+
+    # Decode fields
+    (event_type, rospec_id, preempting_id) = \
+        TLV_struct['ROSpecEvent']['struct'].unpack_from(data)[2:]
+    par['EventType'] = ROSpecEvent_Type2Name.get(event_type, event_type)
+    par['ROSpecID'] = rospec_id
+    par['PreemptingROSpecID'] = preempting_id
+
+    return par, data[length:]
+
+TLV_struct['ROSpecEvent'] = {
+    'type': 249,
+    'format': '!HHBII',
+    'fields': [
+        'Type',
+        'EventType',
+        'ROSpecID',
+        'PreemptingROSpecID'
+    ],
+    'decode': decode_ROSpecEvent
+}
+
+
 # 16.2.7.6.9 AntennaEvent Parameter
 def decode_AntennaEvent(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['AntennaEvent']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_AntennaEvent (type=%d len=%d)', msgtype, length)
 
     # Decode fields
-    (event_type, antenna_id) = struct.unpack('!BH', body)
+    (event_type, antenna_id) = \
+        TLV_struct['AntennaEvent']['struct'].unpack_from(data)[2:]
     par['EventType'] = event_type and 'Connected' or 'Disconnected'
     par['AntennaID'] = antenna_id
 
@@ -3254,6 +3574,7 @@ def decode_AntennaEvent(data):
 
 TLV_struct['AntennaEvent'] = {
     'type': 255,
+    'format': '!HHBH',
     'fields': [
         'Type',
         'EventType',
@@ -3265,28 +3586,28 @@ TLV_struct['AntennaEvent'] = {
 
 # 16.2.7.6.10 ConnectionAttemptEvent Parameter
 def decode_ConnectionAttemptEvent(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['ConnectionAttemptEvent']['type']:
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_ConnectionAttemptEvent (type=%d len=%d)',
+                 msgtype, length)
 
     # Decode fields
-    (status, ) = struct.unpack('!H', body)
+    status = \
+        TLV_struct['ConnectionAttemptEvent']['struct'].unpack_from(data)[2]
     par['Status'] = ConnEvent_Type2Name[status]
 
     return par, data[length:]
 
 TLV_struct['ConnectionAttemptEvent'] = {
     'type': 256,
+    'format': '!HHH',
     'fields': [
         'Type',
         'Status'
@@ -3297,19 +3618,18 @@ TLV_struct['ConnectionAttemptEvent'] = {
 
 # 16.2.7.6.11 ConnectionCloseEvent Parameter
 def decode_ConnectionCloseEvent(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['ConnectionCloseEvent']['type']:
         return (None, data)
 
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_ConnectionCloseEvent (type=%d len=%d)',
+                 msgtype, length)
 
     return par, data[length:]
 
@@ -3324,35 +3644,33 @@ TLV_struct['ConnectionCloseEvent'] = {
 
 # 16.2.8.1 LLRPStatus Parameter
 def decode_LLRPStatus(data):
-    logger.debug(func())
     par = {}
     logger.debug('decode_LLRPStatus: %s', hexlify(data))
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['LLRPStatus']['type']:
         logger.debug('got msgtype={0}, expected {1}'.format(msgtype,
                      TLV_struct['LLRPStatus']['type']))
         logger.debug('note length=%d', length)
         return (None, data)
-    body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d)', func(), msgtype, length)
+    logger.debug('decode_LLRPStatus (type=%d len=%d)', msgtype, length)
 
     # Decode fields
-    offset = struct.calcsize('!HH')
-    (code, n) = struct.unpack('!HH', body[:offset])
+    fmt = TLV_struct['LLRPStatus']['struct']
+    (code, n) = fmt.unpack_from(data)[2:]
     try:
         par['StatusCode'] = Error_Type2Name[code]
     except KeyError:
         logger.warning('Unknown field code %s', code)
-    par['ErrorDescription'] = body[offset:offset + n]
+    offset = fmt.size
+    par['ErrorDescription'] = data[offset:offset + n]
 
     # Decode parameters
-    ret, body = TLV_decode('FieldError')(body[offset + n:])
+    ret, body = TLV_decode('FieldError')(data[offset + n:length])
     if ret:
         par['FieldError'] = ret
     else:
@@ -3372,6 +3690,7 @@ def decode_LLRPStatus(data):
 
 TLV_struct['LLRPStatus'] = {
     'type':   287,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'StatusCode',
@@ -3385,29 +3704,27 @@ TLV_struct['LLRPStatus'] = {
 
 # 16.2.8.1.1 FieldError Parameter
 def decode_FieldError(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['FieldError']['type']:
         return (None, data)
     body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d data=%s)', func(), msgtype, length,
+    logger.debug('decode_FieldError (type=%d len=%d data=%s)', msgtype, length,
                  repr(body))
 
     # Decode fields
-    offset = struct.calcsize('!H')
-    (par['FieldNum'], ) = struct.unpack('!H', body[:offset])
+    par['FieldNum'] = TLV_struct['FieldError']['struct'].unpack_from(data)[2]
 
     return par, data[length:]
 
 TLV_struct['FieldError'] = {
     'type':   288,
+    'format': '!HHH',
     'fields': [
         'Type',
         'ErrorCode',
@@ -3419,28 +3736,25 @@ TLV_struct['FieldError'] = {
 
 # 16.2.8.1.2 ParameterError Parameter
 def decode_ParameterError(data):
-    logger.debug(func())
     par = {}
 
     if len(data) == 0:
         return None, data
 
-    header = data[0:par_header_len]
-    msgtype, length = struct.unpack(par_header, header)
+    msgtype, length = par_header_struct.unpack_from(data)
     msgtype = msgtype & BITMASK(10)
     if msgtype != TLV_struct['ParameterError']['type']:
         return (None, data)
     body = data[par_header_len:length]
-    logger.debug('%s (type=%d len=%d data=%s)', func(), msgtype, length,
+    logger.debug('decode_ParameterError (type=%d len=%d data=%s)', msgtype, length,
                  repr(body))
 
     # Decode fields
-    offset = struct.calcsize('!HH')
-    par['ParameterType'], par['ErrorCode'] = struct.unpack('!HH',
-                                                           body[:offset])
+    fmt = TLV_struct['ParameterError']['struct']
+    par['ParameterType'], par['ErrorCode'] = fmt.unpack_from(data)[2:]
 
     # Decode parameters
-    ret, body = TLV_decode('FieldError')(body[offset:])
+    ret, body = TLV_decode('FieldError')(data[fmt.size:length])
     if ret:
         par['FieldError'] = ret
 
@@ -3456,6 +3770,7 @@ def decode_ParameterError(data):
 
 TLV_struct['ParameterError'] = {
     'type':   289,
+    'format': '!HHHH',
     'fields': [
         'Type',
         'ParameterType',
@@ -3467,35 +3782,186 @@ TLV_struct['ParameterError'] = {
 }
 
 
-def llrp_data2xml(msg):
-    def __llrp_data2xml(msg, name, level=0):
-        tabs = '\t' * level
+# name -> ([(field, XML start tag, XML end tag), ...] in TLV_struct order,
+#          set of those fields), so that rendering a message does not
+# rebuild them for every parameter
+_render_fields = {}
 
-        str = tabs + '<%s>\n' % name
 
-        fields = TLV_struct[name]['fields']
-        for p in fields:
-            try:
-                sub = msg[p]
-            except KeyError:
-                continue
+def _fields_of(name):
+    try:
+        return _render_fields[name]
+    except KeyError:
+        fields = TLV_struct.get(name, {}).get('fields', ())
+        rendered = _render_fields[name] = (
+            [(p, '<%s>' % p, '</%s>\n' % p) for p in fields], set(fields))
+        return rendered
 
-            if type(sub) is dict:
-                str += __llrp_data2xml(sub, p, level + 1)
-            elif type(sub) is list and sub and type(sub[0]) is dict:
-                for e in sub:
-                    str += __llrp_data2xml(e, p, level + 1)
-            else:
-                str += tabs + '\t<%s>%s</%s>\n' % (p, sub, p)
 
-        str += tabs + '</%s>\n' % name
+# The renderers append to one list, and at most once per element of a list
+# of parameters (such as TagReportData) hand what they have collected on as
+# a chunk, once it is RENDER_CHUNK pieces long.  Passing every line up
+# through each level of nesting would be slower than building one string.
+RENDER_CHUNK = 4096
+
+# (name, level) -> [(field, indented XML start tag, XML end tag), ...]
+_xml_fields = {}
+
+
+def _render_xml(par, name, level, out):
+    try:
+        fields = _xml_fields[name, level]
+    except KeyError:
+        tabs = '\t' * (level + 1)
+        fields = _xml_fields[name, level] = [
+            (p, tabs + start, end) for p, start, end in _fields_of(name)[0]]
+    tabs = '\t' * level
+    out.append('%s<%s>\n' % (tabs, name))
+    for p, start, end in fields:
+        # most fields are absent; testing beats catching KeyError
+        if p not in par:
+            continue
+        sub = par[p]
+        t = type(sub)
+        if isinstance(sub, dict):
+            for chunk in _render_xml(sub, p, level + 1, out):
+                yield chunk
+        elif t is list and sub and isinstance(sub[0], dict) or \
+                t is TagReportBatch:
+            for e in sub:
+                for chunk in _render_xml(e, p, level + 1, out):
+                    yield chunk
+                if len(out) >= RENDER_CHUNK:
+                    yield ''.join(out)
+                    del out[:]
+        else:
+            out.append('%s%s%s' % (start, sub, end))
+    out.append('%s</%s>\n' % (tabs, name))
+
+
+def iter_llrp_xml(msg):
+    """Generate the XML rendering of msg (a message dict) in chunks of many
+    lines.  Fields are rendered in TLV_struct order; fields it does not list
+    are left out."""
+    out = []
+    for p in msg:
+        for chunk in _render_xml(msg[p], p, 0, out):
+            yield chunk
+    yield ''.join(out)
+
+
+def write_llrp_xml(msg, fp):
+    """Write the XML rendering of msg to the file-like object fp a chunk at
+    a time."""
+    fp.writelines(iter_llrp_xml(msg))
+
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+
+def _json_value(value):
+    t = type(value)
+    # most tag fields are 1-tuples of ints; json.dumps is slow
+    if t is tuple and len(value) == 1 and type(value[0]) in (int, long):
+        return '[%d]' % value
+    if t is str:
+        try:
+            return _encode_string(value)
+        except UnicodeDecodeError:  # raw bytes, such as ReadData
+            return '"%s"' % hexlify(value)
+    if t is bytearray or t is memoryview:
+        return '"%s"' % hexlify(bytes(value))
+    return json.dumps(value)
+
+
+# name -> [(field, its JSON key followed by ': '), ...] in TLV_struct order
+_json_fields = {}
+
+
+def _render_json_value(sub, name, out):
+    t = type(sub)
+    if isinstance(sub, dict):
+        for chunk in _render_json(sub, name, out):
+            yield chunk
+    elif t is list and sub and isinstance(sub[0], dict) or \
+            t is TagReportBatch:
+        sep = '['
+        for e in sub:
+            out.append(sep)
+            sep = ', '
+            for chunk in _render_json(e, name, out):
+                yield chunk
+            if len(out) >= RENDER_CHUNK:
+                yield ''.join(out)
+                del out[:]
+        out.append('[]' if sep == '[' else ']')
+    else:
+        out.append(_json_value(sub))
 
-        return str
 
-    ans = ''
+def _render_json(par, name, out):
+    try:
+        fields = _json_fields[name]
+    except KeyError:
+        fields = _json_fields[name] = [
+            (p, json.dumps(p) + ': ') for p, _, _ in _fields_of(name)[0]]
+    sep = '{'
+    found = 0
+    for p, key in fields:
+        if p not in par:
+            continue
+        found += 1
+        out.append(sep)
+        out.append(key)
+        sep = ', '
+        for chunk in _render_json_value(par[p], p, out):
+            yield chunk
+    if found < len(par):
+        # fields TLV_struct does not list, such as decoded timestamps
+        known = _fields_of(name)[1]
+        for p in par:
+            if p in known:
+                continue
+            out.append('%s%s: ' % (sep, json.dumps(p)))
+            sep = ', '
+            for chunk in _render_json_value(par[p], p, out):
+                yield chunk
+    out.append('{}' if sep == '{' else '}')
+
+
+def iter_llrp_json(msg):
+    """Generate the rendering of msg as one line of JSON (without its
+    newline) in chunks.  Fields come in TLV_struct order, followed by any it
+    does not list; raw byte strings become hexadecimal."""
+    out = []
+    sep = '{'
     for p in msg:
-        ans += __llrp_data2xml(msg[p], p)
-    return ans[:-1]
+        out.append('%s%s: ' % (sep, json.dumps(p)))
+        sep = ', '
+        for chunk in _render_json(msg[p], p, out):
+            yield chunk
+    out.append('{}' if sep == '{' else '}')
+    yield ''.join(out)
+
+
+def write_llrp_jsonl(msg, fp):
+    """Write msg to the file-like object fp as a line of JSON, a chunk at a
+    time."""
+    fp.writelines(iter_llrp_json(msg))
+    fp.write('\n')
+
+
+def llrp_data2json(msg):
+    """Render msg as one line of JSON; see iter_llrp_json()."""
+    fp = StringIO()
+    fp.writelines(iter_llrp_json(msg))
+    return fp.getvalue()
+
+
+def llrp_data2xml(msg):
+    fp = StringIO()
+    write_llrp_xml(msg, fp)
+    return fp.getvalue()[:-1]
 
 
 class LLRPROSpec(dict):
@@ -3626,3 +4092,44 @@ for m in TV_struct:
     else:
         logging.debug('Pseudo-warning: TV_struct type {} '
                       'lacks "type" field'.format(m))
+
+# Compile the fixed-size layouts described by 'format' (see TLV_struct)
+for _registry in (TLV_struct, TV_struct):
+    for m in _registry:
+        if 'format' in _registry[m]:
+            _registry[m]['struct'] = struct.Struct(_registry[m]['format'])
+            _registry[m]['length'] = _registry[m]['struct'].size
+
+#
+# Codec tracing
+#
+
+# (entry, 'encode' or 'decode', label) for every codec in TLV_struct and
+# TV_struct; labels are resolved once, here, rather than on every call
+_codec_trace_entries = []
+for _registry, _kind in ((TLV_struct, 'TLV'), (TV_struct, 'TV')):
+    for m in _registry:
+        for _op in ('encode', 'decode'):
+            if _op in _registry[m]:
+                _codec_trace_entries.append(
+                    (_registry[m], _op, '{} {} {}'.format(
+                        _op, _kind, m)))
+
+
+def _traced(label, fn):
+    def trace(*args, **kwargs):
+        logger.debug(label)
+        return fn(*args, **kwargs)
+    trace.untraced = fn
+    return trace
+
+
+def set_codec_trace(enabled=True):
+    """Log the name of each encoder and decoder as it is entered.
+
+    Tracing is off by default and costs nothing then: enabling it wraps the
+    'encode' and 'decode' entries of TLV_struct and TV_struct, disabling it
+    puts the original functions back."""
+    for par, op, label in _codec_trace_entries:
+        fn = getattr(par[op], 'untraced', par[op])
+        par[op] = _traced(label, fn) if enabled else fn
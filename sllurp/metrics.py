@@ -0,0 +1,294 @@
+"""Counters and histograms of what each LLRPClient is doing.
+
+Every LLRPClient keeps a ClientMetrics (unless created with metrics=False);
+an LLRPClientFactory keeps one per reader across reconnections.  They count:
+
+    connects            connections made to the reader
+    bytes, messages     received and sent, by message type
+    decode seconds      per message type, for messages whose body was
+                        decoded by the time the client had handled them
+    callback seconds    time spent in the message callbacks, by message type
+                        (not counted for callbacks run through a
+                        DispatchQueue)
+    request seconds     round-trip time of each request, from sending it to
+                        receiving the *_RESPONSE or ERROR_MESSAGE with its
+                        message ID, by request type
+    tags per report     TagReportData entries per decoded RO_ACCESS_REPORT
+    state seconds       time spent in each STATE_*
+    transitions         state changes, by old and new state
+    transition seconds  time spent changing to each state, including the
+                        state callbacks
+
+factory.getMetrics() returns a snapshot of them as plain dicts, and
+render_prometheus() formats them in the Prometheus text format.  To serve
+them over HTTP:
+
+    from sllurp.metrics import listen
+    listen(factory, 9100)    # http://localhost:9100/metrics
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+
+from twisted.internet import reactor
+from twisted.web import resource, server
+
+from llrp_framer import msg_header
+from llrp_proto import TLV_struct, TLV_Type2Name
+from util import BITMASK
+
+# seconds
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+TAG_BUCKETS = (1, 10, 100, 1000, 10000)
+
+# messages the reader answers with a *_RESPONSE
+REQUESTS = frozenset(name for name in TLV_struct
+                     if name + '_RESPONSE' in TLV_struct)
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """count, sum, and cumulative counts per upper bound."""
+        cumulative = []
+        total = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            cumulative.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+def histogram_for(histograms, key, buckets=TIME_BUCKETS):
+    hist = histograms.get(key)
+    if hist is None:
+        hist = histograms[key] = Histogram(buckets)
+    return hist
+
+
+class ClientMetrics(object):
+    def __init__(self, clock=reactor, state_names=None):
+        """Time spent in states and on requests is measured with clock;
+        state_names maps state numbers to the names to report them
+        under."""
+        self.clock = clock
+        self.state_names = state_names or {}
+
+        self.connects = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.messages_received = defaultdict(int)
+        self.messages_sent = defaultdict(int)
+        self.tags = 0
+        self.tags_per_report = Histogram(TAG_BUCKETS)
+        # message or request type -> Histogram
+        self.decode_seconds = {}
+        self.callback_seconds = {}
+        self.request_seconds = {}
+        # state number -> seconds spent in it, not counting the current
+        # stay in self.state
+        self.state_seconds = defaultdict(float)
+        # (old state, new state) -> number of changes
+        self.transitions = defaultdict(int)
+        self.transition_seconds = {}
+        self.state = None
+        self._state_since = None
+        # message ID -> (request type, time it was sent) of the requests
+        # still waiting for a response
+        self._requests = {}
+
+    def received(self, lmsg, nbytes):
+        """Count lmsg, a message of nbytes bytes the client has handled."""
+        name = lmsg.getName()
+        self.bytes_received += nbytes
+        self.messages_received[name] += 1
+        if lmsg.decode_seconds is not None:
+            histogram_for(self.decode_seconds, name).observe(
+                lmsg.decode_seconds)
+        if name == 'RO_ACCESS_REPORT':
+            if lmsg.decode_seconds is not None and lmsg.msgdict:
+                ntags = len(lmsg.msgdict[name].get('TagReportData', ()))
+                self.tags += ntags
+                self.tags_per_report.observe(ntags)
+        elif name.endswith('_RESPONSE') or name == 'ErrorMessage':
+            request = self._requests.pop(lmsg.msgid, None)
+            if request is not None:
+                request, sent = request
+                histogram_for(self.request_seconds, request).observe(
+                    self.clock.seconds() - sent)
+
+    def sent(self, msgbytes):
+        """Count an encoded message the client sent."""
+        msgtype, _, msgid = msg_header.unpack_from(msgbytes)
+        name = TLV_Type2Name.get(msgtype & BITMASK(10), str(msgtype))
+        self.bytes_sent += len(msgbytes)
+        self.messages_sent[name] += 1
+        if name in REQUESTS:
+            self._requests[msgid] = (name, self.clock.seconds())
+
+    def callbacks(self, msg_name, seconds):
+        histogram_for(self.callback_seconds, msg_name).observe(seconds)
+
+    def connected(self):
+        self.connects += 1
+        # responses to requests sent over an earlier connection never come
+        self._requests.clear()
+
+    def entered(self, state):
+        now = self.clock.seconds()
+        if self.state is not None:
+            self.state_seconds[self.state] += now - self._state_since
+        self.state = state
+        self._state_since = now
+
+    def transitioned(self, oldstate, newstate, seconds):
+        """Count a state change that took seconds, callbacks included."""
+        self.transitions[oldstate, newstate] += 1
+        histogram_for(self.transition_seconds, newstate).observe(seconds)
+
+    def snapshot(self):
+        state_seconds = dict(self.state_seconds)
+        if self.state is not None:
+            state_seconds[self.state] = state_seconds.get(self.state, 0) + \
+                self.clock.seconds() - self._state_since
+        name = self.state_names.get
+        return {
+            'connects': self.connects,
+            'reconnects': max(self.connects - 1, 0),
+            'bytes_received': self.bytes_received,
+            'bytes_sent': self.bytes_sent,
+            'messages_received': dict(self.messages_received),
+            'messages_sent': dict(self.messages_sent),
+            'tags': self.tags,
+            'tags_per_report': self.tags_per_report.snapshot(),
+            'decode_seconds': dict((k, h.snapshot()) for k, h in
+                                   self.decode_seconds.items()),
+            'callback_seconds': dict((k, h.snapshot()) for k, h in
+                                     self.callback_seconds.items()),
+            'request_seconds': dict((k, h.snapshot()) for k, h in
+                                    self.request_seconds.items()),
+            'state': name(self.state, self.state),
+            'state_seconds': dict((name(k, k), v) for k, v in
+                                  state_seconds.items()),
+            'transitions': dict(((name(old, old), name(new, new)), n)
+                                for (old, new), n in
+                                self.transitions.items()),
+            'transition_seconds': dict((name(k, k), h.snapshot()) for k, h in
+                                       self.transition_seconds.items()),
+        }
+
+
+# snapshot key -> (metric name, type, help, label of the dict keys, or
+# labels of their items if the keys are tuples)
+PROMETHEUS_METRICS = (
+    ('connects', 'sllurp_connects_total', 'counter',
+     'Connections made to the reader', None),
+    ('reconnects', 'sllurp_reconnects_total', 'counter',
+     'Connections made to the reader after the first', None),
+    ('bytes_received', 'sllurp_received_bytes_total', 'counter',
+     'Bytes of LLRP messages received', None),
+    ('bytes_sent', 'sllurp_sent_bytes_total', 'counter',
+     'Bytes of LLRP messages sent', None),
+    ('messages_received', 'sllurp_received_messages_total', 'counter',
+     'LLRP messages received', 'type'),
+    ('messages_sent', 'sllurp_sent_messages_total', 'counter',
+     'LLRP messages sent', 'type'),
+    ('tags', 'sllurp_tags_total', 'counter',
+     'TagReportData entries received', None),
+    ('tags_per_report', 'sllurp_tags_per_report', 'histogram',
+     'TagReportData entries per RO_ACCESS_REPORT', None),
+    ('decode_seconds', 'sllurp_decode_seconds', 'histogram',
+     'Time spent decoding message bodies', 'type'),
+    ('callback_seconds', 'sllurp_callback_seconds', 'histogram',
+     'Time spent in message callbacks', 'type'),
+    ('request_seconds', 'sllurp_request_seconds', 'histogram',
+     'Time from sending a request to receiving its response', 'request'),
+    ('state_seconds', 'sllurp_state_seconds_total', 'counter',
+     'Time spent in each client state', 'state'),
+    ('transitions', 'sllurp_state_transitions_total', 'counter',
+     'Client state changes', ('from', 'to')),
+    ('transition_seconds', 'sllurp_transition_seconds', 'histogram',
+     'Time spent changing state, including state callbacks', 'state'),
+)
+
+
+def format_labels(labels):
+    return '{' + ','.join('{}="{}"'.format(
+        k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(snapshots):
+    """Format snapshots, a dict of reader name -> ClientMetrics snapshot
+    (as returned by LLRPClientFactory.getMetrics), in the Prometheus text
+    exposition format."""
+    lines = []
+    for key, metric, kind, text, label in PROMETHEUS_METRICS:
+        lines.append('# HELP {} {}'.format(metric, text))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+        for reader in sorted(snapshots):
+            value = snapshots[reader][key]
+            series = sorted(value.items()) if label else [(None, value)]
+            for labelvalue, val in series:
+                labels = [('reader', reader)]
+                if isinstance(label, tuple):
+                    labels.extend(zip(label, labelvalue))
+                elif label:
+                    labels.append((label, labelvalue))
+                if kind != 'histogram':
+                    lines.append('{}{} {}'.format(
+                        metric, format_labels(labels), format_value(val)))
+                    continue
+                for bound, count in val['buckets']:
+                    lines.append('{}_bucket{} {}'.format(
+                        metric, format_labels(labels +
+                                              [('le', format_value(bound))]),
+                        count))
+                lines.append('{}_sum{} {}'.format(
+                    metric, format_labels(labels), format_value(val['sum'])))
+                lines.append('{}_count{} {}'.format(
+                    metric, format_labels(labels), val['count']))
+    lines.append('# HELP sllurp_state Current client state')
+    lines.append('# TYPE sllurp_state gauge')
+    for reader in sorted(snapshots):
+        lines.append('sllurp_state{} 1'.format(format_labels(
+            [('reader', reader), ('state', snapshots[reader]['state'])])))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(resource.Resource):
+    """twisted.web resource serving the metrics of factory (anything with a
+    getMetrics method) in the Prometheus text format."""
+    isLeaf = True
+
+    def __init__(self, factory):
+        resource.Resource.__init__(self)
+        self.factory = factory
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'text/plain; version=0.0.4')
+        return render_prometheus(self.factory.getMetrics())
+
+
+def listen(factory, port, interface='', reactor=reactor):
+    """Serve factory's metrics over HTTP on port; returns the IListeningPort.
+    """
+    return reactor.listenTCP(port, server.Site(MetricsResource(factory)),
+                             interface=interface)
@@ -0,0 +1,660 @@
+"""A simulated LLRP reader, for testing and load testing without hardware.
+
+The simulator accepts LLRP connections and answers what LLRPClient and the
+command-line tools send: GET_READER_CAPABILITIES, GET/SET_READER_CONFIG,
+ENABLE_EVENTS_AND_REPORTS, the ROSpec and AccessSpec messages and
+CLOSE_CONNECTION.  While a ROSpec runs it streams RO_ACCESS_REPORTs drawn
+from a fixed population of tags, at a set rate, spread over a set number of
+antennas.  A ROSpec with a duration stop trigger ends after that long with an
+End_of_ROSpec event.  While an AccessSpec is enabled, every reported tag
+carries the result of its OpSpec.
+
+Every tag sighting carries the time it was sent as LastSeenTimestampUTC, so a
+client on the same host can measure end-to-end latency.
+
+    python -m sllurp.simulator -P 1000 -n 100 -r 50
+    bin/inventory -p 5084 127.0.0.1
+
+The simulator only reads the few fields of a request it acts on; everything
+else is accepted as is.
+"""
+
+from __future__ import print_function, division
+import argparse
+import logging
+import random
+import struct
+import sys
+
+from twisted.internet import reactor, protocol, task
+
+from sllurp.benchmark import make_tag_report, msg_header, par_header
+from sllurp.llrp import LLRP_PORT
+from sllurp.llrp_framer import LLRPFramer, parameters
+from sllurp.llrp_proto import TLV_Type2Name, TLV_struct, \
+    ConnEvent_Name2Type, Error_Name2Type, ROSpecEvent_Name2Type, \
+    StartTrigger_Name2Type, StopTrigger_Name2Type, Modulation_Name2Type
+
+logger = logging.getLogger(__name__)
+
+args = None
+
+# request type -> response type
+RESPONSE_TYPES = {
+    1: 11,    # GET_READER_CAPABILITIES
+    2: 12,    # GET_READER_CONFIG
+    3: 13,    # SET_READER_CONFIG
+    14: 4,    # CLOSE_CONNECTION
+    20: 30,   # ADD_ROSPEC
+    21: 31,   # DELETE_ROSPEC
+    22: 32,   # START_ROSPEC
+    23: 33,   # STOP_ROSPEC
+    24: 34,   # ENABLE_ROSPEC
+    25: 35,   # DISABLE_ROSPEC
+    40: 50,   # ADD_ACCESSSPEC
+    41: 51,   # DELETE_ACCESSSPEC
+    42: 52,   # ENABLE_ACCESSSPEC
+    43: 53,   # DISABLE_ACCESSSPEC
+}
+
+uint_struct = struct.Struct('!I')
+status_struct = struct.Struct('!HHHH')
+utc_struct = struct.Struct('!HHQ')
+conn_event_struct = struct.Struct('!HHH')
+rospec_event_struct = struct.Struct('!HHBII')
+rospec_struct = TLV_struct['ROSpec']['struct']
+start_trigger_struct = TLV_struct['ROSpecStartTrigger']['struct']
+stop_trigger_struct = TLV_struct['ROSpecStopTrigger']['struct']
+accessspec_struct = TLV_struct['AccessSpec']['struct']
+access_stop_struct = TLV_struct['AccessSpecStopTrigger']['struct']
+opspec_struct = TLV_struct['C1G2Read']['struct']  # also C1G2(Block)Write
+opspec_result_struct = struct.Struct('!HHBH')
+ushort_struct = struct.Struct('!H')
+
+# OpSpec type -> OpSpecResult type
+OPSPEC_RESULTS = {
+    TLV_struct['C1G2Read']['type']: TLV_struct['C1G2ReadOpSpecResult']['type'],
+    TLV_struct['C1G2Write']['type']:
+        TLV_struct['C1G2WriteOpSpecResult']['type'],
+    TLV_struct['C1G2Lock']['type']: TLV_struct['C1G2LockOpSpecResult']['type'],
+    TLV_struct['C1G2BlockWrite']['type']:
+        TLV_struct['C1G2BlockWriteOpSpecResult']['type'],
+}
+
+# the most reports sent in one go, however far behind the schedule is
+MAX_BURST = 1000
+
+
+def encode_message(msgtype, msgid, body=''):
+    return msg_header.pack((1 << 10) | msgtype, msg_header.size + len(body),
+                           msgid) + body
+
+
+def encode_parameter(partype, body=''):
+    return par_header.pack(partype, par_header.size + len(body)) + body
+
+
+def encode_status(code='Success', description=''):
+    return status_struct.pack(TLV_struct['LLRPStatus']['type'],
+                              status_struct.size + len(description),
+                              Error_Name2Type[code],
+                              len(description)) + description
+
+
+def encode_capabilities(antennas, manufacturer=0, model=0,
+                        firmware='sllurp-simulator'):
+    """The parameters of a GET_READER_CAPABILITIES_RESPONSE after its
+    LLRPStatus."""
+    gdc = struct.pack('!HHIIH', antennas, 0, manufacturer, model,
+                      len(firmware)) + firmware
+    llrpcap = struct.pack('!BBHIIIII', 0, 1, 0, 1, 1, 1, 1, 1)
+
+    # 10 to 30 dBm in steps of 0.25 dB, as indices 1 to 81
+    power = ''.join(
+        encode_parameter(TLV_struct['TransmitPowerLevelTableEntry']['type'],
+                         struct.pack('!HH', i + 1, 1000 + i * 25))
+        for i in xrange(81))
+    modes = ''.join(
+        encode_parameter(TLV_struct['UHFC1G2RFModeTableEntry']['type'],
+                         struct.pack('!IBBBBIIIII', ident, 0, mod, 0, mod,
+                                     160000 * 2 ** mod, 1500, 6250, tari,
+                                     0))
+        for ident, (mod, tari) in enumerate(
+            ((Modulation_Name2Type['FM0'], 6250),
+             (Modulation_Name2Type['FM0'], 12500),
+             (Modulation_Name2Type['M2'], 12500),
+             (Modulation_Name2Type['M4'], 25000),
+             (Modulation_Name2Type['M8'], 25000))))
+    band = encode_parameter(
+        TLV_struct['UHFBandCapabilities']['type'],
+        power + encode_parameter(TLV_struct['UHFRFModeTable']['type'], modes))
+    regcap = struct.pack('!HH', 840, 0) + band
+
+    return (encode_parameter(
+                TLV_struct['GeneralDeviceCapabilities']['type'], gdc) +
+            encode_parameter(TLV_struct['LLRPCapabilities']['type'],
+                             llrpcap) +
+            encode_parameter(TLV_struct['RegulatoryCapabilities']['type'],
+                             regcap))
+
+
+class ROSpec(object):
+    def __init__(self, rospec_id, start_trigger=0, duration=None):
+        self.id = rospec_id
+        self.start_trigger = start_trigger
+        self.duration = duration  # seconds, or None to run until stopped
+        self.enabled = False
+
+    @classmethod
+    def parse(cls, data, offset):
+        """Read the ID and triggers of the ROSpec parameter at offset."""
+        _, length, rospec_id, _, _ = rospec_struct.unpack_from(data, offset)
+        spec = cls(rospec_id)
+        for partype, poff, plen in parameters(
+                data, offset + rospec_struct.size, offset + length):
+            if partype != TLV_struct['ROBoundarySpec']['type']:
+                continue
+            for trig, toff, _ in parameters(data, poff + par_header.size,
+                                            poff + plen):
+                if trig == TLV_struct['ROSpecStartTrigger']['type']:
+                    spec.start_trigger = \
+                        start_trigger_struct.unpack_from(data, toff)[2]
+                elif trig == TLV_struct['ROSpecStopTrigger']['type']:
+                    _, _, stop, msec = stop_trigger_struct.unpack_from(data,
+                                                                       toff)
+                    if stop == StopTrigger_Name2Type['Duration']:
+                        spec.duration = msec / 1000
+        return spec
+
+
+class AccessSpec(object):
+    def __init__(self, accessspec_id, op_type=None, opspec_id=0,
+                 word_count=0, op_count=None):
+        self.id = accessspec_id
+        self.op_type = op_type
+        self.opspec_id = opspec_id
+        self.word_count = word_count
+        self.remaining = op_count  # operations left, or None for no limit
+        self.enabled = False
+
+    @classmethod
+    def parse(cls, data, offset):
+        """Read the ID, stop trigger and first OpSpec of the AccessSpec
+        parameter at offset."""
+        _, length, accessspec_id = accessspec_struct.unpack_from(data,
+                                                                 offset)[:3]
+        spec = cls(accessspec_id)
+        end = offset + length
+        for partype, poff, plen in parameters(
+                data, offset + accessspec_struct.size, end):
+            if partype == TLV_struct['AccessSpecStopTrigger']['type']:
+                _, _, trigger, count = access_stop_struct.unpack_from(data,
+                                                                      poff)
+                if trigger == 1 and count:  # Operation_Count
+                    spec.remaining = count
+            elif partype == TLV_struct['AccessCommand']['type']:
+                for optype, ooff, _ in parameters(
+                        data, poff + par_header.size, poff + plen):
+                    if optype not in OPSPEC_RESULTS:
+                        continue  # the C1G2TagSpec
+                    spec.op_type = optype
+                    spec.opspec_id = ushort_struct.unpack_from(data,
+                                                               ooff + 4)[0]
+                    if optype != TLV_struct['C1G2Lock']['type']:
+                        spec.word_count = opspec_struct.unpack_from(data,
+                                                                    ooff)[-1]
+                    break
+        return spec
+
+    def result(self, epc):
+        """Encode a successful OpSpecResult for one tag."""
+        result_type = OPSPEC_RESULTS[self.op_type]
+        if self.op_type == TLV_struct['C1G2Read']['type']:
+            words = self.word_count or 1
+            data = (epc * (words // 6 + 1))[:words * 2]
+            body = ushort_struct.pack(words) + data
+        elif self.op_type == TLV_struct['C1G2Lock']['type']:
+            body = ''
+        else:
+            body = ushort_struct.pack(self.word_count)
+        return opspec_result_struct.pack(
+            result_type, opspec_result_struct.size + len(body), 0,
+            self.opspec_id) + body
+
+
+class SimulatedReader(protocol.Protocol):
+    """One connection to the simulated reader."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.clock = factory.clock
+        self.rng = random.Random(factory.seed)
+        self.framer = LLRPFramer()
+        self.rospecs = {}      # ROSpecID -> ROSpec
+        self.accessspecs = {}  # AccessSpecID -> AccessSpec
+        self.running = None    # the ROSpec being executed
+        self._next_msgid = 1
+        self._report_loop = None
+        self._report_start = None
+        self._reports_this_run = 0
+        self._rospec_timer = None
+        self._keepalive_loop = None
+        self._disconnect_timer = None
+        self.handlers = {
+            1: self.handle_GET_READER_CAPABILITIES,
+            14: self.handle_CLOSE_CONNECTION,
+            20: self.handle_ADD_ROSPEC,
+            21: self.handle_DELETE_ROSPEC,
+            22: self.handle_START_ROSPEC,
+            23: self.handle_STOP_ROSPEC,
+            24: self.handle_ENABLE_ROSPEC,
+            25: self.handle_DISABLE_ROSPEC,
+            40: self.handle_ADD_ACCESSSPEC,
+            41: self.handle_DELETE_ACCESSSPEC,
+            42: self.handle_ENABLE_ACCESSSPEC,
+            43: self.handle_DISABLE_ACCESSSPEC,
+            62: self.handle_KEEPALIVE,  # only a client would send this
+            64: self.handle_ENABLE_EVENTS_AND_REPORTS,
+            72: self.handle_KEEPALIVE_ACK,
+        }
+
+    def connectionMade(self):
+        factory = self.factory
+        factory.stats['connections'] += 1
+        factory.protocols.add(self)
+        logger.info('client connected')
+        if factory.fragment and hasattr(self.transport, 'setTcpNoDelay'):
+            # write fragments as separate segments
+            self.transport.setTcpNoDelay(True)
+
+        self.sendReaderEvent(encode_parameter(
+            TLV_struct['ConnectionAttemptEvent']['type'],
+            ushort_struct.pack(ConnEvent_Name2Type['Success'])))
+
+        if factory.keepalive:
+            self._keepalive_loop = task.LoopingCall(self.sendKeepalive)
+            self._keepalive_loop.clock = self.clock
+            self._keepalive_loop.start(factory.keepalive, now=False)
+        if factory.disconnect_after:
+            self._disconnect_timer = self.clock.callLater(
+                factory.disconnect_after, self.drop)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        logger.info('client disconnected: %s', reason.getErrorMessage())
+        self.factory.protocols.discard(self)
+        self.stopReports()
+        if self._keepalive_loop is not None:
+            self._keepalive_loop.stop()
+            self._keepalive_loop = None
+        if self._disconnect_timer is not None and \
+                self._disconnect_timer.active():
+            self._disconnect_timer.cancel()
+
+    def drop(self):
+        """Drop the connection the way a reader that went away would."""
+        logger.info('dropping connection')
+        self.factory.stats['disconnects'] += 1
+        abort = getattr(self.transport, 'abortConnection', None)
+        if abort is not None:
+            abort()
+        else:
+            self.transport.loseConnection()
+
+    # sending
+
+    def nextMessageID(self):
+        msgid = self._next_msgid
+        self._next_msgid = msgid % 0xffffffff + 1
+        return msgid
+
+    def write(self, data):
+        """Write data in pieces of factory.fragment bytes, if set."""
+        self.factory.stats['bytes'] += len(data)
+        frag = self.factory.fragment
+        if not frag:
+            self.transport.write(data)
+            return
+        for i in xrange(0, len(data), frag):
+            self.transport.write(data[i:i + frag])
+
+    def sendMessage(self, msgtype, body='', msgid=None):
+        if msgid is None:
+            msgid = self.nextMessageID()
+        self.write(encode_message(msgtype, msgid, body))
+
+    def respond(self, msgtype, msgid, code='Success', description='',
+                body=''):
+        if code != 'Success':
+            logger.info('%s failed: %s', TLV_Type2Name.get(msgtype, msgtype),
+                        description)
+        self.sendMessage(RESPONSE_TYPES[msgtype],
+                         encode_status(code, description) + body, msgid)
+
+    def sendReaderEvent(self, *events):
+        now = int(self.clock.seconds() * 1e6)
+        body = utc_struct.pack(TLV_struct['UTCTimestamp']['type'],
+                               utc_struct.size, now) + ''.join(events)
+        self.sendMessage(
+            TLV_struct['READER_EVENT_NOTIFICATION']['type'],
+            encode_parameter(
+                TLV_struct['ReaderEventNotificationData']['type'], body))
+
+    def sendKeepalive(self):
+        self.factory.stats['keepalives'] += 1
+        self.sendMessage(TLV_struct['KEEPALIVE']['type'])
+
+    # receiving
+
+    def dataReceived(self, data):
+        for msgview in self.framer.feed(data):
+            msg = msgview.tobytes()
+            msgtype, _, msgid = msg_header.unpack_from(msg)
+            msgtype &= 0x3ff
+            logger.debug('received %s (ID %d)',
+                         TLV_Type2Name.get(msgtype, msgtype), msgid)
+            handler = self.handlers.get(msgtype)
+            if handler is not None:
+                handler(msgid, msg)
+            elif msgtype in RESPONSE_TYPES:
+                self.respond(msgtype, msgid)
+            else:
+                self.sendMessage(
+                    TLV_struct['ErrorMessage']['type'],
+                    encode_status('UnsupportedMessage',
+                                  'unsupported message type {}'.format(
+                                      msgtype)),
+                    msgid)
+
+    def handle_GET_READER_CAPABILITIES(self, msgid, msg):
+        self.respond(1, msgid, body=self.factory.capabilities)
+
+    def handle_CLOSE_CONNECTION(self, msgid, msg):
+        self.stopReports()
+        self.respond(14, msgid)
+        self.transport.loseConnection()
+
+    def handle_ENABLE_EVENTS_AND_REPORTS(self, msgid, msg):
+        pass  # no response
+
+    def handle_KEEPALIVE(self, msgid, msg):
+        self.sendMessage(TLV_struct['KEEPALIVE_ACK']['type'], msgid=msgid)
+
+    def handle_KEEPALIVE_ACK(self, msgid, msg):
+        self.factory.stats['keepalive_acks'] += 1
+
+    def specID(self, msg):
+        return uint_struct.unpack_from(msg, msg_header.size)[0]
+
+    def selectSpecs(self, specs, spec_id):
+        if spec_id == 0:
+            return list(specs.values())
+        return [specs[spec_id]] if spec_id in specs else []
+
+    def handle_ADD_ROSPEC(self, msgid, msg):
+        spec = ROSpec.parse(msg, msg_header.size)
+        if spec.id in self.rospecs:
+            self.respond(20, msgid, 'FieldError',
+                         'ROSpec {} exists'.format(spec.id))
+            return
+        self.rospecs[spec.id] = spec
+        self.respond(20, msgid)
+
+    def handle_DELETE_ROSPEC(self, msgid, msg):
+        spec_id = self.specID(msg)
+        specs = self.selectSpecs(self.rospecs, spec_id)
+        if spec_id and not specs:
+            self.respond(21, msgid, 'FieldError',
+                         'no ROSpec {}'.format(spec_id))
+            return
+        for spec in specs:
+            if spec is self.running:
+                self.stopReports()
+            del self.rospecs[spec.id]
+        self.respond(21, msgid)
+
+    def handle_ENABLE_ROSPEC(self, msgid, msg):
+        spec_id = self.specID(msg)
+        specs = self.selectSpecs(self.rospecs, spec_id)
+        if not specs:
+            self.respond(24, msgid, 'FieldError',
+                         'no ROSpec {}'.format(spec_id))
+            return
+        self.respond(24, msgid)
+        for spec in specs:
+            spec.enabled = True
+            if spec.start_trigger == StartTrigger_Name2Type['Immediate']:
+                self.startReports(spec)
+
+    def handle_START_ROSPEC(self, msgid, msg):
+        spec = self.rospecs.get(self.specID(msg))
+        if spec is None or not spec.enabled:
+            self.respond(22, msgid, 'FieldError',
+                         'no enabled ROSpec {}'.format(self.specID(msg)))
+            return
+        self.respond(22, msgid)
+        self.startReports(spec)
+
+    def handle_STOP_ROSPEC(self, msgid, msg):
+        if self.running is not None and \
+                self.running.id == self.specID(msg):
+            self.stopReports()
+        self.respond(23, msgid)
+
+    def handle_DISABLE_ROSPEC(self, msgid, msg):
+        for spec in self.selectSpecs(self.rospecs, self.specID(msg)):
+            spec.enabled = False
+            if spec is self.running:
+                self.stopReports()
+        self.respond(25, msgid)
+
+    def handle_ADD_ACCESSSPEC(self, msgid, msg):
+        spec = AccessSpec.parse(msg, msg_header.size)
+        self.accessspecs[spec.id] = spec
+        self.respond(40, msgid)
+
+    def handle_DELETE_ACCESSSPEC(self, msgid, msg):
+        for spec in self.selectSpecs(self.accessspecs, self.specID(msg)):
+            del self.accessspecs[spec.id]
+        self.respond(41, msgid)
+
+    def handle_ENABLE_ACCESSSPEC(self, msgid, msg):
+        specs = self.selectSpecs(self.accessspecs, self.specID(msg))
+        if not specs:
+            self.respond(42, msgid, 'FieldError',
+                         'no AccessSpec {}'.format(self.specID(msg)))
+            return
+        for spec in specs:
+            spec.enabled = True
+        self.respond(42, msgid)
+
+    def handle_DISABLE_ACCESSSPEC(self, msgid, msg):
+        for spec in self.selectSpecs(self.accessspecs, self.specID(msg)):
+            spec.enabled = False
+        self.respond(43, msgid)
+
+    # tag reports
+
+    def startReports(self, spec):
+        if self.running is not None:
+            return
+        logger.info('running ROSpec %d', spec.id)
+        self.running = spec
+        self._report_start = self.clock.seconds()
+        self._reports_this_run = 0
+        rate = self.factory.report_rate
+        self._report_loop = task.LoopingCall(self.sendReports)
+        self._report_loop.clock = self.clock
+        self._report_loop.start(max(1 / rate, 0.01), now=True)
+        if spec.duration:
+            self._rospec_timer = self.clock.callLater(spec.duration,
+                                                      self.endROSpec)
+
+    def stopReports(self):
+        if self._report_loop is not None:
+            self._report_loop.stop()
+            self._report_loop = None
+        if self._rospec_timer is not None and self._rospec_timer.active():
+            self._rospec_timer.cancel()
+        self._rospec_timer = None
+        self.running = None
+
+    def endROSpec(self):
+        spec = self.running
+        self._rospec_timer = None
+        self.stopReports()
+        logger.info('ROSpec %d ended', spec.id)
+        self.sendReaderEvent(rospec_event_struct.pack(
+            TLV_struct['ROSpecEvent']['type'], rospec_event_struct.size,
+            ROSpecEvent_Name2Type['End_of_ROSpec'], spec.id, 0))
+
+    def sendReports(self):
+        """Catch up with the report schedule."""
+        elapsed = self.clock.seconds() - self._report_start
+        due = int(elapsed * self.factory.report_rate) + 1 - \
+            self._reports_this_run
+        for _ in xrange(min(due, MAX_BURST)):
+            self.sendReport()
+
+    def sendReport(self):
+        factory = self.factory
+        rng = self.rng
+        population = factory.population
+        n = factory.tags_per_report
+        if n <= len(population):
+            epcs = rng.sample(population, n)
+        else:
+            epcs = [rng.choice(population) for _ in xrange(n)]
+        access = next((spec for spec in self.accessspecs.values()
+                       if spec.enabled and spec.op_type), None)
+        now = int(self.clock.seconds() * 1e6)
+
+        tags = []
+        for epc in epcs:
+            tag = make_tag_report(epc,
+                                  antenna=rng.randint(1, factory.antennas),
+                                  rssi=rng.randint(-80, -30), timestamp=now)
+            if access is not None:
+                result = access.result(epc)
+                tag = par_header.pack(TLV_struct['TagReportData']['type'],
+                                      len(tag) + len(result)) + \
+                    tag[par_header.size:] + result
+                if access.remaining is not None:
+                    access.remaining -= 1
+                    if access.remaining <= 0:
+                        del self.accessspecs[access.id]
+                        access = None
+            tags.append(tag)
+
+        self.sendMessage(TLV_struct['RO_ACCESS_REPORT']['type'],
+                         ''.join(tags))
+        self._reports_this_run += 1
+        factory.stats['reports'] += 1
+        factory.stats['tags'] += n
+
+
+class ReaderSimulatorFactory(protocol.ServerFactory):
+    def __init__(self, population=100, tags_per_report=10, report_rate=10.0,
+                 antennas=4, keepalive=None, fragment=None,
+                 disconnect_after=None, seed=0, clock=reactor):
+        """Simulate a reader with antennas antennas that sees population
+        distinct tags.  While a ROSpec runs, it sends report_rate
+        RO_ACCESS_REPORTs per second of tags_per_report tag sightings each.
+        With keepalive (seconds), it sends KEEPALIVEs that often.  With
+        fragment (bytes), every message is written in pieces of at most that
+        many bytes.  With disconnect_after (seconds), each connection is
+        dropped that long after it was made."""
+        self.tags_per_report = tags_per_report
+        self.report_rate = report_rate
+        self.antennas = antennas
+        self.keepalive = keepalive
+        self.fragment = fragment
+        self.disconnect_after = disconnect_after
+        self.seed = seed
+        self.clock = clock
+
+        rng = random.Random(seed)
+        self.population = [struct.pack('!QI', rng.getrandbits(64),
+                                       rng.getrandbits(32))
+                           for _ in xrange(population)]
+        self.capabilities = encode_capabilities(antennas)
+
+        self.protocols = set()
+        self.stats = dict.fromkeys(('connections', 'disconnects', 'reports',
+                                    'tags', 'bytes', 'keepalives',
+                                    'keepalive_acks'), 0)
+
+    def buildProtocol(self, addr):
+        return SimulatedReader(self)
+
+
+def parse_args(argv=None):
+    global args
+    parser = argparse.ArgumentParser(description='Simulated LLRP reader')
+    parser.add_argument('-i', '--interface', default='127.0.0.1',
+                        help='address to listen on (default %(default)s)')
+    parser.add_argument('-p', '--port', default=LLRP_PORT, type=int,
+                        help='port (default %(default)s)')
+    parser.add_argument('-P', '--population', default=100, type=int,
+                        help='number of distinct tags (default %(default)s)')
+    parser.add_argument('-n', '--tags-per-report', default=10, type=int,
+                        help='tag sightings per RO_ACCESS_REPORT (default'
+                        ' %(default)s)')
+    parser.add_argument('-r', '--rate', default=10.0, type=float,
+                        help='RO_ACCESS_REPORTs per second (default'
+                        ' %(default)s)')
+    parser.add_argument('-a', '--antennas', default=4, type=int,
+                        help='number of antennas (default %(default)s)')
+    parser.add_argument('-k', '--keepalive', type=float,
+                        help='send a KEEPALIVE every this many seconds')
+    parser.add_argument('-f', '--fragment', type=int, metavar='BYTES',
+                        help='write messages in pieces of at most BYTES')
+    parser.add_argument('-D', '--disconnect-after', type=float,
+                        metavar='SECONDS',
+                        help='drop each connection after SECONDS')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='random seed (default %(default)s)')
+    parser.add_argument('-s', '--stats', default=5.0, type=float,
+                        metavar='SECONDS',
+                        help='print throughput every SECONDS (default'
+                        ' %(default)s; 0 for never)')
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help='show debugging output')
+    args = parser.parse_args(argv)
+
+
+def print_stats(factory, last):
+    stats = factory.stats
+    now = reactor.seconds()
+    elapsed = now - last['time']
+    print('{} clients, {:.0f} reports/s, {:.0f} tags/s, {:.0f} bytes/s'.format(
+        len(factory.protocols),
+        (stats['reports'] - last['reports']) / elapsed,
+        (stats['tags'] - last['tags']) / elapsed,
+        (stats['bytes'] - last['bytes']) / elapsed))
+    last.update(stats, time=now)
+
+
+def main(argv=None):
+    parse_args(argv)
+    logging.basicConfig(
+        level=args.debug and logging.DEBUG or logging.INFO,
+        format='%(asctime)s %(name)s: %(levelname)s: %(message)s')
+
+    factory = ReaderSimulatorFactory(
+        population=args.population, tags_per_report=args.tags_per_report,
+        report_rate=args.rate, antennas=args.antennas,
+        keepalive=args.keepalive, fragment=args.fragment,
+        disconnect_after=args.disconnect_after, seed=args.seed)
+    reactor.listenTCP(args.port, factory, interface=args.interface)
+    logger.info('simulated reader listening on %s:%d', args.interface,
+                args.port)
+
+    if args.stats:
+        last = dict(factory.stats, time=reactor.seconds())
+        task.LoopingCall(print_stats, factory, last).start(args.stats,
+                                                           now=False)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+"""Spread reader connections over a pool of worker processes.
+
+An LLRPClientFactory drives all of its readers from one reactor, so decoding
+for many readers is bound to a single core.  LLRPSupervisor splits the reader
+hosts among worker processes instead.  Each worker runs its own reactor and
+LLRPClientFactory (this module, run with python -m) and streams decoded
+messages back to the parent.  The parent calls the registered callbacks with
+them, as a factory would.
+
+Parent and workers talk over the workers' stdin and stdout.  Each message is a
+pickled tuple like ('pause', 10) framed as a netstring.  A worker logs to its
+stderr, which the parent passes through to its own.
+"""
+
+from __future__ import print_function
+import cPickle as pickle
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from collections import defaultdict
+
+from twisted.internet import reactor, defer, protocol
+from twisted.protocols.basic import NetstringReceiver
+
+from sllurp.llrp import LLRPClient, LLRPClientFactory, LLRPMessage, LLRP_PORT
+from sllurp.llrp_proto import LLRPMessageDict
+
+logger = logging.getLogger(__name__)
+
+
+class IPCChannel(NetstringReceiver):
+    """Carries pickled tuples between the supervisor and a worker.  A
+    received ('verb', arg, ...) calls handler.do_verb(arg, ...)."""
+    # a report of thousands of tags easily exceeds NetstringReceiver's 99999
+    MAX_LENGTH = 64 * 1024 * 1024
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def send(self, *msg):
+        self.sendString(pickle.dumps(msg, pickle.HIGHEST_PROTOCOL))
+
+    def stringReceived(self, string):
+        msg = pickle.loads(string)
+        try:
+            method = getattr(self.handler, 'do_' + msg[0])
+        except AttributeError:
+            logger.error('ignoring unknown IPC message %s', msg[0])
+            return
+        method(*msg[1:])
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        lost = getattr(self.handler, 'channelLost', None)
+        if lost:
+            lost(reason)
+
+
+class RemoteLLRPMessage(LLRPMessage):
+    """An LLRPMessage decoded in a worker process.  It carries the message
+    dict and header fields but not the original bytes."""
+
+    def __init__(self, msgdict, peername):
+        self.msgdict = LLRPMessageDict(msgdict)
+        self.name = msgdict.keys()[0]
+        body = msgdict[self.name]
+        self.ver = body.get('Ver')
+        self.msgtype = body.get('Type')
+        self.msgid = body.get('ID')
+        self.peername = peername
+
+
+class WorkerProcess(protocol.ProcessProtocol):
+    """The supervisor's end of one worker process."""
+
+    def __init__(self, supervisor, index, hosts):
+        self.supervisor = supervisor
+        self.index = index
+        self.hosts = hosts
+        self.states = {}  # reader host -> state name, as last reported
+        self.ended = defer.Deferred()  # fires when the process exits
+        self.channel = IPCChannel(self)
+
+    def connectionMade(self):
+        self.channel.makeConnection(self.transport)
+        sup = self.supervisor
+        self.channel.send('config', self.hosts, sup.port, sup.client_args,
+                          sorted(sup._message_callbacks),
+                          logging.getLogger('sllurp').getEffectiveLevel())
+
+    def outReceived(self, data):
+        self.channel.dataReceived(data)
+
+    def errReceived(self, data):
+        # the worker's log output
+        sys.stderr.write(data)
+
+    def processEnded(self, reason):
+        logger.info('worker %d exited: %s', self.index,
+                    reason.getErrorMessage())
+        self.states = {}
+        self.supervisor.workerEnded(self)
+        self.ended.callback(self.index)
+
+    def do_message(self, peername, msgdict):
+        self.supervisor.messageReceived(RemoteLLRPMessage(msgdict, peername))
+
+    def do_states(self, states):
+        self.states = states
+
+    def do_finished(self):
+        self.states = {}
+
+    def send(self, *msg):
+        if self.ended.called:
+            return
+        self.channel.send(*msg)
+
+
+class LLRPSupervisor(object):
+    def __init__(self, hosts, port=LLRP_PORT, workers=None, onFinish=None,
+                 **kwargs):
+        """Connect to hosts from up to workers processes (default: one per
+        CPU), passing kwargs to each worker's LLRPClientFactory.  kwargs must
+        be picklable, so callbacks are registered with addTagReportCallback()
+        and addMessageCallback() instead.  onFinish fires once every worker
+        has exited."""
+        self.hosts = list(hosts)
+        self.port = port
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.nworkers = max(1, min(workers, len(self.hosts)))
+        self.onFinish = onFinish
+        self.client_args = kwargs
+
+        # message callbacks: msg_name -> [list of callables]
+        self._message_callbacks = defaultdict(list)
+
+        self.workers = []
+
+    def addTagReportCallback(self, cb):
+        self._message_callbacks['RO_ACCESS_REPORT'].append(cb)
+
+    def addMessageCallback(self, msg_type, cb):
+        self._message_callbacks[msg_type].append(cb)
+
+    def start(self):
+        """Spawn the worker processes; hosts are dealt out round-robin."""
+        env = dict(os.environ)
+        pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(
+            p for p in (pkgdir, env.get('PYTHONPATH')) if p)
+        for i in range(self.nworkers):
+            worker = WorkerProcess(self, i, self.hosts[i::self.nworkers])
+            logger.info('starting worker %d for %s', i, worker.hosts)
+            reactor.spawnProcess(worker, sys.executable,
+                                 [sys.executable, '-m', 'sllurp.supervisor'],
+                                 env=env)
+            self.workers.append(worker)
+
+    def messageReceived(self, lmsg):
+        for fn in self._message_callbacks[lmsg.getName()]:
+            fn(lmsg)
+
+    def workerEnded(self, worker):
+        if all(w.ended.called or w is worker for w in self.workers):
+            if self.onFinish and not self.onFinish.called:
+                self.onFinish.callback(None)
+
+    def getProtocolStates(self):
+        states = {}
+        for worker in self.workers:
+            states.update(worker.states)
+        logger.info('states: %s', states)
+        return states
+
+    def pauseInventory(self, seconds=0):
+        for worker in self.workers:
+            worker.send('pause', seconds)
+
+    def resumeInventory(self):
+        for worker in self.workers:
+            worker.send('resume')
+
+    def politeShutdown(self):
+        """Stop inventory on all readers and wait for the workers to exit."""
+        for worker in self.workers:
+            worker.send('shutdown')
+        return defer.DeferredList([w.ended for w in self.workers])
+
+
+class WorkerFactory(LLRPClientFactory):
+    """An LLRPClientFactory that reports its readers' states to the
+    supervisor whenever one changes, and tells the worker to finish once
+    none of its readers is connected or still being tried."""
+
+    def __init__(self, worker, **kwargs):
+        LLRPClientFactory.__init__(self, **kwargs)
+        self.worker = worker
+        self.connectors = set()
+
+    def startedConnecting(self, connector):
+        LLRPClientFactory.startedConnecting(self, connector)
+        self.connectors.add(connector)
+
+    def buildProtocol(self, addr):
+        proto = LLRPClientFactory.buildProtocol(self, addr)
+        for _, st_num in LLRPClient.getStates():
+            proto.addStateCallback(st_num, self.worker.sendStates)
+        return proto
+
+    def clientConnectionLost(self, connector, reason):
+        LLRPClientFactory.clientConnectionLost(self, connector, reason)
+        self.worker.sendStates()
+        self.connectorDone(connector)
+
+    def clientConnectionFailed(self, connector, reason):
+        LLRPClientFactory.clientConnectionFailed(self, connector, reason)
+        self.connectorDone(connector)
+
+    def connectorDone(self, connector):
+        if self.reconnect:
+            return
+        self.connectors.discard(connector)
+        if not self.connectors and not self.protocols:
+            self.worker.finish()
+
+
+class Worker(object):
+    """The worker process's end: runs an LLRPClientFactory for the hosts the
+    supervisor assigns to it."""
+
+    def __init__(self):
+        self.channel = IPCChannel(self)
+        self.factory = None
+        self.connected = True  # whether the supervisor is still listening
+        self.finishing = False
+
+    def do_config(self, hosts, port, client_args, message_types, loglevel):
+        logging.basicConfig(
+            level=loglevel,
+            format='%(asctime)s worker[{}] %(name)s: %(levelname)s:'
+            ' %(message)s'.format(os.getpid()))
+
+        self.factory = WorkerFactory(self, **client_args)
+        for msg_type in message_types:
+            self.factory.addMessageCallback(msg_type, self.forward)
+        for host in hosts:
+            reactor.connectTCP(host, port, self.factory, timeout=3)
+
+    def do_pause(self, seconds):
+        self.factory.pauseInventory(seconds)
+
+    def do_resume(self):
+        self.factory.resumeInventory()
+
+    def do_shutdown(self):
+        self.shutdown()
+
+    def channelLost(self, reason):
+        self.connected = False
+        if self.finishing:
+            if reactor.running:
+                reactor.stop()
+        else:
+            # the supervisor has gone away
+            self.shutdown()
+
+    def shutdown(self):
+        if self.factory is None:
+            self.finish()
+            return
+        self.factory.politeShutdown()
+        # readers that are not connected will not be retried or waited for
+        for connector in list(self.factory.connectors):
+            if connector.state == 'connecting':
+                connector.stopConnecting()
+            elif connector.state == 'disconnected':
+                self.factory.connectors.discard(connector)
+        if not self.factory.connectors and not self.factory.protocols:
+            self.finish()
+
+    def stopping(self):
+        """Stop inventory on the readers before the reactor stops, however
+        it is stopped."""
+        if self.factory is not None and self.factory.protocols:
+            return self.factory.politeShutdown()
+
+    def send(self, *msg):
+        if self.connected and not self.finishing:
+            self.channel.send(*msg)
+
+    def forward(self, lmsg):
+        self.send('message', lmsg.peername, lmsg.msgdict)
+
+    def sendStates(self, *args):
+        self.send('states', {
+            str(proto.peername[0]): LLRPClient.getStateName(proto.state)
+            for proto in self.factory.protocols})
+
+    def finish(self, *args):
+        if self.finishing:
+            return
+        if self.connected:
+            self.send('finished')
+            self.finishing = True
+            # channelLost() stops the reactor once the pipe is flushed
+            self.channel.transport.loseConnection()
+        else:
+            self.finishing = True
+            if reactor.running:
+                reactor.stop()
+
+
+def worker_main():
+    from twisted.internet import stdio
+    # Ctrl-C reaches the whole process group.  The supervisor turns it into
+    # a 'shutdown' message; stopping the reactor right away would leave the
+    # readers inventorying.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = Worker()
+    stdio.StandardIO(worker.channel)
+    reactor.addSystemEventTrigger('before', 'shutdown', worker.stopping)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    worker_main()
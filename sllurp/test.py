@@ -4,8 +4,41 @@ import sllurp
 import sllurp.llrp
 import sllurp.llrp_proto
 import sllurp.llrp_errors
+import sllurp.llrp_framer
+import sllurp.benchmark
+import sllurp.decode
+import sllurp.supervisor
+import sllurp.aggregator
+import sllurp.simulator
+import sllurp.dispatch
+import sllurp.capture
+import sllurp.metrics
+try:
+    import sllurp.llrp_asyncio
+except ImportError:  # neither asyncio nor trollius
+    asyncio = None
+else:
+    asyncio = sllurp.llrp_asyncio.asyncio
+import struct
 import binascii
+import json
 import logging
+import os
+import pickle
+import Queue
+import shutil
+import signal
+import socket
+import StringIO
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from twisted.internet import defer, task
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+from twisted.web.test.requesthelper import DummyRequest
 
 logLevel = logging.WARNING
 logging.basicConfig(level=logLevel,
@@ -45,8 +78,9 @@ class mock_conn (object):
     stream = None
     def __init__ (self, mybytes):
         self.stream = mock_stream(mybytes)
+        self.written = []
     def write (self, mybytes):
-        pass
+        self.written.append(mybytes)
 
 class FauxClient (object):
     def __init__ (self):
@@ -71,6 +105,38 @@ class TestReaderEventNotification (unittest.TestCase):
         client.transport = mock_conn('')
         client.dataReceived(data)
 
+class TestCodecTrace (unittest.TestCase):
+    class ListHandler (logging.Handler):
+        def __init__ (self):
+            logging.Handler.__init__(self)
+            self.messages = []
+        def emit (self, record):
+            self.messages.append(record.getMessage())
+    def setUp (self):
+        self.handler = self.ListHandler()
+        self.log = logging.getLogger('sllurp.llrp_proto')
+        self.log.addHandler(self.handler)
+        self.log.setLevel(logging.DEBUG)
+    def tearDown (self):
+        sllurp.llrp_proto.set_codec_trace(False)
+        self.log.removeHandler(self.handler)
+        self.log.setLevel(logging.NOTSET)
+    def test_trace (self):
+        decoder = sllurp.llrp_proto.TLV_struct['READER_EVENT_NOTIFICATION']\
+            ['decode']
+        data = binascii.unhexlify('00f600160080000c0004f8535baadaff01000006'
+                                  '0000')
+        sllurp.llrp_proto.set_codec_trace(True)
+        sllurp.llrp.LLRPMessage(msgbytes=binascii.unhexlify('043f00000020'
+                                                           '0ab288c9') + data)
+        self.assertIn('decode TLV READER_EVENT_NOTIFICATION',
+                      self.handler.messages)
+        self.assertIn('decode TLV ConnectionAttemptEvent',
+                      self.handler.messages)
+        sllurp.llrp_proto.set_codec_trace(False)
+        self.assertIs(sllurp.llrp_proto.TLV_struct['READER_EVENT_NOTIFICATION']
+                      ['decode'], decoder)
+
 class TestDecodeROAccessReport (unittest.TestCase):
     _r = """
     043d0000002c4095892f00f000228d3005fb63ac1f3841ec88046781000186ce820004ec2ea8
@@ -146,9 +212,1268 @@ class TestDecodeROAccessReport (unittest.TestCase):
         self._client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
         self._client.dataReceived(self._binr)
         self.assertEqual(self._tags_seen, 45)
+    def test_fragmented(self):
+        """Same bytes, delivered in awkwardly-sized chunks."""
+        self._client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        for i in range(0, len(self._binr), 7):
+            self._client.dataReceived(self._binr[i:i+7])
+        self.assertEqual(self._tags_seen, 45)
+        self.assertEqual(len(self._client.framer), 0)
+    def decode_all (self, selector):
+        tag_decoder = sllurp.llrp_proto.TagReportDataDecoder(selector)
+        decoders = {'RO_ACCESS_REPORT': lambda body:
+                    sllurp.llrp_proto.decode_ROAccessReport(body, tag_decoder)}
+        framer = sllurp.llrp_framer.LLRPFramer()
+        for view in framer.feed(self._binr):
+            msgbytes = view.tobytes()
+            generic = sllurp.llrp.LLRPMessage(msgbytes=msgbytes)
+            compiled = sllurp.llrp.LLRPMessage(msgbytes=msgbytes,
+                                               decoders=decoders)
+            self.assertEqual(compiled.msgdict, generic.msgdict)
+        return tag_decoder
+    def test_compiled_tag_decoder(self):
+        tag_decoder = self.decode_all({'EnableAntennaID': True,
+                                       'EnablePeakRRSI': True,
+                                       'EnableFirstSeenTimestamp': True,
+                                       'EnableTagSeenCount': True})
+        # one report carries an EPCData parameter instead of an EPC-96
+        self.assertEqual(tag_decoder.fast_hits, 44)
+        self.assertEqual(tag_decoder.fallbacks, 1)
+    def test_columnar(self):
+        tag_decoder = sllurp.llrp_proto.TagReportDataDecoder({
+            'EnableAntennaID': True,
+            'EnablePeakRRSI': True,
+            'EnableFirstSeenTimestamp': True,
+            'EnableTagSeenCount': True})
+        framer = sllurp.llrp_framer.LLRPFramer()
+        for view in framer.feed(self._binr):
+            body = view.tobytes()[10:]
+            tags = sllurp.llrp_proto.decode_ROAccessReport(body)\
+                ['TagReportData']
+            for dec in (None, tag_decoder):
+                batch = sllurp.llrp_proto.TagReportBatch.from_report(body, dec)
+                self.assertEqual(len(batch), len(tags))
+                self.assertEqual(list(batch), tags)
+                self.assertEqual(list(batch.column('TagSeenCount')),
+                                 [t['TagSeenCount'][0] for t in tags])
+                for i, tag in enumerate(tags):
+                    epc = tag.get('EPC-96') or tag['EPCData']['EPC']
+                    self.assertEqual(binascii.hexlify(batch.epc(i)), epc)
+        self.assertEqual(batch.column('ChannelIndex'), None)
+        self.assertEqual(batch[-1], tags[-1])
+    def test_columnar_extras(self):
+        """Fast-path fields without a column are kept per tag."""
+        selector = {'EnableROSpecID': True, 'EnableAntennaID': True}
+        tag = struct.Struct('!HH' 'B12s' 'BI' 'BH')
+        body = ''.join(tag.pack(240, tag.size, 0x8d, 'x' * 12, 0x89, 7,
+                                0x81, i) for i in range(3))
+        tag_decoder = sllurp.llrp_proto.TagReportDataDecoder(selector)
+        batch = sllurp.llrp_proto.TagReportBatch.from_report(body,
+                                                             tag_decoder)
+        self.assertEqual(tag_decoder.fast_hits, 3)
+        self.assertEqual(list(batch), sllurp.llrp_proto.decode_ROAccessReport(
+            body)['TagReportData'])
+        self.assertEqual(list(batch.column('AntennaID')), [0, 1, 2])
+    def test_columnar_client(self):
+        batches = []
+        client = sllurp.llrp.LLRPClient(self, start_inventory=False,
+                                        columnar_reports=True)
+        client.transport = mock_conn('')
+        client.addMessageCallback('RO_ACCESS_REPORT', lambda msg:
+            batches.append(msg.msgdict['RO_ACCESS_REPORT']['TagReportData']))
+        client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        client.dataReceived(self._binr)
+        self.assertEqual(len(batches), 45)
+        self.assertTrue(all(isinstance(b, sllurp.llrp_proto.TagReportBatch)
+                            for b in batches))
+        self.assertEqual(sum(tag['TagSeenCount'][0] for b in batches
+                             for tag in b), 45)
+    def test_lazy_message(self):
+        calls = []
+        def decoder(body):
+            calls.append(body)
+            return sllurp.llrp_proto.decode_ROAccessReport(body)
+        msgbytes = sllurp.llrp_framer.LLRPFramer().feed(self._binr)\
+            .next_message().tobytes()
+        lmsg = sllurp.llrp.LLRPMessage(msgbytes=msgbytes, lazy=True,
+                                       decoders={'RO_ACCESS_REPORT': decoder})
+        self.assertEqual(lmsg.getName(), 'RO_ACCESS_REPORT')
+        self.assertEqual(lmsg.msgid, 0x4095892f)
+        self.assertEqual(calls, [])
+        self.assertEqual(len(lmsg.getParameter('TagReportData')), 1)
+        self.assertEqual(lmsg.msgdict['RO_ACCESS_REPORT']['ID'], 0x4095892f)
+        self.assertEqual(len(calls), 1)
+    def test_lazy_dispatch(self):
+        """Reports outside of INVENTORYING are dropped undecoded."""
+        calls = []
+        client = sllurp.llrp.LLRPClient(self, start_inventory=False)
+        client.transport = mock_conn('')
+        client.decoders['RO_ACCESS_REPORT'] = lambda body: calls.append(body)
+        client.state = sllurp.llrp.LLRPClient.STATE_PAUSED
+        client.dataReceived(self._binr)
+        self.assertEqual(calls, [])
+    def test_render(self):
+        framer = sllurp.llrp_framer.LLRPFramer()
+        msgbytes = framer.feed(self._binr).next_message().tobytes()
+        lmsg = sllurp.llrp.LLRPMessage(msgbytes=msgbytes)
+        xml = StringIO.StringIO()
+        lmsg.writeXML(xml)
+        self.assertEqual(xml.getvalue(), repr(lmsg) + '\n')
+        self.assertTrue(xml.getvalue().startswith(
+            '<RO_ACCESS_REPORT>\n\t<Ver>1</Ver>\n'))
+        out = StringIO.StringIO()
+        lmsg.writeJSON(out)
+        body = msgbytes[10:]
+        batch = {'RO_ACCESS_REPORT':
+                 sllurp.llrp_proto.decode_ROAccessReport_columnar(body)}
+        sllurp.llrp_proto.write_llrp_jsonl(batch, out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        report = json.loads(lines[0])['RO_ACCESS_REPORT']
+        self.assertEqual(report['ID'], 0x4095892f)
+        self.assertEqual(report['TagReportData'][0]['EPC-96'],
+                         '3005fb63ac1f3841ec880467')
+        self.assertEqual(json.loads(lines[1])['RO_ACCESS_REPORT'],
+                         {'TagReportData': report['TagReportData']})
+    def test_render_json_unlisted(self):
+        # Ver, ID and UTCTimestamp are not among the TLV_struct fields
+        msg = {'SET_READER_CONFIG_RESPONSE': {
+            'Ver': 1, 'Type': 13, 'ID': 5,
+            'LLRPStatus': {'StatusCode': 'Success', 'ErrorDescription': '',
+                           'UTCTimestamp': {'Microseconds': 7}}}}
+        rendered = sllurp.llrp_proto.llrp_data2json(msg)
+        self.assertTrue(rendered.startswith(
+            '{"SET_READER_CONFIG_RESPONSE": {"Type": 13, "LLRPStatus": '))
+        self.assertEqual(json.loads(rendered), msg)
+    def test_render_chunks(self):
+        """Large reports are rendered a chunk at a time."""
+        lmsg = sllurp.llrp.LLRPMessage(
+            msgbytes=sllurp.benchmark.make_stream(200, 200))
+        whole = (repr(lmsg) + '\n',
+                 sllurp.llrp_proto.llrp_data2json(lmsg.msgdict))
+        chunk_size = sllurp.llrp_proto.RENDER_CHUNK
+        sllurp.llrp_proto.RENDER_CHUNK = 100
+        try:
+            for render, text in zip((sllurp.llrp_proto.iter_llrp_xml,
+                                     sllurp.llrp_proto.iter_llrp_json),
+                                    whole):
+                chunks = list(render(lmsg.msgdict))
+                self.assertGreater(len(chunks), 10)
+                self.assertEqual(''.join(chunks), text)
+        finally:
+            sllurp.llrp_proto.RENDER_CHUNK = chunk_size
+    def test_compiled_tag_decoder_mismatch(self):
+        tag_decoder = self.decode_all({'EnableAntennaID': True,
+                                       'EnableLastSeenTimestamp': True,
+                                       'EnableTagSeenCount': True})
+        self.assertEqual(tag_decoder.fast_hits, 0)
+        self.assertEqual(tag_decoder.fallbacks, 45)
+    def tearDown (self):
+        pass
+
+class TestLLRPFramer (unittest.TestCase):
+    def msg (self, msgid, body):
+        return struct.pack('!HII', (1 << 10) | 61, 10 + len(body), msgid) + body
+    def setUp (self):
+        self.framer = sllurp.llrp_framer.LLRPFramer()
+    def frames (self, data):
+        return [view.tobytes() for view in self.framer.feed(data)]
+    def test_split_header (self):
+        m = self.msg(1, 'abcd')
+        self.assertEqual(self.frames(m[:4]), [])
+        self.assertEqual(self.framer.peek_header(), None)
+        self.assertEqual(self.frames(m[4:9]), [])
+        self.assertEqual(self.frames(m[9:]), [m])
+        self.assertEqual(len(self.framer), 0)
+    def test_split_body (self):
+        m = self.msg(2, 'x' * 100)
+        self.assertEqual(self.frames(m[:10]), [])
+        self.assertEqual(self.framer.peek_header()[1:], (110, 2))
+        self.assertEqual(self.frames(m[10:50]), [])
+        self.assertEqual(self.frames(m[50:]), [m])
+    def test_many_in_one_chunk (self):
+        msgs = [self.msg(i, randhex(2 * (i % 13))) for i in range(500)]
+        data = ''.join(msgs)
+        tail = self.msg(500, 'tail')
+        self.assertEqual(self.frames(data + tail[:3]), msgs)
+        self.assertEqual(len(self.framer), 3)
+        self.assertEqual(self.frames(tail[3:]), [tail])
+    def test_views_survive_feed (self):
+        m1 = self.msg(1, 'one')
+        m2 = self.msg(2, 'two')
+        held = list(self.framer.feed(m1 + m2[:5]))
+        self.assertEqual(self.frames(m2[5:]), [m2])
+        self.assertEqual(held[0].tobytes(), m1)
+    def test_bad_length (self):
+        self.framer.feed(struct.pack('!HII', 61, 4, 0))
+        self.assertRaises(sllurp.llrp_errors.LLRPError, self.framer.next_message)
+
+class mock_connector (object):
+    class dest (object):
+        host = 'reader'
+        port = 5084
+    def __init__ (self):
+        self.attempts = 0
+    def getDestination (self):
+        return self.dest
+    def connect (self):
+        self.attempts += 1
+
+class TestReconnect (unittest.TestCase):
+    def setUp (self):
+        self.clock = task.Clock()
+        self.factory = sllurp.llrp.LLRPClientFactory(reconnect=True,
+                                                     reconnect_jitter=0,
+                                                     max_reconnect_delay=3,
+                                                     clock=self.clock)
+        self.connector = mock_connector()
+    def fail (self):
+        self.factory.clientConnectionFailed(self.connector,
+                                            Failure(Exception('refused')))
+    def test_backoff (self):
+        self.fail()
+        state = self.factory.getReconnectStates()['reader:5084']
+        self.assertEqual(state['delay'], 1)
+        self.assertEqual(state['attempts'], 1)
+        self.assertEqual(state['last_error'], 'refused')
+        self.clock.advance(0.5)
+        self.assertEqual(self.connector.attempts, 0)
+        self.clock.advance(0.5)
+        self.assertEqual(self.connector.attempts, 1)
+        for delay in (2, 3, 3):
+            self.fail()
+            self.assertEqual(self.clock.getDelayedCalls()[0].getTime() -
+                             self.clock.seconds(), delay)
+            self.clock.advance(delay)
+        self.assertEqual(self.connector.attempts, 4)
+    def test_reset (self):
+        self.fail()
+        self.clock.advance(1)
+        self.fail()
+        self.factory.resetDelay(self.connector)
+        state = self.factory.getReconnectStates()['reader:5084']
+        self.assertEqual(state['attempts'], 0)
+        self.assertTrue(state['pending'])
+    def test_stop_trying (self):
+        self.fail()
+        self.factory.stopTrying()
+        self.assertFalse(self.clock.getDelayedCalls())
+        self.clock.advance(10)
+        self.assertEqual(self.connector.attempts, 0)
+
+class TestStates (unittest.TestCase):
+    def setUp (self):
+        self.client = sllurp.llrp.LLRPClient(self, start_inventory=False,
+                                             clock=task.Clock())
+        self.seen = []
+        for _, state in sllurp.llrp.LLRPClient.getStates():
+            self.client.addStateCallback(state, self.seen.append)
+    def test_names (self):
+        LLRPClient = sllurp.llrp.LLRPClient
+        self.assertEqual(len(list(LLRPClient.getStates())), 14)
+        self.assertEqual(LLRPClient.STATE_INVENTORYING, 6)
+        self.assertEqual(LLRPClient.getStateName(6), 'STATE_INVENTORYING')
+        self.assertEqual(repr(LLRPClient.STATE_PAUSED), 'STATE_PAUSED')
+        self.assertEqual(pickle.loads(pickle.dumps(LLRPClient.STATE_PAUSED))
+                         .name, 'STATE_PAUSED')
+        self.assertRaises(sllurp.llrp_errors.LLRPError,
+                          LLRPClient.getStateName, 99)
+        self.assertRaises(sllurp.llrp_errors.LLRPError,
+                          self.client.setState, 99)
+        for state, nextstates in LLRPClient.TRANSITIONS.items():
+            self.assertIn(state, nextstates)
+            self.assertIn(LLRPClient.STATE_SENT_DELETE_ACCESSSPEC, nextstates)
+    def test_transitions (self):
+        LLRPClient = sllurp.llrp.LLRPClient
+        self.client.setState(3)
+        self.assertIs(self.client.state, LLRPClient.STATE_CONNECTED)
+        self.client.setState(LLRPClient.STATE_SENT_GET_CAPABILITIES)
+        # not in TRANSITIONS, but it happens all the same
+        self.client.setState(LLRPClient.STATE_INVENTORYING)
+        self.assertEqual(self.seen, [self.client] * 3)
+        snap = self.client.metrics.snapshot()
+        self.assertEqual(snap['transitions'], {
+            ('STATE_DISCONNECTED', 'STATE_CONNECTED'): 1,
+            ('STATE_CONNECTED', 'STATE_SENT_GET_CAPABILITIES'): 1,
+            ('STATE_SENT_GET_CAPABILITIES', 'STATE_INVENTORYING'): 1})
+        self.assertEqual(
+            snap['transition_seconds']['STATE_INVENTORYING']['count'], 1)
+
+class TestStateMachine (unittest.TestCase):
+    def setUp (self):
+        self.client = sllurp.llrp.LLRPClient(self, start_inventory=False,
+                                             clock=task.Clock())
+        self.client.transport = mock_conn('')
+        self.results = []
+    def receive (self, name, code='Success'):
+        msgtype = sllurp.llrp_proto.TLV_struct[name]['type']
+        self.client.dataReceived(sllurp.simulator.encode_message(
+            msgtype, 1, sllurp.simulator.encode_status(code)))
+    def expect (self, name):
+        d = defer.Deferred()
+        d.addCallbacks(lambda _: self.results.append(True),
+                       lambda _: self.results.append(False))
+        self.client._deferreds[name].append(d)
+    def test_expected (self):
+        LLRPClient = sllurp.llrp.LLRPClient
+        self.client.setState(LLRPClient.STATE_SENT_DELETE_ACCESSSPEC)
+        self.client.setState(LLRPClient.STATE_SENT_DELETE_ROSPEC)
+        self.expect('DELETE_ROSPEC_RESPONSE')
+        self.receive('DELETE_ROSPEC_RESPONSE')
+        self.assertEqual(self.results, [True])
+        self.assertEqual(self.client.state, LLRPClient.STATE_CONNECTED)
+    def test_failure (self):
+        self.client.setState(sllurp.llrp.LLRPClient.STATE_SENT_ADD_ROSPEC)
+        self.expect('ADD_ROSPEC_RESPONSE')
+        self.receive('ADD_ROSPEC_RESPONSE', 'FieldError')
+        # left waiting
+        self.assertEqual(self.results, [])
+        self.client.setState(sllurp.llrp.LLRPClient.STATE_PAUSING)
+        self.expect('DISABLE_ROSPEC_RESPONSE')
+        self.receive('DISABLE_ROSPEC_RESPONSE', 'FieldError')
+        self.assertEqual(self.results, [False])
+    def test_unexpected (self):
+        LLRPClient = sllurp.llrp.LLRPClient
+        # dropped
+        self.client.setState(LLRPClient.STATE_SENT_ADD_ROSPEC)
+        self.expect('ENABLE_ROSPEC_RESPONSE')
+        self.receive('ENABLE_ROSPEC_RESPONSE')
+        self.assertEqual(self.results, [])
+        # handled as the response the state waits for
+        self.client.setState(LLRPClient.STATE_SENT_ENABLE_ROSPEC)
+        self.receive('START_ROSPEC_RESPONSE')
+        self.assertEqual(self.results, [])
+        self.receive('ENABLE_ROSPEC_RESPONSE')
+        self.assertEqual(self.results, [True])
+        # no handlers at all
+        self.client.setState(LLRPClient.STATE_PAUSED)
+        self.expect('ENABLE_ROSPEC_RESPONSE')
+        self.receive('ENABLE_ROSPEC_RESPONSE')
+        self.assertEqual(self.results, [True])
+    def test_table (self):
+        LLRPClient = sllurp.llrp.LLRPClient
+        for (state, name), spec in LLRPClient.MESSAGE_HANDLERS.items():
+            self.assertIn(state, LLRPClient.STATES)
+            self.assertIn(name, sllurp.llrp_proto.TLV_struct)
+            self.assertTrue(callable(getattr(LLRPClient, spec[0])))
+        for state, (_, name) in LLRPClient.UNEXPECTED_MESSAGES.items():
+            if name is not None:
+                self.assertIn((state, name), LLRPClient.MESSAGE_HANDLERS)
+
+class TestRequests (unittest.TestCase):
+    def setUp (self):
+        self.clock = task.Clock()
+        self.client = sllurp.llrp.LLRPClient(self, start_inventory=False,
+                                             pipeline=True, clock=self.clock)
+        self.client.transport = mock_conn('')
+        self.client.reader_mode = {'ModeIdentifier': 2, 'MaxTari': 7250}
+    def sent (self):
+        framer = sllurp.llrp_framer.LLRPFramer()
+        for data in self.client.transport.written:
+            framer.feed(data)
+        return [struct.unpack('!HII', view.tobytes()[:10]) for view in framer]
+    def respond (self, msgtype, msgid, status=0):
+        body = struct.pack('!HHHH', 287, 8, status, 0)  # LLRPStatus
+        self.client.dataReceived(struct.pack('!HII', (1 << 10) | msgtype,
+                                             10 + len(body), msgid) + body)
+    def test_pipelined_inventory (self):
+        done = []
+        self.client.startInventory().addCallback(done.append)
+        sent = self.sent()
+        self.assertEqual([t & 0x3ff for t, _, _ in sent], [20, 24, 22])
+        ids = [msgid for _, _, msgid in sent]
+        self.assertEqual(len(set(ids)), 3)
+        # responses are matched by ID, whatever order they arrive in
+        self.respond(32, ids[2])
+        self.respond(30, ids[0])
+        self.assertEqual(done, [])
+        self.respond(34, ids[1])
+        self.assertEqual(len(done), 1)
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_INVENTORYING)
+        self.assertFalse(self.client._pending)
+    def test_failure_status (self):
+        errors = []
+        d = self.client.sendRequest({'ENABLE_ROSPEC': {
+            'Ver': 1, 'Type': 24, 'ROSpecID': 1}})
+        d.addErrback(errors.append)
+        msgid = self.sent()[0][2]
+        self.respond(30, msgid)  # wrong response type: not ours
+        self.assertEqual(errors, [])
+        self.respond(34, msgid, status=100)
+        errors[0].trap(sllurp.llrp_errors.LLRPResponseError)
+    def test_timeout (self):
+        errors = []
+        d = self.client.sendRequest({'START_ROSPEC': {
+            'Ver': 1, 'Type': 22, 'ROSpecID': 1}}, timeout=5)
+        d.addErrback(errors.append)
+        self.clock.advance(4)
+        self.assertEqual(errors, [])
+        self.clock.advance(1)
+        errors[0].trap(sllurp.llrp_errors.LLRPError)
+        self.assertFalse(self.client._pending)
+        self.respond(32, self.sent()[0][2])  # late response is ignored
+
+class TestAddROSpecBytes (unittest.TestCase):
+    def setUp (self):
+        self.client = sllurp.llrp.LLRPClient(self, start_inventory=False)
+        self.client.reader_mode = {'ModeIdentifier': 2, 'MaxTari': 7250}
+        self.rospec = self.client.getROSpec()['ROSpec']
+    def add_rospec (self, msgid, rospec=None):
+        return {'ADD_ROSPEC': {'Ver': 1, 'Type': 20, 'ID': msgid,
+                               'ROSpecID': 1, 'ROSpec': rospec or self.rospec}}
+    def test_patch_id (self):
+        for msgid in (1, 2, 0xfffffffe):
+            self.assertEqual(
+                self.client.encodeAddROSpec(self.rospec, msgid),
+                sllurp.llrp.LLRPMessage(
+                    msgdict=self.add_rospec(msgid)).msgbytes)
+        cached = self.client._add_rospec
+        self.client.encodeAddROSpec(self.rospec, 3)
+        self.assertIs(self.client._add_rospec, cached)
+    def test_other_rospec (self):
+        self.client.encodeAddROSpec(self.rospec, 1)
+        other = sllurp.llrp_proto.LLRPROSpec(self.client, 1,
+                                             priority=1)['ROSpec']
+        self.assertEqual(self.client.encodeAddROSpec(other, 2),
+                         sllurp.llrp.LLRPMessage(
+                             msgdict=self.add_rospec(2, other)).msgbytes)
+
+class TestBenchmark (unittest.TestCase):
+    def test_synthetic_report (self):
+        rng = random.Random(1)
+        msgbytes = sllurp.benchmark.make_ro_access_report(3, msgid=9, rng=rng)
+        lmsg = sllurp.llrp.LLRPMessage(msgbytes=msgbytes)
+        tags = lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData']
+        self.assertEqual(len(tags), 3)
+        self.assertEqual(len(tags[0]['EPC-96']), 24)
+        self.assertEqual(tags[0]['LastSeenTimestampUTC'], (1500000000000000,))
+    def test_run (self):
+        stream = sllurp.benchmark.make_stream(10, 50)
+        res = sllurp.benchmark.run_benchmark(stream, chunk_size=100, repeat=1)
+        self.assertEqual((res['messages'], res['tags']), (5, 50))
+        self.assertEqual(sllurp.benchmark.compare({'10': res}, {'10': res}),
+                         [])
+
+class TestDecode (unittest.TestCase):
+    def setUp (self):
+        self.stream = sllurp.benchmark.make_stream(10, 50)
+        self.stats = sllurp.decode.DecodeStats()
+    def pcap (self, segments, port=5084):
+        """A pcap of Ethernet/IPv4/TCP packets from the reader carrying
+        segments, a list of (TCP sequence number, payload)."""
+        out = [struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)]
+        for seq, payload in segments:
+            tcp = struct.pack('!HHIIBBHHH', port, 40000, seq, 0, 5 << 4,
+                              0x18, 8192, 0, 0) + payload
+            ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 0, 0,
+                             64, 6, 0, '\x0a\x00\x00\x01',
+                             '\x0a\x00\x00\x02') + tcp
+            frame = '\x00' * 12 + '\x08\x00' + ip
+            out.append(struct.pack('<IIII', 0, 0, len(frame), len(frame)))
+            out.append(frame)
+        return StringIO.StringIO(''.join(out))
+    def decode (self, msgs, output='none', jobs=1):
+        text = []
+        for chunk, stats in sllurp.decode.decode_all(msgs, output, jobs,
+                                                     batch_size=2):
+            text.append(chunk)
+            self.stats.merge(stats)
+        return ''.join(text)
+    def test_raw (self):
+        msgs = sllurp.decode.frame_messages(
+            (self.stream[i:i + 100] for i in range(0, len(self.stream), 100)),
+            self.stats)
+        lines = self.decode(msgs, 'json').splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[4])['RO_ACCESS_REPORT']['ID'], 4)
+        self.assertEqual(self.stats.messages, {'RO_ACCESS_REPORT': 5})
+        self.assertEqual((self.stats.tags, self.stats.bytes),
+                         (50, len(self.stream)))
+        self.assertFalse(self.stats.errors)
+    def test_hex (self):
+        # a report and a half
+        data = self.stream[:len(self.stream) * 3 // 10]
+        f = StringIO.StringIO('# comment\n' + binascii.hexlify(data) + '\n')
+        msgs = sllurp.decode.frame_messages(sllurp.decode.read_hex_lines(f),
+                                            self.stats)
+        self.assertEqual(len(self.decode(msgs)), 0)
+        self.assertEqual(self.stats.messages, {'RO_ACCESS_REPORT': 1})
+        self.assertEqual(self.stats.errors, {'truncated message': 1})
+    def test_pcap (self):
+        data = self.stream
+        seq = 1000
+        segments = []
+        for i in range(0, len(data), 300):
+            segments.append((seq + i, data[i:i + 300]))
+        # a retransmission overlapping the next segment
+        segments.insert(2, (seq + 250, data[250:400]))
+        msgs = sllurp.decode.read_pcap(self.pcap(segments), 5084, self.stats)
+        rows = self.decode(msgs, 'columns').splitlines()
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[0].split('\t')[0], '0')
+        self.assertEqual(len(rows[0].split('\t')),
+                         len(sllurp.decode.COLUMNS))
+        self.assertEqual(self.stats.tags, 50)
+        self.assertFalse(self.stats.errors)
+    def test_selector (self):
+        client, _ = sllurp.benchmark.make_client()
+        add = sllurp.llrp.LLRPMessage(msgdict={'ADD_ROSPEC': {
+            'Ver': 1, 'Type': 20, 'ID': 1, 'ROSpecID': 1,
+            'ROSpec': client.rospec['ROSpec']}}).msgbytes
+        selector = sllurp.decode.rospec_selector(add)
+        self.assertEqual(selector, sllurp.benchmark.TAG_CONTENT_SELECTOR)
+        self.assertEqual(selector, sllurp.decode.parse_selector(
+            'EnableAntennaID,EnablePeakRRSI,EnableLastSeenTimestamp,'
+            'EnableTagSeenCount'))
+        reports = list(sllurp.decode.frame_messages([self.stream],
+                                                    self.stats))
+        msgs = [reports[0], add] + reports[1:]
+        self.assertEqual([sel for _, sel in sllurp.decode.batches(msgs, 2)],
+                         [None, selector, selector])
+        # the ADD_ROSPEC counts even when it is left out
+        self.assertEqual([sel for _, sel in sllurp.decode.batches(
+            msgs, 2, types=['RO_ACCESS_REPORT'])], [None, selector, selector])
+        decoders = sllurp.decode.make_decoders('json', selector)
+        tag_decoder = decoders['RO_ACCESS_REPORT'].keywords['tag_decoder']
+        sllurp.llrp.LLRPMessage(msgbytes=reports[0], decoders=decoders)
+        self.assertEqual(tag_decoder.fast_hits, 10)
+        for output in ('json', 'columns'):
+            self.assertEqual(self.decode(msgs, output),
+                             self.decode(reports, output))
+        # requests are counted but not decoded, and are not errors
+        self.assertEqual(self.stats.messages['ADD_ROSPEC'], 2)
+        self.assertFalse(self.stats.errors)
+    def test_pcap_resync (self):
+        """After a lost segment, decoding picks up at the next message."""
+        report = len(self.stream) // 5
+        segments = [(0, self.stream[:report + 10]),
+                    (report + 50, self.stream[report + 50:report * 2]),
+                    (report * 2, self.stream[report * 2:])]
+        msgs = sllurp.decode.read_pcap(self.pcap(segments), 5084, self.stats)
+        self.decode(msgs)
+        self.assertEqual(self.stats.messages, {'RO_ACCESS_REPORT': 4})
+        self.assertEqual(self.stats.errors, {'missing TCP segment': 1})
+        # other ports are ignored
+        stats = self.stats = sllurp.decode.DecodeStats()
+        self.decode(sllurp.decode.read_pcap(self.pcap(segments, port=80),
+                                            5084, stats))
+        self.assertFalse(stats.messages)
+    def test_jobs (self):
+        msgs = sllurp.decode.frame_messages([self.stream], self.stats)
+        xml = self.decode(msgs, 'xml', jobs=2)
+        self.assertEqual(xml.count('<RO_ACCESS_REPORT>'), 5)
+        self.assertLess(xml.index('<ID>0</ID>'), xml.index('<ID>4</ID>'))
+        self.assertEqual(self.stats.tags, 50)
+
+class mock_worker (object):
+    """The worker process's end of the supervisor's pipes."""
+    def __init__ (self):
+        self.commands = []
+        self.transport = StringTransport()
+        self.channel = sllurp.supervisor.IPCChannel(self)
+        self.channel.makeConnection(self.transport)
+    def do_config (self, *args):
+        self.commands.append(('config',) + args)
+    def do_pause (self, seconds):
+        self.commands.append(('pause', seconds))
+    def do_resume (self):
+        self.commands.append(('resume',))
+    def do_shutdown (self):
+        self.commands.append(('shutdown',))
+
+class TestSupervisor (unittest.TestCase):
+    def setUp (self):
+        self.sup = sllurp.supervisor.LLRPSupervisor(
+            ['r1', 'r2', 'r3'], workers=2, duration=5)
+        self.reports = []
+        self.sup.addTagReportCallback(self.reports.append)
+        self.worker = sllurp.supervisor.WorkerProcess(self.sup, 0, ['r1'])
+        self.sup.workers.append(self.worker)
+        self.transport = StringTransport()
+        self.worker.makeConnection(self.transport)
+        self.child = mock_worker()
+    def received (self):
+        self.child.channel.dataReceived(self.transport.value())
+        self.transport.clear()
+        return self.child.commands
+    def reply (self, *msg):
+        self.child.channel.send(*msg)
+        self.worker.outReceived(self.child.transport.value())
+        self.child.transport.clear()
+    def test_config (self):
+        self.assertEqual(self.sup.nworkers, 2)
+        (verb, hosts, port, client_args, msg_types, _), = self.received()
+        self.assertEqual((verb, hosts, port), ('config', ['r1'], 5084))
+        self.assertEqual(client_args, {'duration': 5})
+        self.assertEqual(msg_types, ['RO_ACCESS_REPORT'])
+    def test_report (self):
+        self.reply('message', ('r1', 5084), {'RO_ACCESS_REPORT': {
+            'Ver': 1, 'Type': 61, 'ID': 3, 'TagReportData': [{}, {}]}})
+        lmsg, = self.reports
+        self.assertEqual(lmsg.getName(), 'RO_ACCESS_REPORT')
+        self.assertEqual(lmsg.msgid, 3)
+        self.assertEqual(lmsg.peername, ('r1', 5084))
+        self.assertEqual(len(lmsg.msgdict['RO_ACCESS_REPORT']
+                             ['TagReportData']), 2)
+    def test_control (self):
+        self.reply('states', {'r1': 'STATE_INVENTORYING'})
+        self.assertEqual(self.sup.getProtocolStates(),
+                         {'r1': 'STATE_INVENTORYING'})
+        self.received()
+        self.sup.pauseInventory(3)
+        self.sup.resumeInventory()
+        d = self.sup.politeShutdown()
+        self.assertEqual(self.received()[1:],
+                         [('pause', 3), ('resume',), ('shutdown',)])
+        self.assertFalse(d.called)
+        self.worker.processEnded(Failure(Exception('exited')))
+        self.assertTrue(d.called)
+        self.assertEqual(self.sup.getProtocolStates(), {})
+    def test_worker_stopping (self):
+        worker = sllurp.supervisor.Worker()
+        self.assertEqual(worker.stopping(), None)
+        class factory (object):
+            protocols = set(['r1'])
+            def politeShutdown (self):
+                return d
+        d = defer.Deferred()
+        worker.factory = factory()
+        self.assertIs(worker.stopping(), d)
+    def test_worker_ignores_sigint (self):
+        """Ctrl-C reaches workers too; they must wait for the supervisor's
+        shutdown to stop their readers politely."""
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        listener.settimeout(10)
+        env = dict(os.environ)
+        pkgdir = os.path.dirname(os.path.dirname(os.path.abspath(
+            sllurp.supervisor.__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(
+            p for p in (pkgdir, env.get('PYTHONPATH')) if p)
+        proc = subprocess.Popen([sys.executable, '-m', 'sllurp.supervisor'],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE, env=env)
+        try:
+            config = pickle.dumps(
+                ('config', ['127.0.0.1'], listener.getsockname()[1],
+                 {'start_inventory': False}, [], logging.WARNING),
+                pickle.HIGHEST_PROTOCOL)
+            proc.stdin.write('%d:%s,' % (len(config), config))
+            proc.stdin.flush()
+            # once the worker connects, its reactor is running
+            conn, _ = listener.accept()
+            proc.send_signal(signal.SIGINT)
+            time.sleep(0.5)
+            self.assertIsNone(proc.poll())
+            conn.close()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            listener.close()
+
+class TestAggregator (unittest.TestCase):
+    def setUp (self):
+        self.clock = task.Clock()
+        self.snapshots = []
+        self.agg = sllurp.aggregator.TagAggregator(
+            onSnapshot=self.snapshots.append, interval=10, max_tags=3,
+            ttl=30, clock=self.clock)
+    def tag (self, epc, antenna=1, rssi=-50, count=1):
+        return {'EPC-96': epc, 'AntennaID': (antenna,), 'PeakRSSI': (rssi,),
+                'TagSeenCount': (count,)}
+    def test_merge (self):
+        self.agg.start()
+        self.agg.addTag(self.tag('aa', rssi=-60, count=2), 'r1')
+        self.clock.advance(1)
+        self.agg.addTag(self.tag('aa', rssi=-40, count=3), 'r1')
+        self.agg.addTag(self.tag('aa', antenna=2))
+        self.clock.advance(9)
+        snap, = self.snapshots
+        self.assertEqual(len(snap), 2)
+        st = [t for t in snap if t['AntennaID'] == 1][0]
+        self.assertEqual((st['TagSeenCount'], st['Sightings']), (5, 2))
+        self.assertEqual((st['PeakRSSIMin'], st['PeakRSSIMax'],
+                          st['PeakRSSIMean']), (-60, -40, -50.0))
+        self.assertEqual((st['FirstSeen'], st['LastSeen']), (0, 1000000))
+        self.clock.advance(10)  # nothing new: no snapshot
+        self.assertEqual(len(self.snapshots), 1)
+    def test_eviction (self):
+        for epc in ('aa', 'bb', 'cc', 'aa', 'dd'):
+            self.agg.addTag(self.tag(epc))
+        self.assertEqual(len(self.agg), 3)
+        self.assertEqual(self.agg.evictions, 1)
+        # bb was least recently seen, but it is still reported
+        self.assertEqual(len(self.agg.flush()), 4)
+        self.clock.advance(20)
+        self.agg.addTag(self.tag('cc'))
+        self.clock.advance(15)
+        self.agg.flush()
+        self.assertEqual(len(self.agg), 1)
+    def test_bounded (self):
+        """Without flushes, evicted tags are handed out in snapshots of
+        their own rather than piling up."""
+        for i in range(10):
+            self.agg.addTag(self.tag('%024x' % i))
+        self.assertEqual((len(self.agg), len(self.agg._dirty)), (3, 3))
+        self.assertEqual([len(snap) for snap in self.snapshots], [3, 3])
+        self.assertEqual(len(self.agg.flush()), 4)
+    def test_ttl_without_flush (self):
+        self.agg.addTag(self.tag('aa'))
+        self.clock.advance(31)
+        self.agg.addTag(self.tag('bb'))
+        self.assertEqual(len(self.agg), 1)
+        self.assertEqual([t['EPC'] for t in self.agg.flush()], ['aa', 'bb'])
+    def test_flush_callback (self):
+        self.agg.addTag(self.tag('aa'))
+        results = []
+        d = defer.succeed('result')
+        d.addCallback(self.agg.flush)
+        d.addCallback(results.append)
+        self.assertEqual(results, ['result'])
+        self.assertEqual(len(self.snapshots), 1)
+    def test_batch (self):
+        tags = [self.tag('%024x' % i, rssi=-i) for i in (1, 2, 1)]
+        batch = sllurp.llrp_proto.TagReportBatch()
+        for tag in tags:
+            batch.append(tag)
+        self.agg.addBatch(batch)
+        agg = sllurp.aggregator.TagAggregator(clock=self.clock)
+        for tag in tags:
+            agg.addTag(tag)
+        self.assertEqual(sorted(self.agg.flush()), sorted(agg.flush()))
+    def test_rospec_event (self):
+        self.agg.addTag(self.tag('aa'))
+        event = struct.pack('!HHBII', 249, 13, 1, 1, 0)
+        stamp = struct.pack('!HHQ', 128, 12, 0)
+        data = struct.pack('!HH', 246, 4 + len(stamp) + len(event)) + \
+            stamp + event
+        lmsg = sllurp.llrp.LLRPMessage(msgbytes=struct.pack(
+            '!HII', (1 << 10) | 63, 10 + len(data), 0) + data)
+        self.agg.readerEventCallback(lmsg)
+        self.assertEqual(len(self.snapshots), 1)
+
+class mock_pipe (object):
+    """One end of an in-memory connection; TestSimulator.pump() delivers
+    what is written to it."""
+    def __init__ (self):
+        self.data = []
+        self.writes = 0
+        self.closed = False
+    def write (self, mybytes):
+        self.data.append(mybytes)
+        self.writes += 1
+    def loseConnection (self):
+        self.closed = True
+    abortConnection = loseConnection
+
+class simulated_session (object):
+    """Connects an LLRPClient to a SimulatedReader through mock_pipes."""
+    def connect (self, client_args={}, **kwargs):
+        self.clock = task.Clock()
+        self.tags = []
+        self.events = []
+        self.sim = sllurp.simulator.ReaderSimulatorFactory(
+            population=20, tags_per_report=5, report_rate=10, antennas=2,
+            clock=self.clock, **kwargs)
+        self.reader = self.sim.buildProtocol(None)
+        self.reader.transport = mock_pipe()
+        factory = sllurp.llrp.LLRPClientFactory(
+            antennas=[1, 2], clock=self.clock, **client_args)
+        factory.addTagReportCallback(
+            lambda lmsg: self.tags.extend(
+                lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData']))
+        factory.addMessageCallback('READER_EVENT_NOTIFICATION',
+                                   self.events.append)
+        self.client = factory.buildProtocol(None)
+        self.client.peername = ('simulator', 5084)
+        self.client.transport = mock_pipe()
+        self.reader.connectionMade()
+        self.pump()
+    def pump (self):
+        while self.reader.transport.data or self.client.transport.data:
+            for src, dst in ((self.reader, self.client),
+                             (self.client, self.reader)):
+                data, src.transport.data = src.transport.data, []
+                for chunk in data:
+                    dst.dataReceived(chunk)
+    def advance (self, seconds, step=0.1):
+        for _ in range(int(round(seconds / step))):
+            self.clock.advance(step)
+            self.pump()
+
+class TestSimulator (simulated_session, unittest.TestCase):
+    def test_inventory (self):
+        self.connect()
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_INVENTORYING)
+        self.assertEqual(self.client.antennas, [1, 2])
+        # a late tick catches up with the schedule
+        self.clock.advance(1)
+        self.pump()
+        self.assertEqual(self.sim.stats['reports'], 11)
+        self.assertEqual(len(self.tags), 55)
+        self.assertTrue(all(tag['AntennaID'][0] in (1, 2)
+                            for tag in self.tags))
+    def test_duration_and_keepalive (self):
+        self.connect(client_args={'duration': 2}, keepalive=1)
+        self.advance(3)
+        self.assertEqual(self.sim.stats['keepalive_acks'], 3)
+        self.assertIsNone(self.reader.running)
+        event = self.events[-1].msgdict['READER_EVENT_NOTIFICATION']\
+            ['ReaderEventNotificationData']['ROSpecEvent']
+        self.assertEqual(event['EventType'], 'End_of_ROSpec')
+        reports = self.sim.stats['reports']
+        self.advance(1)
+        self.assertEqual(self.sim.stats['reports'], reports)
+    def test_access (self):
+        self.connect()
+        self.client.startAccess(readWords={'MB': 3, 'WordPtr': 0,
+                                           'WordCount': 2, 'OpSpecID': 7})
+        self.pump()
+        self.advance(0.2)
+        results = [tag['OpSpecResult'] for tag in self.tags
+                   if 'OpSpecResult' in tag]
+        # the default AccessSpecStopTrigger is after 5 operations
+        self.assertEqual(len(results), 5)
+        self.assertEqual((results[0]['OpSpecID'],
+                          results[0]['ReadDataWordCount'],
+                          len(results[0]['ReadData'])), (7, 2, 4))
+    def test_fragment_and_disconnect (self):
+        self.connect(fragment=7, disconnect_after=5)
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_INVENTORYING)
+        # the client reassembled messages written 7 bytes at a time
+        self.assertTrue(self.reader.transport.writes >=
+                        self.sim.stats['bytes'] / 7.0)
+        self.advance(5.5)
+        self.assertTrue(self.reader.transport.closed)
+        self.assertEqual(self.sim.stats['disconnects'], 1)
+
+class TestCapture (simulated_session, unittest.TestCase):
+    def setUp (self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'session.llrpcap')
+    def tearDown (self):
+        shutil.rmtree(self.tmpdir)
+    def record (self):
+        capture = sllurp.capture.CaptureWriter(self.path)
+        self.connect(client_args={'capture': capture})
+        self.advance(1)
+        capture.close()
+        return capture
+    def replay (self, speed=None, **filters):
+        clock = task.Clock()
+        factory = sllurp.llrp.LLRPClientFactory(antennas=[1, 2], clock=clock)
+        tags = []
+        factory.addTagReportCallback(
+            lambda lmsg: tags.extend(
+                lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData']))
+        client = factory.buildProtocol(None)
+        with sllurp.capture.CaptureReader(self.path) as capture:
+            replay = sllurp.capture.CaptureReplay(capture, client, speed,
+                                                  clock=clock, **filters)
+            done = []
+            replay.start().addCallback(done.append)
+            while not done:
+                clock.advance(0.05)
+        return client, tags, done[0]
+    def test_record (self):
+        capture = self.record()
+        with sllurp.capture.CaptureReader(self.path) as reader:
+            self.assertEqual(len(reader), capture.records + 1)  # + peer
+            self.assertEqual(reader.peers, {0: 'simulator:5084'})
+            stats = reader.stats()
+            self.assertEqual(stats['received']['RO_ACCESS_REPORT'],
+                             self.sim.stats['reports'])
+            self.assertEqual(stats['sent']['ADD_ROSPEC'], 1)
+            reports = list(reader.messages(msg_types=['RO_ACCESS_REPORT']))
+            self.assertEqual(len(reports), self.sim.stats['reports'])
+            self.assertEqual(reports[0].peername, ('simulator', 5084))
+            # seek by time
+            records = list(reader.records(msg_types=['RO_ACCESS_REPORT']))
+            later = list(reader.records(start=0.5,
+                                        msg_types=['RO_ACCESS_REPORT']))
+            self.assertEqual(later, [rec for rec in records
+                                     if rec.timestamp >= 0.5])
+            self.assertTrue(0 < len(later) < len(records))
+    def test_replay (self):
+        self.record()
+        client, tags, replayed = self.replay()
+        self.assertEqual(len(tags), len(self.tags))
+        self.assertEqual(client.state,
+                         sllurp.llrp.LLRPClient.STATE_INVENTORYING)
+        self.assertTrue(client.transport.written > 0)
+        # paced replay takes as long as the session did
+        client, tags, paced = self.replay(speed=1)
+        self.assertEqual((len(tags), paced), (len(self.tags), replayed))
+        with sllurp.capture.CaptureReader(self.path) as reader:
+            self.assertTrue(client.clock.seconds() >= reader.times[-1] > 0.5)
+    def test_recover (self):
+        self.record()
+        with sllurp.capture.CaptureReader(self.path) as reader:
+            count = len(reader)
+        # lose the index and half of the last record
+        os.remove(sllurp.capture.index_path(self.path))
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        with sllurp.capture.CaptureWriter(self.path) as writer:
+            writer.write(struct.pack('!HII', 62, 10, 1), ('simulator', 5084),
+                         1234.5)
+        with sllurp.capture.CaptureReader(self.path) as reader:
+            self.assertEqual(len(reader), count)
+            self.assertEqual(reader.indexed, count)
+            self.assertEqual(reader.record(count - 1).timestamp, 1234.5)
+
+class TestMetrics (simulated_session, unittest.TestCase):
+    def test_snapshot (self):
+        self.connect()
+        self.advance(1)
+        snap = self.client.metrics.snapshot()
+        reports = self.sim.stats['reports']
+        self.assertEqual(snap['messages_received']['RO_ACCESS_REPORT'],
+                         reports)
+        self.assertEqual(snap['bytes_received'], self.sim.stats['bytes'])
+        self.assertEqual(snap['tags'], len(self.tags))
+        self.assertEqual(snap['tags_per_report']['count'], reports)
+        self.assertEqual(snap['decode_seconds']['RO_ACCESS_REPORT']['count'],
+                         reports)
+        self.assertEqual(
+            snap['callback_seconds']['RO_ACCESS_REPORT']['count'], reports)
+        self.assertEqual(snap['request_seconds']['ADD_ROSPEC']['count'], 1)
+        self.assertEqual(snap['messages_sent']['ADD_ROSPEC'], 1)
+        self.assertEqual(snap['state'], 'STATE_INVENTORYING')
+        self.assertEqual(snap['transitions'][
+            'STATE_SENT_START_ROSPEC', 'STATE_INVENTORYING'], 1)
+        self.assertAlmostEqual(sum(snap['state_seconds'].values()),
+                               self.clock.seconds())
+        self.assertTrue(snap['state_seconds']['STATE_INVENTORYING'] > 0.5)
+    def test_request_ids (self):
+        """Responses are matched to requests by message ID."""
+        clock = task.Clock()
+        metrics = sllurp.metrics.ClientMetrics(clock=clock)
+        client, _ = sllurp.benchmark.make_client()
+        for msgid in (1, 2):
+            metrics.sent(sllurp.llrp.LLRPMessage(msgdict={'ADD_ROSPEC': {
+                'Ver': 1, 'Type': 20, 'ID': msgid, 'ROSpecID': 1,
+                'ROSpec': client.rospec['ROSpec']}}).msgbytes)
+            clock.advance(1)
+        body = struct.pack('!HHHH', 287, 8, 0, 0)  # LLRPStatus
+        # ADD_ROSPEC_RESPONSE to the second, ERROR_MESSAGE to the first
+        for msgtype, msgid in ((30, 2), (100, 1)):
+            msgbytes = struct.pack('!HII', (1 << 10) | msgtype,
+                                   10 + len(body), msgid) + body
+            metrics.received(sllurp.llrp.LLRPMessage(msgbytes=msgbytes),
+                             len(msgbytes))
+        hist = metrics.snapshot()['request_seconds']['ADD_ROSPEC']
+        self.assertEqual((hist['count'], hist['sum']), (2, 3))
+        self.assertFalse(metrics._requests)
+    def test_prometheus (self):
+        self.connect()
+        self.advance(0.5)
+        factory = self.client.factory
+        metrics = factory.metricsFor(self.client.peername,
+                                     self.client.metrics)
+        self.assertIs(metrics, self.client.metrics)
+        # a new connection to the same reader carries on counting
+        self.assertIs(factory.metricsFor(
+            self.client.peername, sllurp.metrics.ClientMetrics()), metrics)
+        request = DummyRequest([''])
+        text = sllurp.metrics.MetricsResource(factory).render_GET(request)
+        self.assertIn('sllurp_received_messages_total{reader="simulator:5084"'
+                      ',type="RO_ACCESS_REPORT"} %d' % self.sim.stats['reports'],
+                      text.splitlines())
+        self.assertIn('sllurp_tags_per_report_bucket{reader="simulator:5084",'
+                      'le="+Inf"} %d' % self.sim.stats['reports'],
+                      text.splitlines())
+        self.assertIn('sllurp_state{reader="simulator:5084",'
+                      'state="STATE_INVENTORYING"} 1', text.splitlines())
+
+class mock_producer (object):
+    def __init__ (self):
+        self.paused = False
+    def pauseProducing (self):
+        self.paused = True
+    def resumeProducing (self):
+        self.paused = False
+
+class TestDispatchQueue (unittest.TestCase):
+    def setUp (self):
+        self.seen = []
+        self.pending = []
+        self.callbacks = {'RO_ACCESS_REPORT': [self.slow]}
+    def slow (self, lmsg):
+        self.seen.append(lmsg)
+        d = defer.Deferred()
+        self.pending.append(d)
+        return d
+    def finish (self):
+        while self.pending:
+            self.pending.pop(0).callback(None)
+    def report (self, *epcs, **kwargs):
+        body = kwargs.get('body') or ''.join(
+            sllurp.benchmark.make_tag_report(epc, count=2) for epc in epcs)
+        return sllurp.llrp.LLRPMessage(msgbytes=struct.pack(
+            '!HII', (1 << 10) | 61, 10 + len(body), 0) + body,
+            lazy=kwargs.get('lazy', False))
+    def queue (self, overflow):
+        q = sllurp.dispatch.DispatchQueue(self.callbacks, maxsize=2,
+                                          overflow=overflow)
+        q.producer = mock_producer()
+        return q
+    def test_block (self):
+        q = self.queue('block')
+        for i in range(3):
+            q.put(self.report('a' * 12))
+        # the first report is being delivered, two wait
+        self.assertEqual((len(self.seen), len(q)), (1, 2))
+        self.assertTrue(q.producer.paused)
+        self.finish()
+        self.finish()
+        self.assertEqual(len(self.seen), 3)
+        self.assertFalse(q.producer.paused)
+        self.assertEqual(q.stats()['pauses'], 1)
+    def test_drop_oldest (self):
+        q = self.queue('drop_oldest')
+        reports = [self.report(c * 12) for c in 'abcd']
+        for lmsg in reports:
+            q.put(lmsg)
+        self.finish()
+        self.finish()
+        self.assertEqual(self.seen, [reports[0], reports[2], reports[3]])
+        self.assertEqual((q.dropped, q.dropped_tags), (1, 1))
+    def test_drop_oldest_undecoded (self):
+        q = self.queue('drop_oldest')
+        # a lazy report, and one whose TagReportData is truncated
+        reports = [self.report('a' * 12), self.report('b' * 12, lazy=True),
+                   self.report(body='\x00\xf0\x00\x20xxxx'),
+                   self.report('d' * 12), self.report('e' * 12)]
+        for lmsg in reports:
+            q.put(lmsg)
+        self.assertEqual((q.dropped, q.dropped_tags), (2, 0))
+        self.assertTrue(reports[1]._undecoded)
+        self.assertEqual(len(q), 2)
+    def test_coalesce (self):
+        q = self.queue('coalesce')
+        for epcs in (['a' * 12], ['b' * 12], ['c' * 12], ['c' * 12, 'd' * 12]):
+            q.put(self.report(*epcs))
+        self.finish()
+        self.finish()
+        tags = self.seen[-1].msgdict['RO_ACCESS_REPORT']['TagReportData']
+        self.assertEqual([(tag['EPC-96'], tag['TagSeenCount'][0])
+                          for tag in tags],
+                         [('63' * 12, 4), ('64' * 12, 2)])
+        self.assertEqual((q.coalesced, q.dropped, q.max_depth), (1, 0, 2))
+    def test_coalesce_undecoded (self):
+        """Reports that fail to decode are not merged, either way."""
+        q = self.queue('coalesce')
+        truncated = '\x00\xf0\x00\x20xxxx'
+        reports = [self.report('a' * 12), self.report(body=truncated),
+                   self.report('c' * 12), self.report(body=truncated),
+                   self.report('e' * 12)]
+        for lmsg in reports:
+            q.put(lmsg)
+        self.assertEqual((q.coalesced, q.dropped, len(q)), (0, 2, 2))
+    def test_client (self):
+        client, tags = sllurp.benchmark.make_client()
+        client.dispatch = sllurp.dispatch.DispatchQueue(
+            client._message_callbacks, maxsize=2)
+        client.dataReceived(sllurp.benchmark.make_stream(5, 20))
+        self.assertEqual((tags[0], client.dispatch.delivered), (20, 4))
+
+class mock_reactor (object):
+    """Collects the calls ThreadedDispatcher's threads pass back, for
+    TestThreadedDispatcher to run."""
+    def __init__ (self):
+        self.calls = Queue.Queue()
+    def callFromThread (self, f, *args, **kwargs):
+        self.calls.put((f, args, kwargs))
+    def addSystemEventTrigger (self, *args):
+        pass
+    def run (self, ncalls):
+        for _ in range(ncalls):
+            f, args, kwargs = self.calls.get(timeout=5)
+            f(*args, **kwargs)
+
+class TestThreadedDispatcher (unittest.TestCase):
+    def setUp (self):
+        self.reactor = mock_reactor()
+        self.threads = sllurp.dispatch.ThreadedDispatcher(
+            threads=3, reactor=self.reactor)
+        self.seen = []
+        self.lock = threading.Lock()
     def tearDown (self):
+        self.threads.stop()
+    def record (self, lmsg):
+        time.sleep(0.01)
+        with self.lock:
+            self.seen.append((lmsg.peername, lmsg.msgid,
+                              threading.current_thread().name))
+    def msg (self, reader, msgid):
+        lmsg = sllurp.llrp.LLRPMessage(msgbytes=struct.pack(
+            '!HII', (1 << 10) | 62, 10, msgid))
+        lmsg.peername = (reader, 5084)
+        return lmsg
+    def test_order_per_reader (self):
+        cb = self.threads.wrap(self.record)
+        done = [cb(self.msg(reader, i)) for i in range(3)
+                for reader in ('r1', 'r2')]
+        self.reactor.run(6)
+        self.assertTrue(all(d.called for d in done))
+        for reader in ('r1', 'r2'):
+            self.assertEqual([msgid for peer, msgid, _ in self.seen
+                              if peer[0] == reader], [0, 1, 2])
+        self.assertNotIn(threading.current_thread().name,
+                         [name for _, _, name in self.seen])
+        self.assertEqual(self.threads.stats()['completed'], 6)
+        self.assertEqual(self.threads.stats()['max_backlog'], 2)
+    def test_failure (self):
+        d = self.threads.wrap(lambda lmsg: 1 / 0)(self.msg('r1', 0))
+        self.reactor.run(1)
+        self.assertTrue(d.called)
+        self.assertEqual(self.threads.failed, 1)
+    def test_mixed_callbacks (self):
+        def count (who):
+            def cb (lmsg):
+                undecoded = lmsg._undecoded
+                ntags = len(lmsg.msgdict['RO_ACCESS_REPORT']['TagReportData'])
+                with self.lock:
+                    self.seen.append((who, lmsg.msgid, undecoded, ntags))
+            return cb
+        queue = sllurp.dispatch.DispatchQueue({'RO_ACCESS_REPORT': [
+            self.threads.wrap(count('threaded')), count('plain')]})
+        for n in (1, 2, 3):
+            lmsg = sllurp.llrp.LLRPMessage(
+                msgbytes=sllurp.benchmark.make_ro_access_report(n, msgid=n),
+                lazy=True)
+            lmsg.peername = ('r1', 5084)
+            queue.put(lmsg)
+        self.reactor.run(3)
+        self.assertEqual(sorted(self.seen),
+                         [(who, n, False, n) for who in ('plain', 'threaded')
+                          for n in (1, 2, 3)])
+
+class FakeReader (object):
+    """Just enough of a reader for TestAsyncio: answers requests with the
+    status in self.status (Success by default) and sends whatever the test
+    asks it to."""
+    # request type -> response type
+    responses = {20: 30,  # ADD_ROSPEC
+                 21: 31,  # DELETE_ROSPEC
+                 22: 32,  # START_ROSPEC
+                 24: 34,  # ENABLE_ROSPEC
+                 25: 35,  # DISABLE_ROSPEC
+                 40: 50,  # ADD_ACCESSSPEC
+                 41: 51,  # DELETE_ACCESSSPEC
+                 42: 52}  # ENABLE_ACCESSSPEC
+    def __init__ (self):
+        self.framer = sllurp.llrp_framer.LLRPFramer()
+        self.transport = None
+        self.status = {}  # request name -> status code
+    def connection_made (self, transport):
+        self.transport = transport
+    def data_received (self, data):
+        for view in self.framer.feed(data):
+            msgtype, _, msgid = struct.unpack('!HII', view.tobytes()[:10])
+            resptype = self.responses.get(msgtype & 0x3ff)
+            if resptype is None:
+                continue
+            name = sllurp.llrp_proto.TLV_Type2Name[msgtype & 0x3ff]
+            self.transport.write(sllurp.simulator.encode_message(
+                resptype, msgid, sllurp.simulator.encode_status(
+                    self.status.get(name, 'Success'))))
+    def eof_received (self):
+        pass
+    def connection_lost (self, exc):
         pass
 
+@unittest.skipIf(asyncio is None, 'needs asyncio or trollius')
+class TestAsyncio (unittest.TestCase):
+    def setUp (self):
+        self.loop = asyncio.new_event_loop()
+        self.reader = FakeReader()
+        self.server = self.wait(self.loop.create_server(
+            lambda: self.reader, '127.0.0.1', 0))
+        port = self.server.sockets[0].getsockname()[1]
+        self.client = self.wait(sllurp.llrp_asyncio.connect(
+            '127.0.0.1', port, loop=self.loop, start_inventory=False))
+        self.client.client.reader_mode = {'ModeIdentifier': 2, 'MaxTari': 7250}
+    def tearDown (self):
+        self.server.close()
+        self.loop.close()
+    def wait (self, fut):
+        return self.loop.run_until_complete(fut)
+    def test_reports (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        data = ''.join(sllurp.benchmark.make_ro_access_report(n, msgid=n)
+                       for n in (1, 2, 3))
+        for i in range(0, len(data), 50):
+            self.reader.transport.write(data[i:i+50])
+        for n in (1, 2, 3):
+            lmsg = self.wait(self.client.reports.get())
+            self.assertEqual(lmsg.msgid, n)
+            self.assertEqual(len(lmsg.msgdict['RO_ACCESS_REPORT']
+                                 ['TagReportData']), n)
+        self.reader.transport.close()
+        self.wait(self.client.closed)
+        self.assertEqual(self.wait(self.client.reports.get()), None)
+    def test_pause (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        self.wait(self.client.pause())
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_PAUSED)
+        self.wait(self.client.close())
+    def test_pause_rejected (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        self.reader.status['DISABLE_ROSPEC'] = 'FieldError'
+        self.assertRaises(sllurp.llrp_errors.LLRPResponseError, self.wait,
+                          self.client.pause())
+    def test_start_inventory (self):
+        self.wait(self.client.start_inventory())
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_INVENTORYING)
+    def test_start_inventory_rejected (self):
+        self.reader.status['ADD_ROSPEC'] = 'FieldError'
+        self.assertRaises(sllurp.llrp_errors.LLRPResponseError, self.wait,
+                          self.client.start_inventory())
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_SENT_ADD_ROSPEC)
+    def test_resume (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_PAUSED
+        self.wait(self.client.resume())
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_INVENTORYING)
+    def test_resume_rejected (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_PAUSED
+        self.reader.status['ENABLE_ROSPEC'] = 'FieldError'
+        self.assertRaises(sllurp.llrp_errors.LLRPResponseError, self.wait,
+                          self.client.resume())
+    def test_resume_unstarted_rejected (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_CONNECTED
+        self.reader.status['START_ROSPEC'] = 'FieldError'
+        self.assertRaises(sllurp.llrp_errors.LLRPResponseError, self.wait,
+                          self.client.resume())
+    def test_stop_politely (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        self.wait(self.client.stop_politely())
+        self.assertEqual(self.client.state,
+                         sllurp.llrp.LLRPClient.STATE_CONNECTED)
+        self.reader.status['DELETE_ROSPEC'] = 'FieldError'
+        self.assertRaises(sllurp.llrp_errors.LLRPResponseError, self.wait,
+                          self.client.stop_politely())
+    def test_start_access (self):
+        self.client.client.state = sllurp.llrp.LLRPClient.STATE_INVENTORYING
+        read = {'MB': 3, 'WordPtr': 0, 'WordCount': 2}
+        lmsg = self.wait(self.client.start_access(readWords=read))
+        self.assertEqual(lmsg.getName(), 'ENABLE_ACCESSSPEC_RESPONSE')
+        self.reader.status['ADD_ACCESSSPEC'] = 'FieldError'
+        self.assertRaises(sllurp.llrp_errors.LLRPResponseError, self.wait,
+                          self.client.start_access(readWords=read))
+        self.assertRaises(sllurp.llrp_errors.LLRPError, self.wait,
+                          self.client.start_access())
+
 class TestEncodings (unittest.TestCase):
     tagReportContentSelector = {
         'EnableROSpecID': False,
@@ -178,6 +1503,23 @@ class TestEncodings (unittest.TestCase):
         flags = int(binascii.hexlify(data[4:]), 16) >> 6
         self.assertEqual(flags, 0b0001011110)
 
+    def test_compiled_layouts (self):
+        for registry in (sllurp.llrp_proto.TLV_struct,
+                         sllurp.llrp_proto.TV_struct):
+            for name, par in registry.items():
+                if 'format' not in par:
+                    continue
+                self.assertEqual(par['struct'].format, par['format'])
+                self.assertEqual(par['length'], struct.calcsize(par['format']))
+
+    def test_fixed_length (self):
+        par = {'OpSpecID': 1, 'AccessPassword': 0, 'MB': 3, 'WordPtr': 0,
+               'WordCount': 2}
+        data = sllurp.llrp_proto.encode_C1G2Read(par)
+        self.assertEqual(len(data),
+                         sllurp.llrp_proto.TLV_struct['C1G2Read']['length'])
+        self.assertEqual(int(binascii.hexlify(data[2:4]), 16), len(data))
+
 class TestMessageStruct (unittest.TestCase):
     s = sllurp.llrp_proto.Message_struct
 
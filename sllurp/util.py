@@ -1,4 +1,4 @@
-from inspect import stack
+import sys
 
 def BIT(n):
     return 1 << n
@@ -8,7 +8,7 @@ def BITMASK(n):
 
 def func():
     "Return the current function's name."
-    return stack()[1][3]
+    return sys._getframe(1).f_code.co_name
 
 def reverse_dict(data):
     atad = { }